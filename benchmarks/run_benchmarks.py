@@ -0,0 +1,497 @@
+"""End-to-end benchmarks for the screen_mapper / ai_controller path
+
+Runs every stage between a capture and a click at several resolutions and
+grid sizes and prints the timings as JSON:
+
+    python benchmarks/run_benchmarks.py --resolutions 1080p,4k --runs 20 \\
+        --output bench_output.json
+
+The model is replaced by StubClient, a local stand-in for genai.Client with
+configurable latency, and the mouse by NullMouse, so nothing leaves the
+machine and nothing is clicked. Capture and the Qt/pynput based stages run
+against an Xvfb virtual framebuffer; if Xvfb is not installed those cases
+are reported as skipped.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+import numpy as np
+from PIL import Image
+
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+}
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModels:
+    def __init__(self, latency, answer):
+        self.latency = latency
+        self.answer = answer
+        self.calls = 0
+
+    def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        return StubResponse(self.answer)
+
+
+class StubClient:
+    """Stand-in for genai.Client that answers after a fixed latency"""
+
+    def __init__(self, latency=0.8, answer="ab02"):
+        self.models = StubModels(latency, answer)
+
+
+class NullMouse:
+    """pynput mouse stand-in that records positions instead of clicking"""
+
+    def __init__(self):
+        self.position = (0, 0)
+        self.clicks = 0
+
+    def click(self, button, count=1):
+        self.clicks += count
+
+
+class SyntheticCapture:
+    """Duck-typed CaptureService serving a fixed synthetic frame"""
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def latest(self, timeout=1.0):
+        return self.frame
+
+    def stop(self):
+        pass
+
+
+class VirtualDisplay:
+    """Xvfb server for the duration of a with-block"""
+
+    def __init__(self, width, height, display=":97"):
+        self.width = width
+        self.height = height
+        self.display = display
+        self.process = None
+        self.previous = None
+
+    @staticmethod
+    def available():
+        return shutil.which("Xvfb") is not None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            ["Xvfb", self.display, "-screen", "0", f"{self.width}x{self.height}x24", "-nolisten", "tcp"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.previous = os.environ.get("DISPLAY")
+        os.environ["DISPLAY"] = self.display
+        # Wait for the server socket before anyone connects
+        socket = Path(f"/tmp/.X11-unix/X{self.display.lstrip(':')}")
+        deadline = time.monotonic() + 10
+        while not socket.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait()
+        if self.previous is None:
+            os.environ.pop("DISPLAY", None)
+        else:
+            os.environ["DISPLAY"] = self.previous
+
+
+def measure(fn, runs, warmup=1, setup=None):
+    """Time fn() `runs` times after `warmup` untimed calls; milliseconds
+
+    setup(), if given, runs untimed before every call.
+    """
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        fn()
+    samples = []
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "runs": runs,
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "min_ms": samples[0],
+        "max_ms": samples[-1],
+    }
+
+
+def synthetic_frame(width, height, seed=0):
+    """Deterministic desktop-like BGRA frame: gradient background plus flat windows"""
+    from frame import Frame
+    rng = np.random.default_rng(seed)
+    array = np.empty((height, width, 4), dtype=np.uint8)
+    array[..., 0] = np.linspace(40, 200, width, dtype=np.uint8)[None, :]
+    array[..., 1] = np.linspace(60, 180, height, dtype=np.uint8)[:, None]
+    array[..., 2] = 90
+    array[..., 3] = 255
+    for _ in range(40):
+        x, y = rng.integers(0, width - 50), rng.integers(0, height - 30)
+        w, h = rng.integers(50, width // 3), rng.integers(30, height // 3)
+        array[y:y + h, x:x + w, :3] = rng.integers(0, 256, 3, dtype=np.uint8)
+    return Frame(bytearray(array.tobytes()), width, height)
+
+
+class Suite:
+    def __init__(self, args):
+        self.args = args
+        self.results = []
+        self.workdir = Path(tempfile.mkdtemp(prefix="screen-mapper-bench-"))
+
+    def record(self, name, resolution, grid_size, stats=None, skipped=None, **extra):
+        result = {"name": name, "resolution": resolution, "grid_size": grid_size}
+        if skipped:
+            result["skipped"] = skipped
+        else:
+            result.update(stats)
+        result.update(extra)
+        self.results.append(result)
+        print(f"{name:28s} {resolution:6s} grid {grid_size or '-':<3} "
+              f"{skipped or '%.2f ms (p95 %.2f)' % (stats['p50_ms'], stats['p95_ms'])}",
+              file=sys.stderr)
+
+    def run(self):
+        from PySide6.QtWidgets import QApplication
+        display = None
+        if not os.environ.get("DISPLAY") and not self.args.no_xvfb and VirtualDisplay.available():
+            width = max(RESOLUTIONS[name][0] for name in self.args.resolutions)
+            height = max(RESOLUTIONS[name][1] for name in self.args.resolutions)
+            display = VirtualDisplay(width, height).__enter__()
+        if not os.environ.get("DISPLAY"):
+            os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        self.has_display = bool(os.environ.get("DISPLAY"))
+        self.app = QApplication.instance() or QApplication([])
+
+        # ScreenMapper reads and writes its files in the working directory
+        previous_cwd = os.getcwd()
+        os.chdir(self.workdir)
+        try:
+            self.bench_model()
+            for resolution in self.args.resolutions:
+                width, height = RESOLUTIONS[resolution]
+                frame = synthetic_frame(width, height)
+                self.bench_capture(resolution, width, height)
+                self.bench_memory(resolution, frame)
+                self.bench_session(resolution, frame)
+                for grid_size in self.args.grid_sizes:
+                    self.bench_overlay(resolution, grid_size, frame)
+                    self.bench_conversion(resolution, grid_size, frame)
+                    self.bench_codec(resolution, grid_size, width, height)
+                    self.bench_encode(resolution, grid_size, frame)
+                    self.bench_controller(resolution, grid_size, frame)
+        finally:
+            os.chdir(previous_cwd)
+            if display is not None:
+                display.__exit__(None, None, None)
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+        return {
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "numpy": np.__version__,
+                "display": "xvfb" if display else ("native" if self.has_display else "none"),
+                "model_latency_s": self.args.model_latency,
+                "runs": self.args.runs,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+            "results": self.results,
+        }
+
+    def bench_capture(self, resolution, width, height):
+        if not self.has_display:
+            for name in ("capture_mss", "capture_session", "capture_session_region",
+                         "capture_session_monitors"):
+                self.record(name, resolution, None, skipped="no display")
+            return
+        from mss import mss
+        from capture_service import CaptureSession
+        region = {"left": 0, "top": 0, "width": width, "height": height}
+
+        def fresh_session():
+            # What take_screenshot used to do: a new mss session per capture
+            with mss() as sct:
+                sct.grab(region)
+
+        self.record("capture_mss", resolution, None, measure(fresh_session, self.args.runs))
+
+        session = CaptureSession()
+        self.record("capture_session", resolution, None, measure(
+            lambda: session.grab_region(0, 0, width, height), self.args.runs))
+        self.record("capture_session_region", resolution, None, measure(
+            lambda: session.grab_region(width // 2 - 128, height // 2 - 128, 256, 256),
+            self.args.runs))
+
+        # Every physical monitor, grabbed concurrently
+        monitors = [index for index in session.monitors() if index > 0]
+        self.record("capture_session_monitors", resolution, None, measure(
+            lambda: session.grab_many(monitors), self.args.runs))
+        session.close()
+
+    def bench_model(self):
+        from model_backend import FakeBackend, ModelRequester
+
+        # One call in 25 takes 20x longer, beyond the p95 the hedge waits for
+        def latency(call):
+            return 1.0 if call % 25 == 7 else 0.05
+
+        runs = max(20, self.args.runs * 2)
+        for name, percentile in (("model_request", 0), ("model_request_hedged", 95)):
+            requester = ModelRequester([FakeBackend(latency=latency)], hedge_percentile=percentile,
+                                       hedge_min_delay=0.1)
+            self.record(name, "-", None, measure(lambda: requester.request(["prompt"]), runs),
+                        backends=requester.summary())
+            requester.close()
+
+        # Structured, sloppy and prose answers all parse without another model call
+        from coordinate_prompt import parse_candidates
+        answers = ['{"candidates": [{"cell": "ab02", "confidence": 0.8}, '
+                   '{"cell": "ab03", "confidence": 0.15}, {"cell": "zz99", "confidence": 0.05}]}',
+                   " 'AB02'\n", "The Save button is in cell ab02, next to ab03."]
+        self.record("parse_candidates", "-", 40,
+                    measure(lambda: [parse_candidates(answer, 40) for answer in answers], runs))
+
+    def bench_memory(self, resolution, frame):
+        from visual_memory import VisualMemory
+
+        # A distinctive element remembered at the center, then found in place and moved
+        array = frame.array().copy()
+        x, y = frame.width // 2, frame.height // 2
+        rng = np.random.default_rng(1)
+        array[y - 12:y + 12, x - 40:x + 40, :3] = rng.integers(0, 256, (24, 80, 3), dtype=np.uint8)
+        memory = VisualMemory(self.workdir / f"visual_memory_{resolution}")
+        moved = np.roll(array, (frame.height // 4, frame.width // 4), axis=(0, 1))
+
+        # A hit moves the patch to where it was found, so start each run from the original spot
+        def reset():
+            memory.forget("benchmark button")
+            memory.remember("benchmark button", array, x, y)
+
+        reset()
+        self.record("visual_memory_near", resolution, None, measure(
+            lambda: memory.find("benchmark button", array), self.args.runs))
+        self.record("visual_memory_full", resolution, None, measure(
+            lambda: memory.find("benchmark button", moved), self.args.runs, setup=reset))
+
+    def bench_session(self, resolution, frame):
+        from frame import Frame
+        from session_record import SessionRecorder, SessionReader
+
+        # A window moving over a fixed desktop, as between the actions of a session
+        array = frame.array()
+        frames = []
+        for i in range(12):
+            moved = array.copy()
+            moved[100 + 20 * i:300 + 20 * i, 200:600, :3] = 255 - moved[100:300, 200:600, :3]
+            frames.append(Frame(bytearray(moved.tobytes()), frame.width, frame.height))
+        recorder = SessionRecorder(self.workdir / f"session_{resolution}", keyframe_interval=6)
+        frames_iter = iter(frames * (self.args.runs + 1))
+        # The caller's cost; compression happens on the recorder's thread
+        stats = measure(lambda: recorder.frame(next(frames_iter)), min(self.args.runs, len(frames)))
+        recorder.close()
+        self.record("session_record_frame", resolution, None, stats,
+                    ratio=round(recorder.bytes_out / recorder.bytes_in, 4))
+
+        reader = SessionReader(recorder.directory)
+        rng = np.random.default_rng(2)
+        self.record("session_read_random", resolution, None, measure(
+            lambda: reader.frame(int(rng.integers(len(reader)))), self.args.runs))
+        reader.close()
+
+    def bench_overlay(self, resolution, grid_size, frame):
+        from PySide6.QtGui import QPixmap
+        from grid_overlay import render_grid_overlay
+        from grid_render import GridRenderer
+        from grid_style import GridStyle
+
+        style = GridStyle()
+        runs = max(1, self.args.runs // 4)
+        self.record("overlay_qt_build", resolution, grid_size, measure(
+            lambda: render_grid_overlay(frame.width, frame.height, grid_size, style), runs, 0))
+
+        if self.has_display:
+            from screen_mapper import ScreenMapper
+            mapper = ScreenMapper()
+            mapper.grid_size = grid_size
+            pixmap = QPixmap.fromImage(frame.qimage())
+            self.record("draw_grid_and_markers", resolution, grid_size, measure(
+                lambda: mapper.draw_grid_and_markers(pixmap), self.args.runs))
+            self.record("display_frame", resolution, grid_size, measure(
+                lambda: mapper.display_frame(frame), self.args.runs))
+            # The view paints lazily; grab() forces a paint of the visible tiles
+            mapper.resize(1280, 800)
+            self.record("tiled_view_paint", resolution, grid_size, measure(
+                lambda: mapper.view.viewport().grab(), self.args.runs))
+            mapper.close()
+        else:
+            for name in ("draw_grid_and_markers", "display_frame", "tiled_view_paint"):
+                self.record(name, resolution, grid_size, skipped="no display")
+
+        self.record("render_headless_build", resolution, grid_size, measure(
+            lambda: GridRenderer(grid_size).render_image(frame), runs, 0))
+        renderer = GridRenderer(grid_size)
+        self.record("render_headless", resolution, grid_size, measure(
+            lambda: renderer.render_image(frame), self.args.runs))
+
+    def bench_conversion(self, resolution, grid_size, frame):
+        from io import BytesIO
+        from PySide6.QtCore import QBuffer, QIODevice
+        from PySide6.QtGui import QPixmap
+        from frame import qimage_to_pil
+
+        pixmap = QPixmap.fromImage(frame.qimage())
+
+        def png_round_trip():
+            # The conversion capture_grid_screenshot used to do
+            buffer = QBuffer()
+            buffer.open(QIODevice.WriteOnly)
+            pixmap.save(buffer, "PNG")
+            image = Image.open(BytesIO(buffer.data().data()))
+            image.load()
+            buffer.close()
+
+        self.record("pixmap_png_pil", resolution, grid_size, measure(png_round_trip, self.args.runs))
+        self.record("pixmap_direct_pil", resolution, grid_size, measure(
+            lambda: qimage_to_pil(pixmap.toImage()), self.args.runs))
+
+    def bench_codec(self, resolution, grid_size, width, height):
+        from grid_codec import GridCodec
+
+        codec = GridCodec(width, height, grid_size)
+        labels = [str(label) for label in codec.labels.ravel()]
+
+        def decode_each():
+            for label in labels:
+                codec.center(label)
+
+        self.record("codec_decode_each", resolution, grid_size, measure(decode_each, self.args.runs),
+                    cells=len(labels))
+        label_array = codec.labels.ravel()
+        self.record("codec_decode_batch", resolution, grid_size, measure(
+            lambda: codec.centers_many(label_array), self.args.runs), cells=len(labels))
+        points = np.random.default_rng(0).integers(0, [width, height], size=(10000, 2))
+        self.record("codec_encode_batch", resolution, grid_size, measure(
+            lambda: codec.labels_at_many(points[:, 0], points[:, 1]), self.args.runs), points=10000)
+
+    def bench_encode(self, resolution, grid_size, frame):
+        from grid_render import GridRenderer
+        from upload_encoding import EncodingConfig, encode_image
+
+        image = GridRenderer(grid_size).render_image(frame)
+        for name, config in [("png", EncodingConfig("png")),
+                             ("jpeg", EncodingConfig("jpeg", quality=85)),
+                             ("jpeg_1280", EncodingConfig("jpeg", quality=85, max_long_edge=1280))]:
+            encoded = encode_image(image, config)
+            self.record(f"encode_{name}", resolution, grid_size, measure(
+                lambda: encode_image(image, config), self.args.runs), bytes=encoded.size)
+
+    def bench_controller(self, resolution, grid_size, frame):
+        if not self.has_display:
+            self.record("save_annotated_screenshot", resolution, grid_size, skipped="no display")
+            self.record("execute_action", resolution, grid_size, skipped="no display")
+            self.record("execute_action_prepared", resolution, grid_size, skipped="no display")
+            return
+        from ai_controller import AIController
+        from grid_codec import format_label
+        from response_cache import ResponseCache
+
+        answer = format_label(1, 1, grid_size)
+        client = StubClient(self.args.model_latency, answer)
+        controller = AIController(show_window=False, client=client,
+                                  screenshots_dir=self.workdir / "screenshots")
+        controller.grid_size = grid_size
+        controller.renderer.grid_size = grid_size
+        controller.mouse = NullMouse()
+        controller.capture_services = {controller.target_monitor(): SyntheticCapture(frame)}
+        controller.response_cache = ResponseCache(max_entries=0)  # Always go to the model
+        image = controller.capture_grid_screenshot()
+
+        def save():
+            controller.save_annotated_screenshot(image, answer, "benchmark request")
+            controller.archive.flush()
+
+        self.record("save_annotated_screenshot", resolution, grid_size,
+                    measure(save, self.args.runs))
+        self.record("execute_action", resolution, grid_size, measure(
+            lambda: controller.execute_action("click the benchmark button"),
+            max(1, self.args.runs // 2)))
+
+        # The same request with capture, grid and encoding prepared while "typing"
+        def prepare():
+            controller.speculate()
+            controller.speculator.wait()
+
+        if controller.speculator is not None:
+            self.record("execute_action_prepared", resolution, grid_size, measure(
+                lambda: controller.execute_action("click the benchmark button"),
+                max(1, self.args.runs // 2), setup=prepare))
+        else:
+            self.record("execute_action_prepared", resolution, grid_size,
+                        skipped="SPECULATIVE_PREP=0")
+        controller.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resolutions", default="1080p,1440p,4k",
+                        help="comma separated subset of " + ",".join(RESOLUTIONS))
+    parser.add_argument("--grid-sizes", default="40", help="comma separated grid sizes")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--model-latency", type=float, default=0.8,
+                        help="seconds the stub model takes to answer")
+    parser.add_argument("--no-xvfb", action="store_true",
+                        help="do not start Xvfb; display-bound cases are skipped without DISPLAY")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+    args.resolutions = args.resolutions.split(",")
+    args.grid_sizes = [int(size) for size in args.grid_sizes.split(",")]
+    unknown = [name for name in args.resolutions if name not in RESOLUTIONS]
+    if unknown:
+        parser.error(f"unknown resolutions: {', '.join(unknown)}")
+
+    if args.output:
+        # The suite runs inside a scratch directory
+        args.output = Path(args.output).resolve()
+
+    report = Suite(args).run()
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from input_actions import InputCancelled
+
+# Per-stage timeouts in seconds; None means the stage may run as long as it needs
+DEFAULT_STAGE_TIMEOUTS = {
+    "capture": 5.0,
+    "encode": 10.0,
+    "model": 30.0,
+    "save": 10.0,
+    "click": 5.0,
+    "step": 15.0,
+}
+
+# Stages that move the mouse or type; these are stopped, never abandoned
+INPUT_STAGES = ("click", "step")
+
+
+class ActionCancelled(Exception):
+    """Raised inside a job when it was cancelled before or during a stage"""
+
+
+class StageTimeout(TimeoutError):
+    """Raised when a pipeline stage runs past its timeout"""
+
+
+class ActionSignals(QObject):
+    queued = Signal(str, int)       # request, number of jobs ahead of it
+    progress = Signal(str, str)     # request, message
+    finished = Signal(str, object)    # request, ai_controller.ActionResult
+    failed = Signal(str, str, object)  # request, error message, its Trace or None
+    cancelled = Signal(str)         # request
+
+
+class ActionJob(QRunnable):
+    """One AI request, run stage by stage on a pool thread"""
+
+    def __init__(self, controller, request, signals, stage_timeouts, stage_executor, plan=False):
+        super().__init__()
+        self.controller = controller
+        self.request = request
+        self.plan = plan  # Run as a multi-step plan rather than a single click
+        self.signals = signals
+        self.stage_timeouts = stage_timeouts
+        self.stage_executor = stage_executor
+        self.cancel_event = threading.Event()
+        self.done_event = threading.Event()
+        self.abandoned = []  # Futures of stages given up on that may still be running
+        self.setAutoDelete(False)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        # Whatever the controller records is read here, on this thread, and sent
+        # as a snapshot; the next job may reset it before the slots run
+        metrics = self.controller.metrics
+        previous_trace = metrics.last_trace
+        try:
+            if self.cancel_event.is_set():
+                raise ActionCancelled()
+            if self.plan:
+                value = self.controller.execute_plan(self.request, run_stage=self.run_stage,
+                                                     cancel=self.cancel_event)
+            else:
+                value = self.controller.execute_action(self.request, run_stage=self.run_stage,
+                                                       cancel=self.cancel_event)
+            result = self.controller.action_result("plan" if self.plan else "click", value,
+                                                   self.own_trace(previous_trace))
+            self.signals.finished.emit(self.request, result)
+        except (ActionCancelled, InputCancelled):
+            self.signals.cancelled.emit(self.request)
+        except Exception as e:
+            self.signals.failed.emit(self.request, str(e), self.own_trace(previous_trace))
+        finally:
+            # The pool thread is held until abandoned stages return, so the next
+            # job never runs alongside them (e.g. both writing last_frame)
+            wait(self.abandoned)
+            self.done_event.set()
+
+    def own_trace(self, previous):
+        """This job's finished trace, or None if it failed before opening one"""
+        trace = self.controller.metrics.last_trace
+        return trace if trace is not previous else None
+
+    def run_stage(self, name, fn, *args):
+        """Run one stage, honouring cancellation and the stage's timeout
+
+        Cancellation is checked before the stage starts and while waiting on
+        it. A stage that times out or is cancelled mid-flight cannot be
+        interrupted from Python, so it is abandoned on its worker thread and
+        its result discarded. Input stages are not abandoned: they get the
+        job's cancel event, which is set so they stop before their next
+        click or key, and are waited for.
+        """
+        if self.cancel_event.is_set():
+            raise ActionCancelled()
+        self.signals.progress.emit(self.request, f"{name}...")
+
+        timeout = self.stage_timeouts.get(name)
+        if timeout is None:
+            return fn(*args)
+
+        future = self.stage_executor.submit(fn, *args)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return future.result(timeout=0.05)
+            except FutureTimeout:
+                if self.cancel_event.is_set():
+                    error = ActionCancelled()
+                elif time.monotonic() >= deadline:
+                    error = StageTimeout(f"{name} stage timed out after {timeout:.1f}s")
+                else:
+                    continue
+            if name in INPUT_STAGES:
+                self.cancel_event.set()
+                wait([future])
+            else:
+                self.abandoned.append(future)
+            raise error
+
+
+class ActionPipeline(QObject):
+    """Runs AI requests off the Qt thread, one at a time, in submission order
+
+    Results and progress are reported through `signals`, whose slots run on
+    the thread that owns the receiving widget.
+    """
+
+    def __init__(self, controller, stage_timeouts=None, parent=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.stage_timeouts = dict(DEFAULT_STAGE_TIMEOUTS)
+        if stage_timeouts:
+            self.stage_timeouts.update(stage_timeouts)
+        self.signals = ActionSignals()
+
+        # A single pool thread keeps requests strictly ordered
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+
+        # Stages with a timeout run here so the job thread can stop waiting on them
+        self.stage_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="action-stage")
+        self.jobs = []
+
+    def submit(self, request, plan=False):
+        """Queue a request; returns the job so callers can cancel it
+
+        With plan=True the request is carried out as a multi-step plan.
+        """
+        self.jobs = [job for job in self.jobs if not job.done_event.is_set()]
+        job = ActionJob(self.controller, request, self.signals,
+                        self.stage_timeouts, self.stage_executor, plan)
+        ahead = len(self.jobs)
+        self.jobs.append(job)
+        self.signals.queued.emit(request, ahead)
+        self.pool.start(job)
+        return job
+
+    def pending(self):
+        return sum(1 for job in self.jobs if not job.done_event.is_set())
+
+    def cancel_all(self):
+        """Cancel the running request and everything queued behind it"""
+        for job in self.jobs:
+            job.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.waitForDone()
+        self.stage_executor.shutdown(wait=False)
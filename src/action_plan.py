@@ -0,0 +1,146 @@
+import json
+import re
+import numpy as np
+from grid_codec import grid_dimensions, last_label, parse_label
+
+POINTER_ACTIONS = ("click", "double_click", "right_click", "drag")
+ACTIONS = POINTER_ACTIONS + ("type", "key")
+
+
+class PlanStep:
+    """One action of a plan
+
+    Pointer actions name their target in words and, when the target was
+    visible in the planning screenshot, the cell it was in. drag has a
+    second target and cell for where it ends. type carries text and key a
+    key or combination such as "enter" or "ctrl+s".
+    """
+
+    def __init__(self, action, target=None, cell=None, to_target=None, to_cell=None,
+                 text=None, keys=None):
+        self.action = action
+        self.target = target
+        self.cell = cell
+        self.to_target = to_target
+        self.to_cell = to_cell
+        self.text = text
+        self.keys = keys
+
+    @property
+    def is_pointer(self):
+        return self.action in POINTER_ACTIONS
+
+    def to_json(self):
+        fields = {"action": self.action, "target": self.target, "cell": self.cell,
+                  "to_target": self.to_target, "to_cell": self.to_cell,
+                  "text": self.text, "keys": self.keys}
+        return {key: value for key, value in fields.items() if value is not None}
+
+    def __str__(self):
+        if self.action == "type":
+            return f"type {self.text!r}"
+        if self.action == "key":
+            return f"key {self.keys}"
+        where = f"{self.target} ({self.cell or '?'})"
+        if self.action == "drag":
+            return f"drag {where} to {self.to_target} ({self.to_cell or '?'})"
+        return f"{self.action.replace('_', ' ')} {where}"
+
+
+def build_plan_prompt(user_request, grid_size):
+    """Prompt asking the model for the whole request as an ordered list of actions"""
+    cols, rows = grid_dimensions(grid_size)
+    final_label = last_label(grid_size)
+
+    return f"""
+        I am showing you a screenshot with a {cols}x{rows} coordinate grid overlay.
+        The grid uses coordinates like 'aa01' through '{final_label}'.
+
+        User request: {user_request}
+
+        Break the request into the ordered steps needed to carry it out on this screen.
+        ONLY respond with a JSON array of steps, nothing else. Each step is an object with:
+        - "action": one of "click", "double_click", "right_click", "drag", "type", "key"
+        - "target": for click, double_click, right_click and drag, a short description
+          of the element to act on, e.g. "File menu" or "Export... menu entry"
+        - "cell": the grid coordinate of the target if it is visible in this screenshot,
+          otherwise null (for example for menu entries that only appear after a click)
+        - "to_target" and "to_cell": for drag, the element and coordinate to drag to
+        - "text": for type, the exact text to type
+        - "keys": for key, a key or combination such as "enter", "tab" or "ctrl+s"
+
+        For example:
+        [{{"action": "click", "target": "File menu", "cell": "ab02"}},
+         {{"action": "click", "target": "Export... menu entry", "cell": null}},
+         {{"action": "type", "text": "report.pdf"}},
+         {{"action": "key", "keys": "enter"}}]
+        """
+
+
+def _cell(value, grid_size):
+    """Normalized cell label, or None when the model gave none or an invalid one"""
+    if not isinstance(value, str):
+        return None
+    value = value.strip().lower()
+    return value if parse_label(value, grid_size) is not None else None
+
+
+def parse_plan(text, grid_size):
+    """PlanSteps from a model answer; raises ValueError if it holds no usable plan
+
+    Code fences and text around the JSON array are ignored. Cells that are
+    not labels of this grid are dropped, so those targets are located on
+    the live screen instead.
+    """
+    match = re.search(r"\[.*\]", text, re.DOTALL)
+    if match is None:
+        raise ValueError(f"No action list in answer: {text.strip()[:80]}")
+    try:
+        entries = json.loads(match.group(0))
+    except ValueError as e:
+        raise ValueError(f"Malformed action list: {e}") from e
+
+    steps = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise ValueError(f"Malformed step: {entry!r}")
+        action = str(entry.get("action", "")).strip().lower().replace("-", "_").replace(" ", "_")
+        if action == "doubleclick":
+            action = "double_click"
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action: {action!r}")
+        step = PlanStep(action, target=entry.get("target"), cell=_cell(entry.get("cell"), grid_size),
+                        to_target=entry.get("to_target"),
+                        to_cell=_cell(entry.get("to_cell"), grid_size),
+                        text=entry.get("text"), keys=entry.get("keys"))
+        if step.is_pointer and not (step.target or step.cell):
+            raise ValueError(f"{action} step without a target")
+        if action == "drag" and not (step.to_target or step.to_cell):
+            raise ValueError("drag step without a destination")
+        if action == "type" and not isinstance(step.text, str):
+            raise ValueError("type step without text")
+        if action == "key" and not step.keys:
+            raise ValueError("key step without keys")
+        steps.append(step)
+    if not steps:
+        raise ValueError("Empty action list")
+    return steps
+
+
+def format_plan(steps):
+    """JSON text of a plan that parse_plan reads back, e.g. for the response cache"""
+    return json.dumps([step.to_json() for step in steps])
+
+
+def region_unchanged(before, after, x, y, radius=24, threshold=4.0):
+    """Whether the square around pixel (x, y) looks the same in two BGR(A) frame arrays
+
+    Compares the mean absolute difference per channel. A planned cell is
+    trusted only while its surroundings are still what the model saw.
+    """
+    if before.shape != after.shape:
+        return False
+    top, left = max(0, y - radius), max(0, x - radius)
+    a = before[top:y + radius, left:x + radius, :3].astype(np.int16)
+    b = after[top:y + radius, left:x + radius, :3].astype(np.int16)
+    return a.size > 0 and float(np.abs(a - b).mean()) <= threshold
@@ -1,31 +1,43 @@
+import time
+_IMPORT_START = time.perf_counter()
+
+# Only what the control window needs is imported up front; capture, rendering,
+# the model client and input control load in AIController.warm_up
 import os
-import base64
-from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
-from google import genai
-from google.genai import types
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                            QLineEdit, QPushButton, QLabel, QTextEdit)
-from PySide6.QtCore import Qt, QBuffer, QIODevice, QSize
-from screen_mapper import ScreenMapper
-import json
-import time
+                            QLineEdit, QPushButton, QLabel, QTextEdit, QCheckBox)
+from PySide6.QtCore import Qt, QMetaObject
+from action_pipeline import ActionPipeline
+from metrics import Metrics
+from startup_profile import StartupProfile
+import argparse
+import logging
+import threading
 from dotenv import load_dotenv
 from pathlib import Path
-import datetime
 import sys
 
+_IMPORT_END = time.perf_counter()
+
 class AIControlWindow(QMainWindow):
     def __init__(self, controller):
         super().__init__()
         self.controller = controller
+        self.pipeline = ActionPipeline(controller, parent=self)
         self.initUI()
         
+        signals = self.pipeline.signals
+        signals.queued.connect(self.on_queued)
+        signals.progress.connect(self.on_progress)
+        signals.finished.connect(self.on_finished)
+        signals.failed.connect(self.on_failed)
+        signals.cancelled.connect(self.on_cancelled)
+        
     def initUI(self):
         # Set window properties
         self.setWindowTitle('AI Screen Control')
         self.setWindowFlags(Qt.WindowStaysOnTopHint | Qt.Tool)
-        self.setFixedSize(300, 200)
+        self.setFixedSize(300, 270)
         
         # Create central widget and layout
         central = QWidget()
@@ -39,13 +51,24 @@ class AIControlWindow(QMainWindow):
         # Add input field
         self.input_field = QLineEdit()
         self.input_field.returnPressed.connect(self.execute_action)
+        self.input_field.textEdited.connect(self.on_text_edited)
         layout.addWidget(self.input_field)
         
+        # Add plan mode toggle for requests that take several actions
+        self.plan_checkbox = QCheckBox("Multi-step plan")
+        self.plan_checkbox.setChecked(os.getenv("PLAN_MODE", "0").lower() in ("1", "true", "yes"))
+        layout.addWidget(self.plan_checkbox)
+        
         # Add execute button
         execute_btn = QPushButton("Execute")
         execute_btn.clicked.connect(self.execute_action)
         layout.addWidget(execute_btn)
         
+        # Add cancel button for the running and queued requests
+        cancel_btn = QPushButton("Cancel")
+        cancel_btn.clicked.connect(self.pipeline.cancel_all)
+        layout.addWidget(cancel_btn)
+        
         # Add status display
         self.status_display = QTextEdit()
         self.status_display.setReadOnly(True)
@@ -88,158 +111,856 @@ class AIControlWindow(QMainWindow):
         if not request:
             return
             
-        self.status_display.append(f"\nRequest: {request}")
-        try:
-            coordinate = self.controller.execute_action(request)
-            self.status_display.append(f"✓ Clicked at: {coordinate}")
-        except Exception as e:
-            self.status_display.append(f"✗ Error: {str(e)}")
-            
+        # Requests run in the background; the next one can be typed right away
+        self.pipeline.submit(request, plan=self.plan_checkbox.isChecked())
         self.input_field.clear()
         
+    def on_text_edited(self, text):
+        # Capture, grid and encode the screen while the request is still being typed
+        if text.strip():
+            self.controller.speculate()
+        elif self.controller.speculator is not None:
+            self.controller.speculator.cancel()
+        
+    def on_queued(self, request, ahead):
+        if ahead:
+            self.append_status(f"\nRequest: {request} (queued, {ahead} ahead)")
+        else:
+            self.append_status(f"\nRequest: {request}")
+            
+    def on_progress(self, request, message):
+        self.append_status(f"  {message}")
+        
+    def on_finished(self, request, result):
+        cache = self.controller.response_cache
+        memory = self.controller.visual_memory
+        if result.kind == "plan":
+            self.append_status(f"✓ Ran {len(result.steps)} steps "
+                               f"with {result.plan_calls} model calls")
+            for step in result.steps:
+                self.append_status(f"  {step}")
+            self.append_breakdown(result.trace)
+            return
+        self.append_status(f"✓ Clicked at: {result.value}")
+        if result.cache_hit:
+            self.append_status(f"  cached answer ({cache.hits} hits / {cache.misses} misses)")
+        elif result.memory_match is not None:
+            self.append_status(f"  visual memory: {result.memory_match} "
+                               f"({memory.hits} hits / {memory.misses} misses)")
+        elif result.encoding is not None:
+            prepared = " (prepared while typing)" if result.speculative_hit else ""
+            self.append_status(f"  upload: {result.encoding}{prepared}")
+            if len(result.candidates) > 1:
+                self.append_status(f"  candidates: {', '.join(map(repr, result.candidates))}")
+        self.append_breakdown(result.trace)
+        
+    def on_failed(self, request, error, trace):
+        self.append_status(f"✗ Error: {error}")
+        self.append_breakdown(trace)
+        
+    def append_breakdown(self, trace):
+        """Per-stage milliseconds of one request"""
+        if trace is not None:
+            self.append_status(f"  {trace.breakdown()}")
+        
+    def on_cancelled(self, request):
+        self.append_status(f"✗ Cancelled: {request}")
+        
+    def append_status(self, text):
+        self.status_display.append(text)
+        
         # Scroll to bottom
         scrollbar = self.status_display.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
+        
+    def closeEvent(self, event):
+        self.pipeline.shutdown()
+        super().closeEvent(event)
+
+class ActionResult:
+    """What one request did, taken on its job thread as soon as it finished
+
+    The window reads it on the Qt thread, possibly after the next request
+    has reset the controller's last_* fields, so it keeps its own copies
+    and cannot be changed.
+    """
+
+    __slots__ = ("kind", "value", "steps", "plan_calls", "cache_hit", "memory_match",
+                 "speculative_hit", "encoding", "candidates", "trace")
+
+    def __init__(self, kind, value, steps=(), plan_calls=0, cache_hit=False, memory_match=None,
+                 speculative_hit=False, encoding=None, candidates=(), trace=None):
+        for name, field in (("kind", kind), ("value", value), ("steps", tuple(steps)),
+                            ("plan_calls", plan_calls), ("cache_hit", cache_hit),
+                            ("memory_match", memory_match), ("speculative_hit", speculative_hit),
+                            ("encoding", encoding), ("candidates", tuple(candidates)),
+                            ("trace", trace)):
+            object.__setattr__(self, name, field)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ActionResult is read-only")
+
 
 class AIController:
-    def __init__(self):
+    def __init__(self, show_window=True, client=None, screenshots_dir=None, profile=None,
+                 backends=None, capture=None, mouse=None, keyboard=None, settle=None):
+        self.profile = profile or StartupProfile()
+        
         # Load environment variables
         env_path = Path(__file__).parent.parent / '.env'
         load_dotenv(env_path)
         
-        # Get API key
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in .env file")
-        
-        # Initialize Gemini with new client format
-        self.client = genai.Client(api_key=api_key)
-        
-        # Initialize ScreenMapper
-        self.app = QApplication([])
-        self.screen_mapper = ScreenMapper()
-        
-        # Create screenshots directory if it doesn't exist
-        self.screenshots_dir = Path(__file__).parent.parent / 'screenshots'
-        self.screenshots_dir.mkdir(exist_ok=True)
-        
-        # Create and show control window
-        self.window = AIControlWindow(self)
-        self.window.show()
-        
-        # Hide the main window - we'll just use it for screenshots
-        self.screen_mapper.hide()
+        # Get API key; the client itself is created during warm-up
+        self.api_key = None
+        if client is None and backends is None:
+            self.api_key = os.getenv('GEMINI_API_KEY')
+            if not self.api_key:
+                raise ValueError("GEMINI_API_KEY not found in .env file")
+        self.client = client
+        self.backends = backends  # ModelBackends to use instead of a Gemini client
+        self.model = None
+        
+        # Devices to use instead of the screen, mouse and keyboard (e.g. for replays)
+        self.capture = capture
+        self.mouse = mouse
+        self.keyboard = keyboard
+        self.settle = settle
+        
+        self.grid_size = 40  # 40x40 grid
+        self.last_frame = None  # Frame the latest coordinate refers to
+        self.last_encoding = None  # EncodedImage stats of the latest upload
+        self.last_cache_hit = False
+        self.last_speculative_hit = False
+        self.last_memory_match = None  # visual_memory.Match of the latest action, if any
+        self.last_plan = None  # PlanSteps of the latest plan-mode request
+        self.last_plan_calls = 0  # Model calls it took
+        self.last_candidates = None  # Ranked coordinate_prompt.Candidates of the latest answer
+        self._signature = None  # (CaptureService, frame id, signature) of the latest signed frame
+        
+        # Screenshots are archived in the background, with dedupe and retention
+        self.screenshots_dir = Path(screenshots_dir or Path(__file__).parent.parent / 'screenshots')
+        
+        # Per-stage timings: rolling histograms and a JSONL trace of every action
+        self.metrics = Metrics.from_env(trace_path=self.screenshots_dir / 'traces.jsonl')
+        
+        # Display to capture and act on: an mss monitor index, or "mouse" for the
+        # monitor under the pointer at each request
+        self.monitor_choice = os.getenv("CAPTURE_MONITOR", "1").strip().lower()
+        
+        # Everything else is set up by warm_up; see wait_ready
+        self.capture_services = {}  # {monitor index: CaptureService}
+        self.archive = None
+        self.speculator = None
+        self.visual_memory = None
+        self.recorder = None
+        self.ready = threading.Event()
+        self.warm_up_error = None
+        
+        # Create and show control window before anything heavy loads
+        self.app = None
+        self.window = None
+        if show_window:
+            with self.profile.step("QApplication"):
+                self.app = QApplication.instance() or QApplication([])
+            with self.profile.step("control window"):
+                self.window = AIControlWindow(self)
+                self.window.show()
+            self.profile.mark("window shown")
+            threading.Thread(target=self.warm_up, name="warm-up", daemon=True).start()
+        else:
+            # Headless callers use the controller right away
+            self.warm_up()
+            self.wait_ready()
+        
+    def warm_up(self):
+        """Import and build capture, rendering, input and the model client
+        
+        Runs on a background thread when the window is shown, so the window
+        appears before any of this has loaded. Sets self.ready when done.
+        """
+        step = self.profile.step
+        try:
+            with step("import capture/render"):
+                from capture_service import CaptureService, CaptureSession
+                from grid_render import GridRenderer
+                from settle import SettleDetector
+            with step("import encoding/cache"):
+                from upload_encoding import EncodingConfig
+                from response_cache import ResponseCache
+                from screenshot_archive import ScreenshotArchive
+                from coarse_to_fine import ZoomConfig
+                from speculative import Speculator
+                from visual_memory import VisualMemory
+                from coordinate_prompt import AnswerStats
+                from session_record import (SessionRecorder, RecordingMouse,
+                                            RecordingKeyboard)
+            
+            # Capture and grid rendering are headless; no ScreenMapper window needed
+            with step("capture session"):
+                sizes = []
+                if self.capture is None:
+                    self.capture = CaptureSession.from_env()
+                    indices = ([index for index in self.capture.monitors() if index > 0]
+                               if self.capture.follow_mouse else [self.capture.monitor_index])
+                    
+                    # Physical sizes can differ from the logical geometry (HiDPI)
+                    sizes = [frame.size for frame in self.capture.grab_many(indices).values()]
+                    
+                    # Optional persistent capture thread per candidate monitor (CAPTURE_FPS > 0)
+                    for index in indices:
+                        service = CaptureService.from_env(index)
+                        if service is not None:
+                            self.capture_services[index] = service.start()
+                else:
+                    monitor = self.capture.monitor
+                    sizes = [(monitor["width"], monitor["height"])]
+                if self.settle is None:
+                    self.settle = SettleDetector.from_env()
+            
+            # The overlay for each screen is built now rather than on the first request
+            with step("first overlay"):
+                self.renderer = GridRenderer(self.grid_size)
+                for width, height in set(sizes):
+                    self.renderer.overlay(width, height)
+            
+            with step("configs and caches"):
+                # Upload encoding is chosen per deployment through UPLOAD_* variables
+                self.encoding = EncodingConfig.from_env()
+                
+                # Answers for repeated requests on an unchanged screen are reused locally
+                self.response_cache = ResponseCache.from_env()
+                
+                # Optional two-pass coarse-to-fine resolution
+                self.zoom = ZoomConfig.from_env()
+                
+                self.archive = ScreenshotArchive.from_env(self.screenshots_dir, metrics=self.metrics)
+                
+                # Optional preparation of the upload while the request is typed
+                self.speculator = Speculator.from_env(self.prepare_upload)
+                
+                # Patches around past clicks, matched locally before asking the model
+                self.visual_memory = VisualMemory.from_env(self.screenshots_dir / 'visual_memory')
+                
+                # Optional recording of frames, answers, input and timings (SESSION_RECORD=1)
+                self.recorder = SessionRecorder.from_env(self.screenshots_dir / 'sessions')
+                if self.recorder is not None:
+                    if self.visual_memory is not None:
+                        self.recorder.snapshot("visual_memory", self.visual_memory.directory)
+                    if self.response_cache.path:
+                        self.recorder.snapshot("response_cache.json", self.response_cache.path)
+                    self.metrics.listeners.append(
+                        lambda trace: self.recorder.event("trace", **trace.to_json()))
+                
+                # Ranked candidate cells, requested as schema-constrained JSON where supported
+                self.structured_output = os.getenv("MODEL_STRUCTURED_OUTPUT", "1").lower() not in (
+                    "0", "false", "no")
+                self.answers = AnswerStats()
+            
+            with step("input control"):
+                if self.mouse is None or self.keyboard is None:
+                    from pynput import keyboard, mouse
+                    self.mouse = self.mouse or mouse.Controller()
+                    self.keyboard = self.keyboard or keyboard.Controller()
+                if self.recorder is not None:
+                    self.mouse = RecordingMouse(self.mouse, self.recorder)
+                    self.keyboard = RecordingKeyboard(self.keyboard, self.recorder)
+            
+            with step("model client"):
+                from model_backend import ClientBackend, ModelRequester, configured_model
+                if self.backends is None:
+                    if self.client is None:
+                        from google import genai
+                        
+                        # Initialize Gemini with new client format
+                        self.client = genai.Client(api_key=self.api_key)
+                    self.backends = [ClientBackend(self.client, configured_model())]
+                
+                # Deadlines, retries and hedging around every model call
+                self.model = ModelRequester.from_env(self.backends, metrics=self.metrics)
+                if self.recorder is not None:
+                    self.model.listeners.append(self.recorder.model_call)
+        except Exception as e:
+            self.warm_up_error = e
+            logging.getLogger(__name__).exception("warm-up failed")
+        finally:
+            self.profile.mark("ready")
+            self.ready.set()
+        
+    def wait_ready(self, timeout=None):
+        """Block until warm_up has finished; re-raises its error if it failed"""
+        if not self.ready.wait(timeout):
+            raise TimeoutError("Controller is still starting up")
+        if self.warm_up_error is not None:
+            raise RuntimeError(f"Startup failed: {self.warm_up_error}") from self.warm_up_error
+        
+    def shutdown(self):
+        """Stop background capture and finish pending archive writes"""
+        self.ready.wait()
+        for service in self.capture_services.values():
+            service.stop()
+        if self.archive is not None:
+            self.archive.close()
+        if self.model is not None:
+            self.model.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        
+    def target_monitor(self):
+        """mss index of the monitor to act on: CAPTURE_MONITOR, or the one under the pointer"""
+        if self.monitor_choice == "mouse" and hasattr(self.capture, "monitor_at"):
+            return self.capture.monitor_at(*self.mouse.position)
+        return self.capture.monitor_index
+        
+    def grab_target(self):
+        """A Frame of the target monitor only, at its physical resolution"""
+        index = self.target_monitor()
+        service = self.capture_services.get(index)
+        if service is not None:
+            # The capture thread already holds a fresh frame
+            return service.latest()
+        return self.capture.grab(index)
+        
+    def capture_frame(self):
+        """Grab the target monitor into self.last_frame"""
+        self.last_frame = self.grab_target()
+        if self.recorder is not None:
+            self.recorder.frame(self.last_frame)
+        return self.last_frame
+        
+    def upload_grid(self):
+        """Grid size and encoding of the first image sent to the model"""
+        if self.zoom.enabled:
+            return self.zoom.coarse_grid, self.zoom.coarse_encoding(self.encoding)
+        return self.grid_size, self.encoding
+        
+    def prepare_upload(self):
+        """Capture, grid and encode the screen ahead of a request (see Speculator)
+        
+        Runs on the speculator's thread, so it leaves self.last_frame alone.
+        """
+        from speculative import PreparedFrame
+        from upload_encoding import encode_image
+        start = time.perf_counter()
+        frame = self.grab_target()
+        grid_size, encoding = self.upload_grid()
+        image = self.renderer.render_image(frame, grid_size=grid_size)
+        prepared = PreparedFrame(frame, self.screen_signature(frame), grid_size, image,
+                                 encode_image(image, encoding))
+        self.metrics.observe("speculative_prepare", time.perf_counter() - start)
+        return prepared
+        
+    def speculate(self):
+        """Start preparing the upload in the background; a no-op until warmed up"""
+        if self.ready.is_set() and self.speculator is not None:
+            self.speculator.schedule()
+        
+    def screen_signature(self, frame):
+        """frame_signature of a frame, for the response cache and the speculator
+        
+        When the capture thread's tile hashes show nothing changed since the
+        last frame signed, that signature is reused instead of re-reading
+        the whole frame.
+        """
+        from response_cache import frame_signature
+        last = self._signature
+        if last is not None and frame.source is not None and frame.source is last[0]:
+            changed = frame.source.changed_between(last[1], frame.frame_id)
+            if changed is not None and not changed.any():
+                return last[2]
+        signature = frame_signature(frame.array())
+        if frame.source is not None:
+            self._signature = (frame.source, frame.frame_id, signature)
+        return signature
+        
+    def take_prepared(self, frame, signature, grid_size):
+        """Speculative work for this screen, or None; sets last_speculative_hit"""
+        prepared = None
+        if self.speculator is not None:
+            with self.metrics.span("speculative"):
+                prepared = self.speculator.take(signature, frame.size, grid_size, frame=frame)
+        self.last_speculative_hit = prepared is not None
+        return prepared
         
     def capture_grid_screenshot(self):
         """Take a screenshot with grid overlay and return as PIL Image"""
-        # Take screenshot
-        self.screen_mapper.take_screenshot()
-        
-        # Get the QPixmap with grid overlay
-        pixmap = self.screen_mapper.image_label.pixmap()
+        with self.metrics.span("grab"):
+            frame = self.capture_frame()
+        with self.metrics.span("grid"):
+            return self.renderer.render_image(frame)
         
-        # Convert QPixmap to PIL Image using QBuffer
-        buffer = QBuffer()
-        buffer.open(QIODevice.WriteOnly)
-        pixmap.save(buffer, "PNG")
+    def frame_point(self, coordinate, grid_size=None, region=None, image_size=None):
+        """Pixel of the last frame at the center of a grid cell, or None
         
-        # Convert to PIL Image
-        image_data = buffer.data().data()
-        buffer.close()
-        
-        return Image.open(BytesIO(image_data))
+        region is the (left, top, width, height) part of the frame the grid
+        was laid over (the whole frame by default) and image_size the size of
+        the image the grid was drawn on, when that was a rescaled region.
+        """
+        from grid_codec import get_codec
+        if self.last_frame is None:
+            return None
+        left, top, width, height = region or (0, 0, self.last_frame.width, self.last_frame.height)
+        image_width, image_height = image_size or (width, height)
+        center = get_codec(image_width, image_height, grid_size or self.grid_size).center(coordinate)
+        if center is None:
+            return None
+        return left + center[0] * width // image_width, top + center[1] * height // image_height
+        
+    def get_grid_center(self, coordinate, grid_size=None, region=None, image_size=None):
+        """Convert a grid coordinate to an absolute screen position in the last frame"""
+        point = self.frame_point(coordinate, grid_size, region, image_size)
+        return self.last_frame.to_screen(*point) if point is not None else None
+        
+    def click_coordinate(self, coordinate, grid_size=None, region=None, image_size=None,
+                         cancel=None):
+        """Focus-click and action-click the center of a grid cell"""
+        from input_actions import focus_and_click
+        point = self.get_grid_center(coordinate, grid_size, region, image_size)
+        if point is None:
+            raise ValueError(f"Invalid coordinate: {coordinate}")
+        focus_and_click(self.mouse, *point, settle=self.settle, metrics=self.metrics,
+                        cancel=cancel)
 
-    def save_annotated_screenshot(self, image, coordinate, user_request):
-        """Save both original and annotated screenshots"""
-        # Generate timestamp
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # Save original screenshot
-        original_path = self.screenshots_dir / f"screenshot_{timestamp}_original.png"
-        image.save(original_path)
-        
-        # Create annotated version
-        annotated = image.copy()
-        draw = ImageDraw.Draw(annotated)
-        
-        # Calculate grid cell size
-        cell_width = image.width // 40
-        cell_height = image.height // 40
-        
-        # Calculate coordinate position
-        col = (ord(coordinate[0]) - ord('a')) * 26 + (ord(coordinate[1]) - ord('a'))
-        row = int(coordinate[2:]) - 1
-        
-        # Calculate box coordinates
-        x1 = col * cell_width
-        y1 = row * cell_height
-        x2 = x1 + cell_width
-        y2 = y1 + cell_height
-        
-        # Draw highlight box (semi-transparent red)
-        draw.rectangle([x1, y1, x2, y2], outline=(255, 0, 0), width=3)
-        draw.rectangle([x1+1, y1+1, x2-1, y2-1], fill=(255, 0, 0, 64))
+    def click_point(self, x, y, cancel=None):
+        """Focus-click and action-click pixel (x, y) of the last frame"""
+        from input_actions import focus_and_click
+        focus_and_click(self.mouse, *self.last_frame.to_screen(x, y),
+                        settle=self.settle, metrics=self.metrics, cancel=cancel)
+        
+    def recall(self, user_request, frame):
+        """Where visual memory finds this request's element in frame, or None"""
+        self.last_memory_match = None
+        if self.visual_memory is not None:
+            with self.metrics.span("memory"):
+                self.last_memory_match = self.visual_memory.find(user_request, frame.array())
+        return self.last_memory_match
+        
+    def remember_click(self, user_request, frame, coordinate, grid_size=None, region=None,
+                       image_size=None):
+        """Keep the patch around a model-chosen click for later recall"""
+        if self.visual_memory is None:
+            return
+        x, y = self.frame_point(coordinate, grid_size, region, image_size)
+        with self.metrics.span("memory"):
+            self.visual_memory.remember(user_request, frame.array(), x, y)
         
-        # Add annotation text
-        text = f"Request: {user_request}\nCoordinate: {coordinate}"
-        draw.text((10, 10), text, fill=(255, 0, 0), stroke_width=2, stroke_fill=(255, 255, 255))
+    def save_annotated_screenshot(self, image, coordinate, user_request, grid_size=None,
+                                  gridded=True):
+        """Queue the screenshot and its annotation for the background archive
         
-        # Save annotated version
-        annotated_path = self.screenshots_dir / f"screenshot_{timestamp}_annotated.png"
-        annotated.save(annotated_path)
+        gridded is False for a raw capture; render_annotated draws its grid.
+        """
+        from grid_codec import get_codec
+        grid_size = grid_size or self.grid_size
+        
+        # Highlight box from the same codec the overlay was drawn with
+        with self.metrics.span("box"):
+            x1, y1, cell_width, cell_height = get_codec(image.width, image.height,
+                                                        grid_size).cell_rect(coordinate)
+        
+        # Writing happens on the archive thread and is timed as archive_write
+        with self.metrics.span("queue"):
+            self.archive.submit(image, {
+                "request": user_request,
+                "coordinate": coordinate,
+                "grid_size": grid_size,
+                "box": [x1, y1, x1 + cell_width, y1 + cell_height],
+                "gridded": gridded,
+            })
 
-    def execute_action(self, user_request):
-        """Process user request and execute action"""
-        # Capture screenshot with grid
-        image = self.capture_grid_screenshot()
-        
-        # Prepare prompt for Gemini
-        prompt = f"""
-        I am showing you a screenshot with a 40x40 coordinate grid overlay.
-        The grid uses coordinates like 'aa01' through 'an40'.
-        
-        User request: {user_request}
-        
-        Please analyze the screenshot and tell me the exact grid coordinate 
-        (in format 'aa01' through 'an40') where I should click to fulfill this request.
-        
-        ONLY respond with the coordinate in lowercase, nothing else.
-        For example: 'ab12' or 'ak40'
+    def encode_for_upload(self, image):
+        """Encode the gridded screenshot with the configured format and budget"""
+        from upload_encoding import encode_image
+        self.last_encoding = encode_image(image, self.encoding)
+        return self.last_encoding
+        
+    def request_coordinate(self, encoded, user_request, grid_size=None, zoomed=False,
+                           region=None, image_size=None):
+        """Ask the model which grid cell to click for the request
+        
+        The model ranks a few candidate cells; see pick_candidate. region and
+        image_size place the grid on the last frame, as for get_grid_center.
+        """
+        from coordinate_prompt import CANDIDATES_SCHEMA, build_prompt
+        grid_size = grid_size or self.grid_size
+        prompt = build_prompt(user_request, grid_size, zoomed)
+        schema = CANDIDATES_SCHEMA if self.structured_output else None
+        
+        # Only answers without a single cell of this grid are retried like failed calls
+        with self.metrics.span("call"):
+            candidates = self.model.request(
+                [prompt, encoded], schema=schema,
+                validate=lambda text: self.answers.parse(text, grid_size))
+        return self.pick_candidate(candidates, grid_size, region, image_size)
+        
+    def pick_candidate(self, candidates, grid_size=None, region=None, image_size=None):
+        """The best-ranked candidate, unless it is off-grid or a blank close call
+        
+        The model's ranking is kept except when the best cell lies outside
+        the last frame, or when it is one flat color and the next candidate
+        was rated about as high; then the next usable candidate (for a blank
+        cell, one rated about as high and not blank itself) is taken
+        locally instead of asking the model again, and the override is
+        counted in self.answers. Sets self.last_candidates.
+        """
+        from coordinate_prompt import is_blank, is_close
+        from grid_codec import get_codec
+        self.last_candidates = candidates
+        if len(candidates) == 1 or self.last_frame is None:
+            return candidates[0].cell
+        
+        left, top, width, height = region or (0, 0, self.last_frame.width, self.last_frame.height)
+        image_width, image_height = image_size or (width, height)
+        codec = get_codec(image_width, image_height, grid_size or self.grid_size)
+        array = self.last_frame.array()
+        
+        def frame_rect(candidate):
+            """Cell of the (possibly rescaled) grid image in frame pixels, or None if off-grid"""
+            cell = codec.cell_rect(candidate.cell)
+            if cell is None:
+                return None
+            x, y, cell_width, cell_height = cell
+            rect = (left + x * width // image_width, top + y * height // image_height,
+                    max(1, cell_width * width // image_width),
+                    max(1, cell_height * height // image_height))
+            on_frame = (rect[0] < self.last_frame.width and rect[1] < self.last_frame.height
+                        and rect[0] + rect[2] > 0 and rect[1] + rect[3] > 0)
+            return rect if on_frame else None
+        
+        best, runner_up = candidates[0], candidates[1]
+        rect = frame_rect(best)
+        if rect is None:
+            reason = "off_grid"
+        elif is_close(best, runner_up) and is_blank(array, rect):
+            reason = "blank"
+        else:
+            return best.cell
+        for candidate in candidates[1:]:
+            rect = frame_rect(candidate)
+            if rect is None:
+                continue
+            if reason == "off_grid" or (is_close(best, candidate) and not is_blank(array, rect)):
+                self.answers.overrode(reason)
+                return candidate.cell
+        return best.cell
+
+    def request_plan(self, encoded, user_request, grid_size=None):
+        """Ask the model for every step of a multi-step request in one call"""
+        from action_plan import build_plan_prompt, parse_plan
+        grid_size = grid_size or self.grid_size
+        prompt = build_plan_prompt(user_request, grid_size)
+        
+        # Answers without a usable action list are retried like failed calls
+        with self.metrics.span("call"):
+            return self.model.request([prompt, encoded],
+                                      validate=lambda text: parse_plan(text, grid_size))
+        
+    def locate_target(self, target, cell, plan_frame, plan_array, fresh, learn):
+        """Absolute screen point to act on for one target of a plan step
+        
+        A planned cell is used while the screen around it still looks as it
+        did when the plan was made (always, when fresh: nothing has run
+        since). Otherwise, and for targets that were not visible then, the
+        target is found on the current screen by visual memory or, failing
+        that, by a single-target model call. With learn set, planned cells
+        are remembered for later recall.
+        """
+        from action_plan import region_unchanged
+        from grid_codec import get_codec
+        frame = None
+        if cell is not None:
+            x, y = get_codec(plan_frame.width, plan_frame.height, self.grid_size).center(cell)
+            if not fresh:
+                frame = self.capture_frame()
+                with self.metrics.span("validate"):
+                    fresh = region_unchanged(plan_array, frame.array(), x, y)
+            if fresh:
+                if learn and target and self.visual_memory is not None:
+                    with self.metrics.span("memory"):
+                        self.visual_memory.remember(target, plan_array, x, y)
+                return plan_frame.to_screen(x, y)
+        if not target:
+            raise ValueError(f"Screen around planned cell {cell} changed and the step names no target")
+        
+        if frame is None:
+            frame = self.capture_frame()
+        match = self.recall(target, frame)
+        if match is not None:
+            return frame.to_screen(match.x, match.y)
+        
+        with self.metrics.span("grid"):
+            image = self.renderer.render_image(frame)
+        coordinate = self.request_coordinate(self.encode_for_upload(image), target)
+        self.last_plan_calls += 1
+        self.remember_click(target, frame, coordinate)
+        return self.get_grid_center(coordinate)
+        
+    def record(self, type, **fields):
+        """Add an event to the session recording, if one is running"""
+        if self.recorder is not None:
+            self.recorder.event(type, **fields)
+        
+    def execute_plan(self, user_request, run_stage=None, cancel=None):
+        """Carry out a multi-step request from a single planning call
+        
+        The model sees the screen once and answers with every step; see
+        locate_target for how each pointer step finds its point. Plans are
+        cached like single answers, per request and screen. Returns the
+        steps as text; self.last_plan holds them as PlanSteps.
         """
+        from action_plan import format_plan, parse_plan
+        from input_actions import ActionExecutor
+        self.wait_ready()
+        self.last_memory_match = None
+        self.last_plan = None
+        self.last_plan_calls = 0
+        self.record("request", request=user_request, plan=True)
+        run_stage = self.timed(run_stage or run_inline)
+        with self.metrics.trace(f"plan: {user_request}"):
+            frame = run_stage("capture", self.capture_frame)
+            # The capture thread reuses its buffers; keep what the plan was made from
+            plan_array = frame.array().copy()
+            
+            cache_key = f"plan: {user_request}"
+            with self.metrics.span("cache"):
+                signature = self.screen_signature(frame)
+                cached = self.response_cache.get(cache_key, signature, frame.size)
+            self.last_cache_hit = cached is not None
+            
+            if cached is not None:
+                steps = parse_plan(cached, self.grid_size)
+            else:
+                prepared = self.take_prepared(frame, signature, self.grid_size)
+                if prepared is not None:
+                    encoded = self.last_encoding = prepared.encoded
+                else:
+                    with self.metrics.span("grid"):
+                        image = self.renderer.render_image(frame)
+                    encoded = run_stage("encode", self.encode_for_upload, image)
+                steps = run_stage("model", self.request_plan, encoded, user_request)
+                self.last_plan_calls += 1
+                self.response_cache.put(cache_key, signature, frame.size, format_plan(steps))
+            
+            executor = ActionExecutor(self.mouse, self.keyboard, settle=self.settle,
+                                      metrics=self.metrics, cancel=cancel)
+            focused = False
+            for index, step in enumerate(steps):
+                point = to_point = None
+                if step.is_pointer:
+                    point = run_stage("locate", self.locate_target, step.target, step.cell,
+                                      frame, plan_array, index == 0, cached is None)
+                if step.action == "drag":
+                    to_point = run_stage("locate", self.locate_target, step.to_target,
+                                         step.to_cell, frame, plan_array, index == 0,
+                                         cached is None)
+                # Only the first pointer step needs to bring the window into focus
+                run_stage("step", executor.run_step, step, point, to_point,
+                          step.is_pointer and not focused)
+                focused = focused or step.is_pointer
+            
+            self.last_plan = steps
+            result = "; ".join(str(step) for step in steps)
+        self.record("result", request=user_request, result=result)
+        return result
+        
+    def execute_action(self, user_request, run_stage=None, cancel=None):
+        """Process user request and execute action
+        
+        run_stage(name, fn, *args) runs each stage; by default stages run
+        inline. ActionPipeline passes its own to add timeouts and cancellation,
+        and its cancel event, which stops clicks that have not happened yet.
+        Every stage is timed into self.metrics, one trace per action.
+        """
+        # Requests typed right after launch wait here, off the Qt thread
+        self.wait_ready()
+        self.last_memory_match = None
+        self.last_plan = None
+        self.last_candidates = None
+        self.record("request", request=user_request, plan=False)
+        run_stage = self.timed(run_stage or run_inline)
+        with self.metrics.trace(user_request):
+            if self.zoom.enabled:
+                result = self.execute_zoomed_action(user_request, run_stage, cancel)
+            else:
+                result = self.execute_single_pass(user_request, run_stage, cancel)
+        self.record("result", request=user_request, result=result)
+        return result
+        
+    def action_result(self, kind, value, trace=None):
+        """ActionResult of the request that just returned value; kind is "plan" or "click"
+
+        Call it on the thread that ran the request, before the next one starts.
+        """
+        if kind == "plan":
+            return ActionResult(kind, value, steps=self.last_plan or (),
+                                plan_calls=self.last_plan_calls, trace=trace)
+        return ActionResult(kind, value, cache_hit=self.last_cache_hit,
+                            memory_match=self.last_memory_match,
+                            speculative_hit=self.last_speculative_hit,
+                            encoding=self.last_encoding, candidates=self.last_candidates or (),
+                            trace=trace)
+
+    def timed(self, run_stage):
+        """Wrap a stage runner so each stage is a span of the current trace"""
+        def run_timed(name, fn, *args):
+            with self.metrics.span(name):
+                # The runner may call fn on another thread; keep its spans nested
+                return run_stage(name, self.metrics.bind(fn), *args)
+        return run_timed
+
+    def execute_single_pass(self, user_request, run_stage, cancel=None):
+        """Resolve the click with one full-screen request"""
+        from grid_codec import get_codec
+        frame = run_stage("capture", self.capture_frame)
+        
+        # Reuse the answer for this request if the screen has not changed
+        with self.metrics.span("cache"):
+            signature = self.screen_signature(frame)
+            coordinate = self.response_cache.get(user_request, signature, frame.size)
+        self.last_cache_hit = coordinate is not None
+        
+        # Otherwise look for the element where it was clicked for this request before
+        match = self.recall(user_request, frame) if coordinate is None else None
+        if match is not None:
+            coordinate = get_codec(frame.width, frame.height, self.grid_size).label_at(match.x,
+                                                                                    match.y)
+        
+        # Reuse the grid and encoding prepared while typing if the screen still matches
+        prepared = self.take_prepared(frame, signature, self.grid_size)
+        if prepared is not None:
+            image = prepared.image
+            self.last_encoding = prepared.encoded
+        else:
+            image = None
+        
+        from_model = coordinate is None
+        if from_model:
+            if prepared is not None:
+                encoded = prepared.encoded
+            else:
+                with self.metrics.span("grid"):
+                    image = self.renderer.render_image(frame)
+                encoded = run_stage("encode", self.encode_for_upload, image)
+            
+            coordinate = run_stage("model", self.request_coordinate, encoded, user_request)
+            self.response_cache.put(user_request, signature, self.last_frame.size, coordinate)
+        
+        # Save screenshots before executing click; without an upload the grid is only
+        # needed for viewing, so the raw capture is archived and gridded on demand
+        if image is not None:
+            run_stage("save", self.save_annotated_screenshot, image, coordinate, user_request)
+        else:
+            run_stage("save", self.save_annotated_screenshot, frame.pil(), coordinate,
+                      user_request, None, False)
+            
+        # Execute click at coordinate; a recalled element is clicked at its exact pixel
+        if match is not None:
+            run_stage("click", self.click_point, match.x, match.y, cancel)
+        else:
+            run_stage("click", self.click_coordinate, coordinate, None, None, None, cancel)
         
-        # Get response from Gemini using new client format
-        response = self.client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[prompt, image]
-        )
-        coordinate = response.text.strip().lower()
+        if from_model:
+            self.remember_click(user_request, frame, coordinate)
         
-        # Validate coordinate format
-        if not (len(coordinate) == 4 and 
-                coordinate[:2].isalpha() and 
-                coordinate[2:].isdigit() and
-                1 <= int(coordinate[2:]) <= 40):
-            raise ValueError(f"Invalid coordinate format: {coordinate}")
+        return coordinate
+
+    def execute_zoomed_action(self, user_request, run_stage, cancel=None):
+        """Resolve the click in two passes: coarse full screen, then a zoomed crop"""
+        from coarse_to_fine import zoom_region, zoomed_size, render_zoom
+        from grid_codec import get_codec
+        from upload_encoding import encode_image
+        frame = run_stage("capture", self.capture_frame)
+        array = frame.array()
+        coarse_grid = self.zoom.coarse_grid
+        fine_grid = self.zoom.fine_grid
+        
+        # Zoomed answers are cached separately from single-pass ones
+        cache_key = f"zoom {coarse_grid}/{fine_grid}: {user_request}"
+        with self.metrics.span("cache"):
+            signature = self.screen_signature(frame)
+            cached = self.response_cache.get(cache_key, signature, frame.size)
+        self.last_cache_hit = cached is not None
+        
+        # Visual memory is shared with single-pass mode: it stores pixels, not cells
+        match = self.recall(user_request, frame) if cached is None else None
+        
+        # The coarse grid is only rendered for an upload; otherwise the raw capture is archived
+        prepared = self.take_prepared(frame, signature, coarse_grid)
+        coarse_image = prepared.image if prepared is not None else None
+        if match is not None:
+            coarse = get_codec(frame.width, frame.height, coarse_grid).label_at(match.x, match.y)
+            run_stage("save", self.save_annotated_screenshot, coarse_image or frame.pil(),
+                      coarse, user_request, coarse_grid, coarse_image is not None)
+            run_stage("click", self.click_point, match.x, match.y, cancel)
+            return coarse
+        
+        if cached is None:
+            # First pass: whole screen, downscaled, coarse grid
+            if prepared is not None:
+                encoded = prepared.encoded
+            else:
+                with self.metrics.span("grid"):
+                    coarse_image = self.renderer.render_image(frame, grid_size=coarse_grid)
+                coarse_config = self.zoom.coarse_encoding(self.encoding)
+                encoded = run_stage("encode", encode_image, coarse_image, coarse_config)
+            coarse = run_stage("model", self.request_coordinate, encoded, user_request, coarse_grid)
+            
+            # Second pass: only the chosen cell, zoomed, fine grid
+            region = zoom_region(frame.width, frame.height, coarse, coarse_grid)
+            with self.metrics.span("zoom"):
+                zoomed = render_zoom(self.renderer, array, region, self.zoom)
+            encoded = run_stage("encode", self.encode_for_upload, zoomed)
+            fine = run_stage("model", self.request_coordinate, encoded, user_request,
+                             fine_grid, True, region, zoomed_size(region, self.zoom))
+            self.response_cache.put(cache_key, signature, frame.size, f"{coarse}/{fine}")
+        else:
+            coarse, fine = cached.split("/")
+            region = zoom_region(frame.width, frame.height, coarse, coarse_grid)
         
         # Save screenshots before executing click
-        self.save_annotated_screenshot(image, coordinate, user_request)
-            
-        # Execute click at coordinate
-        self.screen_mapper.command_input.setText(coordinate)
-        self.screen_mapper.execute_command()
+        run_stage("save", self.save_annotated_screenshot, coarse_image or frame.pil(), coarse,
+                  user_request, coarse_grid, coarse_image is not None)
         
-        return coordinate
+        # Fine cells map back to the screen through the zoomed region
+        run_stage("click", self.click_coordinate, fine, fine_grid, region,
+                  zoomed_size(region, self.zoom), cancel)
+        
+        if cached is None:
+            self.remember_click(user_request, frame, fine, fine_grid, region,
+                                zoomed_size(region, self.zoom))
+        
+        return f"{coarse}/{fine}"
+
+def run_inline(name, fn, *args):
+    """Default stage runner: call the stage directly"""
+    return fn(*args)
 
 def main():
+    parser = argparse.ArgumentParser(description="AI screen control window")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print import and initialization timings, then exit once warmed up")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    profile = StartupProfile(origin=_IMPORT_START)
+    profile.record("module imports", _IMPORT_START, _IMPORT_END)
     try:
         # Create controller
-        controller = AIController()
+        controller = AIController(profile=profile)
+        
+        if args.profile_startup:
+            def report():
+                controller.ready.wait()
+                profile.print_report()
+                QMetaObject.invokeMethod(controller.app, "quit", Qt.QueuedConnection)
+            threading.Thread(target=report, name="startup-report", daemon=True).start()
         
         # Start Qt event loop
-        sys.exit(controller.app.exec())
+        exit_code = controller.app.exec()
+        controller.shutdown()
+        sys.exit(exit_code)
                 
     except Exception as e:
         print(f"Initialization error: {e}")
             
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
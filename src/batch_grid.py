@@ -0,0 +1,203 @@
+"""Headless batch mode: grid a directory of screenshots without any window
+
+    python src/batch_grid.py screenshots/ out/ --grid-size 40 --workers 8
+    find shots -name '*.png' | python src/batch_grid.py - out/ --request "open settings"
+
+For every input image this writes <stem>_grid.<format> (the gridded image)
+and <stem>_cells.json (label -> pixel center of each cell), and appends one
+line per image to out/results.jsonl. With --request or --requests, each
+gridded image is also sent to the model and the answer and its pixel
+center are recorded in results.jsonl.
+
+Images are processed on a process pool, each worker with its own
+GridRenderer; at most two images per worker are in flight, so memory stays
+bounded however many inputs there are.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from grid_render import GridRenderer
+from grid_codec import get_codec
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+SAVE_FORMATS = {"png": ("PNG", "png"), "jpeg": ("JPEG", "jpg"), "webp": ("WEBP", "webp")}
+
+# Per-process state, set up once by init_worker
+_renderer = None
+_model = None
+_encoding = None
+
+
+def init_worker(grid_size):
+    global _renderer
+    _renderer = GridRenderer(grid_size)
+
+
+def model_requester():
+    """ModelRequester for this worker, created on first use and reused for every image"""
+    global _model, _encoding
+    if _model is None:
+        from dotenv import load_dotenv
+        from model_backend import ModelRequester, gemini_backend
+        from upload_encoding import EncodingConfig
+        load_dotenv(Path(__file__).parent.parent / '.env')
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in .env file")
+        _model = ModelRequester.from_env([gemini_backend(api_key)])
+        _encoding = EncodingConfig.from_env()
+    return _model
+
+
+def resolve(image, request, grid_size):
+    """Ask the model which cell of a gridded image fulfills request"""
+    from coordinate_prompt import CANDIDATES_SCHEMA, build_prompt, parse_coordinate
+    from upload_encoding import encode_image
+    model = model_requester()
+    encoded = encode_image(image, _encoding)
+    return model.request([build_prompt(request, grid_size), encoded],
+                         validate=lambda text: parse_coordinate(text, grid_size),
+                         schema=CANDIDATES_SCHEMA)
+
+
+def coordinate_map(width, height, grid_size):
+    codec = get_codec(width, height, grid_size)
+    labels = codec.labels.ravel()
+    xs, ys, _ = codec.centers_many(labels)
+    return {
+        "width": width,
+        "height": height,
+        "grid_size": grid_size,
+        "cell_width": codec.cell_width,
+        "cell_height": codec.cell_height,
+        "centers": {str(label): [int(x), int(y)] for label, x, y in zip(labels, xs, ys)},
+    }
+
+
+def process_image(path, output_dir, grid_size, image_format, request):
+    """Grid one screenshot and write its outputs; returns its results.jsonl entry"""
+    started = time.perf_counter()
+    path = Path(path)
+    result = {"source": str(path)}
+    try:
+        with Image.open(path) as source:
+            array = np.asarray(source.convert("RGB"))
+        height, width = array.shape[:2]
+        gridded = Image.fromarray(_renderer.render(array, bgr=False), "RGB")
+
+        save_format, extension = SAVE_FORMATS[image_format]
+        grid_path = output_dir / f"{path.stem}_grid.{extension}"
+        if save_format == "PNG":
+            gridded.save(grid_path, save_format, compress_level=1)
+        else:
+            gridded.save(grid_path, save_format, quality=90)
+        cells_path = output_dir / f"{path.stem}_cells.json"
+        with open(cells_path, 'w') as f:
+            json.dump(dict(coordinate_map(width, height, grid_size), source=str(path)), f)
+        result.update(grid=str(grid_path), cells=str(cells_path), size=[width, height])
+
+        if request:
+            coordinate = resolve(gridded, request, grid_size)
+            result.update(request=request, coordinate=coordinate,
+                          center=list(get_codec(width, height, grid_size).center(coordinate)))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def iter_inputs(source):
+    """Image paths from a directory, or one path per line from stdin for '-'"""
+    if source == "-":
+        for line in sys.stdin:
+            line = line.strip()
+            if line:
+                yield Path(line)
+        return
+    for path in sorted(Path(source).iterdir()):
+        if path.suffix.lower() in IMAGE_EXTENSIONS:
+            yield path
+
+
+def load_requests(path):
+    """{image file name: request} from a JSONL file of {"image": ..., "request": ...}"""
+    requests = {}
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                requests[Path(entry["image"]).name] = entry["request"]
+    return requests
+
+
+def run_batch(inputs, output_dir, grid_size=40, workers=None, image_format="png",
+              request=None, requests=None):
+    """Process every input on a process pool; returns (processed, failed)"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    max_pending = 2 * workers
+    processed = failed = 0
+    started = time.monotonic()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(grid_size,)) as pool, \
+            open(output_dir / "results.jsonl", 'a') as results:
+        pending = set()
+
+        def collect(done):
+            nonlocal processed, failed
+            for future in done:
+                result = future.result()
+                results.write(json.dumps(result) + "\n")
+                processed += 1
+                if "error" in result:
+                    failed += 1
+                    logger.warning("%s: %s", result["source"], result["error"])
+                if processed % 100 == 0:
+                    logger.info("%d images, %.1f/s", processed,
+                                processed / (time.monotonic() - started))
+
+        for path in inputs:
+            image_request = (requests or {}).get(path.name, request)
+            pending.add(pool.submit(process_image, path, output_dir, grid_size,
+                                    image_format, image_request))
+            # Keep the number of decoded images in flight bounded
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(pending).done)
+
+    logger.info("%d images (%d failed) in %.1fs", processed, failed, time.monotonic() - started)
+    return processed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="directory of screenshots, or - to read paths from stdin")
+    parser.add_argument("output", help="directory for gridded images, cell maps and results.jsonl")
+    parser.add_argument("--grid-size", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--format", choices=sorted(SAVE_FORMATS), default="png")
+    parser.add_argument("--request", help="resolve this request on every image with the model")
+    parser.add_argument("--requests", help='JSONL of {"image": name, "request": text} per image')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    requests = load_requests(args.requests) if args.requests else None
+    processed, failed = run_batch(iter_inputs(args.input), args.output, args.grid_size,
+                                  args.workers, args.format, args.request, requests)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
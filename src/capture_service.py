@@ -0,0 +1,287 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from mss import mss
+from frame import Frame
+
+logger = logging.getLogger(__name__)
+
+
+def tile_edges(length, tile_size):
+    """Start offsets of each tile along one axis (the last tile may be short)"""
+    return np.arange(0, length, tile_size)
+
+
+class TileHasher:
+    """Position-weighted 64-bit sums of every tile of a BGRA frame
+
+    Each pixel (as one uint32) is multiplied by fixed odd per-row and
+    per-column weights and summed per tile with wrap-around, so moving or
+    swapping pixels inside a tile changes its hash, unlike a plain sum.
+    """
+
+    def __init__(self, width, height, tile_size=64, seed=0x5eed):
+        rng = np.random.default_rng(seed)
+        self.tile_size = tile_size
+        self.row_starts = tile_edges(height, tile_size)
+        self.col_starts = tile_edges(width, tile_size)
+        self.shape = (len(self.row_starts), len(self.col_starts))
+        self.col_weights = rng.integers(1, 2 ** 62, size=width, dtype=np.uint64) | np.uint64(1)
+        self.row_weights = rng.integers(1, 2 ** 62, size=height, dtype=np.uint64) | np.uint64(1)
+
+    def __call__(self, array):
+        pixels = array.view(np.uint32).reshape(array.shape[0], array.shape[1])
+        mixed = pixels.astype(np.uint64) * self.col_weights
+        rows = np.add.reduceat(mixed, self.col_starts, axis=1, dtype=np.uint64)
+        rows *= self.row_weights[:, None]
+        return np.add.reduceat(rows, self.row_starts, axis=0, dtype=np.uint64)
+
+
+class CaptureSession:
+    """mss handles kept open for every on-demand grab
+
+    Opening mss connects to the display server and sets up shared memory,
+    which costs more than a grab itself, so callers keep one session
+    instead of a `with mss()` block per capture. mss handles belong to the
+    thread that opened them, so the session keeps one per calling thread.
+
+    Monitors are numbered as in mss: 1 is the primary display and 0 the
+    bounding box of all of them. Grabs cover only the requested monitor,
+    at its physical resolution.
+    """
+
+    def __init__(self, monitor_index=1, follow_mouse=False):
+        self.monitor_index = monitor_index
+        self.follow_mouse = follow_mouse  # Callers pick the monitor under the pointer
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+        self._executor = None  # Threads for grab_many, each with its own mss handle
+        self._executor_size = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a session from CAPTURE_MONITOR: an mss monitor index, or "mouse"
+
+        Any other value falls back to monitor 1.
+        """
+        choice = os.getenv("CAPTURE_MONITOR", "1").strip().lower()
+        return cls(int(choice) if choice.isdigit() else 1, follow_mouse=choice == "mouse")
+
+    def _session(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = self._local.sct = mss()
+            with self._lock:
+                self._handles.append(sct)
+        return sct
+
+    @property
+    def monitor(self):
+        return self._session().monitors[self.monitor_index]
+
+    def monitors(self):
+        """{index: geometry} of every physical monitor"""
+        return dict(enumerate(self._session().monitors))
+
+    def monitor_at(self, x, y):
+        """Index of the monitor containing screen point (x, y), or the session's monitor"""
+        for index, monitor in enumerate(self._session().monitors[1:], start=1):
+            if (monitor["left"] <= x < monitor["left"] + monitor["width"]
+                    and monitor["top"] <= y < monitor["top"] + monitor["height"]):
+                return index
+        return self.monitor_index
+
+    def grab(self, monitor_index=None):
+        """A whole monitor (by default the session's) as a Frame"""
+        sct = self._session()
+        monitor = sct.monitors[self.monitor_index if monitor_index is None else monitor_index]
+        return Frame.from_mss(sct.grab(monitor), monitor)
+
+    def grab_many(self, indices):
+        """{index: Frame} of several monitors, grabbed concurrently"""
+        indices = list(indices)
+        if len(indices) <= 1:
+            return {index: self.grab(index) for index in indices}
+        with self._lock:
+            if self._executor_size < len(indices):
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._executor = ThreadPoolExecutor(max_workers=len(indices),
+                                                    thread_name_prefix="capture")
+                self._executor_size = len(indices)
+            executor = self._executor
+        return dict(zip(indices, executor.map(self.grab, indices)))
+
+    def grab_region(self, left, top, width, height):
+        """Part of the monitor as a Frame; coordinates are relative to the monitor
+
+        The region is clipped to the monitor. The frame's left/top are
+        absolute screen coordinates, as for a full grab.
+        """
+        monitor = self.monitor
+        right = min(left + width, monitor["width"])
+        bottom = min(top + height, monitor["height"])
+        left = max(0, left)
+        top = max(0, top)
+        if right <= left or bottom <= top:
+            raise ValueError(f"Region {(left, top, width, height)} is outside the monitor")
+        region = {"left": monitor["left"] + left, "top": monitor["top"] + top,
+                  "width": right - left, "height": bottom - top}
+        return Frame.from_mss(self._session().grab(region), region)
+
+    def close(self):
+        """Close every handle; call once no thread is grabbing any more"""
+        with self._lock:
+            executor, self._executor, self._executor_size = self._executor, None, 0
+        # Outside the lock: its threads take it to register their mss handles
+        if executor is not None:
+            executor.shutdown()
+        with self._lock:
+            handles, self._handles = self._handles, []
+        for sct in handles:
+            sct.close()
+        self._local = threading.local()
+
+
+class CaptureService:
+    """Long-lived capture thread keeping the last N frames in a ring buffer
+
+    Frames are copied into a buffer preallocated once for the monitor size
+    and numbered with increasing frame ids. Per-tile hashes are kept for
+    every slot so consumers can ask which tiles changed since frame K
+    instead of diffing whole frames themselves.
+    """
+
+    def __init__(self, monitor_index=1, fps=10.0, capacity=8, tile_size=64):
+        self.monitor_index = monitor_index
+        self.fps = fps
+        self.capacity = capacity
+        self.tile_size = tile_size
+        self.monitor = None
+        self.scale = 1.0  # Frame pixels per screen unit, see Frame.scale
+        self.latest_id = -1
+        self._frames = None
+        self._hashes = None
+        self._slot_ids = np.full(capacity, -1, dtype=np.int64)
+        self._hasher = None
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, monitor_index=1):
+        """Build a service from CAPTURE_* environment variables, or None if disabled"""
+        fps = float(os.getenv("CAPTURE_FPS", "0"))
+        if fps <= 0:
+            return None
+        return cls(monitor_index, fps=fps, capacity=int(os.getenv("CAPTURE_BUFFER", "8")),
+                   tile_size=int(os.getenv("CAPTURE_TILE_SIZE", "64")))
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f"capture-service-{self.monitor_index}")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _allocate(self, width, height):
+        self._frames = np.empty((self.capacity, height, width, 4), dtype=np.uint8)
+        self._hasher = TileHasher(width, height, self.tile_size)
+        self._hashes = np.empty((self.capacity,) + self._hasher.shape, dtype=np.uint64)
+        self._slot_ids.fill(-1)
+        logger.info("capture ring allocated: %d x %dx%d", self.capacity, width, height)
+
+    def _run(self):
+        interval = 1.0 / self.fps
+        with mss() as sct:
+            self.monitor = sct.monitors[self.monitor_index]
+            while not self._stop.is_set():
+                started = time.monotonic()
+                shot = sct.grab(self.monitor)
+                array = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+                if self._frames is None or self._frames.shape[1:3] != array.shape[:2]:
+                    with self._condition:
+                        self._allocate(shot.width, shot.height)
+                        self.scale = shot.width / self.monitor["width"]
+
+                frame_id = self.latest_id + 1
+                slot = frame_id % self.capacity
+                # Invalidate the slot while it is being overwritten
+                with self._condition:
+                    self._slot_ids[slot] = -1
+                np.copyto(self._frames[slot], array)
+                self._hashes[slot] = self._hasher(self._frames[slot])
+                with self._condition:
+                    self._slot_ids[slot] = frame_id
+                    self.latest_id = frame_id
+                    self._condition.notify_all()
+
+                self._stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+    def wait_for_frame(self, after_id=-1, timeout=1.0):
+        """Block until a frame newer than after_id exists; returns its id or None"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.latest_id > after_id, timeout)
+            return self.latest_id if self.latest_id > after_id else None
+
+    def _slot(self, frame_id):
+        if frame_id < 0:
+            return None
+        slot = frame_id % self.capacity
+        return slot if self._slot_ids[slot] == frame_id else None
+
+    def frame(self, frame_id):
+        """Copy of frame `frame_id` as a Frame, or None if it left the ring"""
+        with self._condition:
+            slot = self._slot(frame_id)
+            if slot is None:
+                return None
+            raw = bytearray(self._frames[slot])
+            height, width = self._frames.shape[1:3]
+        return Frame(raw, width, height, self.monitor["left"], self.monitor["top"],
+                     frame_id=frame_id, scale=self.scale, source=self)
+
+    def latest(self, timeout=1.0):
+        """The most recent frame, waiting briefly for the first one after start"""
+        if self.latest_id < 0 and self.wait_for_frame(-1, timeout) is None:
+            raise TimeoutError("Capture service has not produced a frame yet")
+        return self.frame(self.latest_id)
+
+    def changed_between(self, old_id, new_id):
+        """Boolean (tile_rows, tile_cols) map of tiles that differ between two frames
+
+        Returns None when either frame is no longer in the ring; callers
+        should then compare the frames themselves.
+        """
+        with self._condition:
+            old = self._slot(old_id)
+            new = self._slot(new_id)
+            if old is None or new is None:
+                return None
+            return self._hashes[old] != self._hashes[new]
+
+    def changed_since(self, frame_id):
+        """Map of tiles changed since frame_id, as changed_between the latest frame"""
+        return self.changed_between(frame_id, self.latest_id)
+
+
+def tile_changes(old, new):
+    """Tile map of what changed between two Frames of one CaptureService, or None
+
+    None when the frames did not come from the same service or one of them
+    has left its ring. Comparing stored tile hashes costs next to nothing
+    next to re-reading both frames.
+    """
+    if old.source is None or old.source is not new.source:
+        return None
+    return old.source.changed_between(old.frame_id, new.frame_id)
@@ -0,0 +1,83 @@
+import os
+import numpy as np
+from PIL import Image
+from upload_encoding import EncodingConfig
+from grid_codec import get_codec
+
+
+class ZoomConfig:
+    """Settings for two-pass coarse-to-fine coordinate resolution
+
+    The first pass sends the whole screen, downscaled to coarse_max_edge,
+    with a coarse_grid x coarse_grid grid. The second pass sends only the
+    chosen coarse cell (plus half a cell of margin on every side), zoomed
+    so its fine_grid x fine_grid cells are at least min_cell pixels.
+    """
+
+    def __init__(self, enabled=False, coarse_grid=10, fine_grid=10,
+                 coarse_max_edge=1280, min_cell=(64, 32)):
+        self.enabled = enabled
+        self.coarse_grid = coarse_grid
+        self.fine_grid = fine_grid
+        self.coarse_max_edge = coarse_max_edge
+        self.min_cell = min_cell
+
+    @classmethod
+    def from_env(cls):
+        """Build a config from ZOOM_* environment variables"""
+        return cls(
+            enabled=os.getenv("ZOOM_MODE", "0").lower() in ("1", "true", "yes"),
+            coarse_grid=int(os.getenv("ZOOM_COARSE_GRID", "10")),
+            fine_grid=int(os.getenv("ZOOM_FINE_GRID", "10")),
+            coarse_max_edge=int(os.getenv("ZOOM_COARSE_MAX_EDGE", "1280")),
+        )
+
+    def coarse_encoding(self, encoding):
+        """Upload settings for the first pass: the deployment's, capped to coarse_max_edge"""
+        max_edge = self.coarse_max_edge
+        if encoding.max_long_edge:
+            max_edge = min(max_edge, encoding.max_long_edge)
+        return EncodingConfig(format=encoding.format, quality=encoding.quality,
+                              min_quality=encoding.min_quality,
+                              png_compress_level=encoding.png_compress_level,
+                              max_long_edge=max_edge, max_pixels=encoding.max_pixels,
+                              max_bytes=encoding.max_bytes,
+                              label_height=encoding.label_height,
+                              min_label_height=encoding.min_label_height)
+
+
+def zoom_region(width, height, coordinate, grid_size):
+    """(left, top, width, height) around a coarse cell, with half a cell of margin"""
+    x, y, cell_width, cell_height = get_codec(width, height, grid_size).cell_rect(coordinate)
+    margin_x = cell_width // 2
+    margin_y = cell_height // 2
+    left = max(0, x - margin_x)
+    top = max(0, y - margin_y)
+    right = min(width, x + cell_width + margin_x)
+    bottom = min(height, y + cell_height + margin_y)
+    return left, top, right - left, bottom - top
+
+
+def zoomed_size(region, config):
+    """Size the region is upscaled to so fine cells are at least config.min_cell"""
+    width, height = region[2:]
+    min_width, min_height = config.min_cell
+    zoom = max(1.0, min_width * config.fine_grid / width, min_height * config.fine_grid / height)
+    return round(width * zoom), round(height * zoom)
+
+
+def render_zoom(renderer, array, region, config):
+    """Crop a BGR(A) frame array to region, upscale it and draw the fine grid
+
+    Returns the gridded RGB PIL image. The grid is laid out over the zoomed
+    crop proportionally to the region, so fine labels map back through the
+    region using the zoomed image size.
+    """
+    left, top, width, height = region
+    crop = np.ascontiguousarray(array[top:top + height, left:left + width, 2::-1])
+    image = Image.fromarray(crop, "RGB")
+    size = zoomed_size(region, config)
+    if size != image.size:
+        image = image.resize(size, Image.BICUBIC)
+    gridded = renderer.render(np.asarray(image), bgr=False, grid_size=config.fine_grid)
+    return Image.fromarray(gridded, "RGB")
@@ -0,0 +1,209 @@
+import json
+import re
+import threading
+import numpy as np
+from grid_codec import grid_dimensions, last_label, parse_label
+
+MODEL_NAME = "gemini-2.0-flash"
+
+# How many ranked cells the model is asked for
+CANDIDATES = 3
+
+# The best candidate is only second-guessed when the next one is rated within this
+CLOSE_CONFIDENCE = 0.15
+
+# Response schema for backends that support structured output
+CANDIDATES_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "candidates": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "cell": {"type": "STRING"},
+                    "confidence": {"type": "NUMBER"},
+                },
+                "required": ["cell", "confidence"],
+            },
+        },
+    },
+    "required": ["candidates"],
+}
+
+# Anything shaped like a label; parse_label decides whether it is one of this grid
+_LABEL_PATTERN = re.compile(r"(?<![a-z0-9])([a-z]{2}\d{2,3})(?![a-z0-9])")
+
+
+def build_prompt(user_request, grid_size, zoomed=False, candidates=CANDIDATES):
+    """Prompt asking the model for the grid cells to click for a request, best first"""
+    cols, rows = grid_dimensions(grid_size)
+    final_label = last_label(grid_size)
+    if zoomed:
+        view = "a zoomed-in part of a screenshot"
+    else:
+        view = "a screenshot"
+
+    return f"""
+        I am showing you {view} with a {cols}x{rows} coordinate grid overlay.
+        The grid uses coordinates like 'aa01' through '{final_label}'.
+
+        User request: {user_request}
+
+        Please analyze the screenshot and tell me the grid coordinates
+        (in format 'aa01' through '{final_label}') where I should click to fulfill this request.
+
+        ONLY respond with JSON, nothing else: up to {candidates} candidate cells in lowercase,
+        most likely first, each with your confidence between 0 and 1.
+        For example: {{"candidates": [{{"cell": "ab02", "confidence": 0.9}},
+                                      {{"cell": "ab03", "confidence": 0.1}}]}}
+        """
+
+
+class Candidate:
+    def __init__(self, cell, confidence=None):
+        self.cell = cell
+        self.confidence = confidence  # None when the answer gave none
+
+    def __repr__(self):
+        if self.confidence is None:
+            return self.cell
+        return f"{self.cell} ({self.confidence:.2f})"
+
+
+def _json_entries(text):
+    """(cell, confidence) pairs from a JSON answer, or None if it holds no JSON"""
+    match = re.search(r"[\[{].*[\]}]", text, re.DOTALL)
+    if match is None:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if isinstance(data, dict):
+        data = data.get("candidates", [data])
+    if not isinstance(data, list):
+        return None
+
+    entries = []
+    for item in data:
+        if isinstance(item, str):
+            entries.append((item, None))
+        elif isinstance(item, dict):
+            cell = item.get("cell") or item.get("coordinate")
+            confidence = item.get("confidence")
+            if isinstance(cell, str):
+                entries.append((cell, confidence if isinstance(confidence, (int, float)) else None))
+    return entries
+
+
+def parse_candidates(text, grid_size, limit=CANDIDATES):
+    """Ranked Candidates of the grid from a model answer; raises ValueError if there are none
+
+    Reads the JSON the prompt asks for, but also a bare label, a quoted
+    one or labels inside prose, so a sloppy answer does not cost another
+    model call. Cells that are not labels of this grid are dropped.
+    Returns the candidates best first and whether the answer was JSON.
+    """
+    entries = _json_entries(text)
+    structured = bool(entries)
+    if not structured:
+        entries = [(cell, None) for cell in _LABEL_PATTERN.findall(text.lower())]
+
+    candidates = []
+    seen = set()
+    for cell, confidence in entries:
+        cell = cell.strip().strip("'\"` .").lower()
+        if cell in seen or parse_label(cell, grid_size) is None:
+            continue
+        seen.add(cell)
+        if confidence is not None:
+            confidence = min(1.0, max(0.0, float(confidence)))
+        candidates.append(Candidate(cell, confidence))
+    if not candidates:
+        raise ValueError(f"Invalid coordinate format: {text.strip()[:80]}")
+
+    # Models usually list the best first; confidences only reorder when all are given
+    if all(candidate.confidence is not None for candidate in candidates):
+        candidates.sort(key=lambda candidate: -candidate.confidence)
+    return candidates[:limit], structured
+
+
+def parse_coordinate(text, grid_size):
+    """Best label of the grid in a model answer; raises ValueError if there is none"""
+    candidates, _ = parse_candidates(text, grid_size)
+    return candidates[0].cell
+
+
+def is_close(best, runner_up, margin=CLOSE_CONFIDENCE):
+    """Whether the model rated two Candidates about the same; False without confidences"""
+    if best.confidence is None or runner_up.confidence is None:
+        return False
+    return best.confidence - runner_up.confidence <= margin
+
+
+def is_blank(array, rect, threshold=8):
+    """Whether the (x, y, width, height) part of a frame array is one flat color
+
+    On a close call between candidates, a cell with nothing on it is the
+    likelier mistake. A flat cell alone proves nothing: at high resolutions
+    a cell can sit inside a large solid button or text field.
+    """
+    x, y, width, height = rect
+    pixels = array[max(0, y):y + height, max(0, x):x + width, :3]
+    return pixels.size == 0 or int(np.ptp(pixels)) < threshold
+
+
+class AnswerStats:
+    """Counts of how model answers parsed and which candidate was used
+
+    failures are answers without a single valid cell, which the requester
+    re-queries; salvaged answers were not the requested JSON but still
+    held a cell. overrides counts, per reason, answers where a lower-ranked
+    candidate was used: "off_grid" when the best cell was outside the
+    screenshot, "blank" when it was flat and the next one rated about as high.
+    """
+
+    def __init__(self):
+        self.answers = 0
+        self.structured = 0
+        self.salvaged = 0
+        self.failures = 0
+        self.overrides = {"off_grid": 0, "blank": 0}
+        self._lock = threading.Lock()
+
+    def parse(self, text, grid_size):
+        """parse_candidates, counted; returns the candidates"""
+        try:
+            candidates, structured = parse_candidates(text, grid_size)
+        except ValueError:
+            with self._lock:
+                self.answers += 1
+                self.failures += 1
+            raise
+        with self._lock:
+            self.answers += 1
+            if structured:
+                self.structured += 1
+            else:
+                self.salvaged += 1
+        return candidates
+
+    def overrode(self, reason):
+        """Count an answer whose best candidate was passed over for reason"""
+        with self._lock:
+            self.overrides[reason] += 1
+
+    @property
+    def fallbacks(self):
+        return sum(self.overrides.values())
+
+    @property
+    def failure_rate(self):
+        return self.failures / self.answers if self.answers else 0.0
+
+    def stats(self):
+        return {"answers": self.answers, "structured": self.structured,
+                "salvaged": self.salvaged, "failures": self.failures,
+                "failure_rate": self.failure_rate, "fallbacks": self.fallbacks,
+                "overrides": dict(self.overrides)}
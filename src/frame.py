@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+# Single background writer so disk writes never block a capture or a click
+_writer = None
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frame-writer")
+    return _writer
+
+
+class Frame:
+    """In-memory screen capture backed by a single raw BGRA buffer
+
+    The buffer is exactly what mss hands back (B, G, R, A per pixel, rows
+    packed without padding), so the NumPy and QImage views share it without
+    copying. PIL has no BGRA mode, so the PIL view is decoded once on first
+    use and cached.
+
+    left and top are where the frame starts in screen (mouse) coordinates.
+    Where those are logical points rather than pixels (macOS Retina
+    displays), the frame has `scale` pixels per point; use to_screen and
+    from_screen to convert instead of adding left and top.
+    """
+
+    def __init__(self, raw, width, height, left=0, top=0, frame_id=None, scale=1.0,
+                 source=None):
+        self.raw = raw
+        self.width = width
+        self.height = height
+        self.left = left
+        self.top = top
+        # Set when the frame comes from a CaptureService, see capture_service.tile_changes
+        self.frame_id = frame_id
+        self.source = source
+        self.scale = scale
+        self._pil = None
+
+    @classmethod
+    def from_mss(cls, screenshot, region=None):
+        """Wrap an mss ScreenShot without copying its pixels
+
+        region is the dict that was grabbed; a shot with more pixels than
+        the region is wide comes from a HiDPI display.
+        """
+        scale = screenshot.width / region["width"] if region else 1.0
+        return cls(screenshot.raw, screenshot.width, screenshot.height,
+                   screenshot.left, screenshot.top, scale=scale)
+
+    @classmethod
+    def from_pil(cls, image):
+        """Build a frame from a PIL image (used for synthetic test images)"""
+        raw = bytearray(image.convert("RGBA").tobytes("raw", "BGRA"))
+        return cls(raw, image.width, image.height)
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    def to_screen(self, x, y):
+        """Screen (mouse) coordinates of frame pixel (x, y)"""
+        return self.left + round(x / self.scale), self.top + round(y / self.scale)
+
+    def from_screen(self, x, y):
+        """Frame pixel at screen (mouse) coordinates (x, y)"""
+        return round((x - self.left) * self.scale), round((y - self.top) * self.scale)
+
+    @property
+    def stride(self):
+        return self.width * 4
+
+    def array(self):
+        """(height, width, 4) uint8 BGRA view of the buffer"""
+        return np.frombuffer(self.raw, dtype=np.uint8).reshape(self.height, self.width, 4)
+
+    def qimage(self):
+        """QImage view of the buffer; valid for as long as this frame is alive"""
+        from PySide6.QtGui import QImage
+        # Format_RGB32 is stored as B, G, R, 0xFF bytes on little-endian hosts
+        return QImage(self.raw, self.width, self.height, self.stride, QImage.Format_RGB32)
+
+    def pil(self):
+        """RGB PIL image, decoded from the BGRA buffer on first use"""
+        if self._pil is None:
+            self._pil = Image.frombuffer("RGB", self.size, self.raw, "raw", "BGRX", 0, 1)
+        return self._pil
+
+    def save(self, path):
+        self.pil().save(path)
+
+    def save_async(self, path):
+        """Write the frame to disk on the background writer thread"""
+        return _get_writer().submit(self.save, path)
+
+
+def qimage_to_pil(qimage):
+    """Convert a QImage to an RGB PIL image without a PNG round-trip"""
+    from PySide6.QtGui import QImage
+    if qimage.format() != QImage.Format_RGB32:
+        qimage = qimage.convertToFormat(QImage.Format_RGB32)
+    width, height = qimage.width(), qimage.height()
+    return Image.frombuffer("RGB", (width, height), qimage.constBits(),
+                            "raw", "BGRX", qimage.bytesPerLine(), 1)
@@ -0,0 +1,179 @@
+from functools import lru_cache
+import numpy as np
+
+MAX_COLUMNS = 26 * 26  # Two-letter column labels: aa through zz
+
+
+def grid_dimensions(grid_size):
+    """(cols, rows) for a grid size given as an int (square) or a (cols, rows) pair"""
+    if isinstance(grid_size, int):
+        return grid_size, grid_size
+    cols, rows = grid_size
+    return cols, rows
+
+
+def column_label(index):
+    """Convert numeric index to two-letter label (aa-zz)"""
+    return f"{chr(97 + (index // 26))}{chr(97 + (index % 26))}"
+
+
+def row_digits(rows):
+    """Digits in the row part of a label: two up to 99 rows, more beyond that"""
+    return max(2, len(str(rows)))
+
+
+class LabelTable:
+    """Label <-> (col, row) tables for one grid shape, independent of pixel size"""
+
+    def __init__(self, cols, rows):
+        if not 0 < cols <= MAX_COLUMNS or rows <= 0:
+            raise ValueError(f"Unsupported grid dimensions: {cols}x{rows}")
+        self.cols = cols
+        self.rows = rows
+        self.digits = row_digits(rows)
+        self.label_length = 2 + self.digits
+        columns = [column_label(col) for col in range(cols)]
+        self.labels = np.array([[f"{columns[col]}{row + 1:0{self.digits}d}" for col in range(cols)]
+                                for row in range(rows)])
+        self.index = {str(label): (col, row)
+                      for (row, col), label in np.ndenumerate(self.labels)}
+
+        # Labels in sorted order and their flat positions, for decode_many
+        self._order = np.argsort(self.labels, axis=None)
+        self._sorted = self.labels.ravel()[self._order]
+
+    def encode(self, col, row):
+        return str(self.labels[row, col])
+
+    def decode(self, label):
+        """(col, row) for a label, or None if it is not a cell of this grid"""
+        return self.index.get(label.lower().strip())
+
+    def decode_many(self, labels):
+        """Vectorized decode: (cols, rows, valid) arrays for an array of labels
+
+        Labels are binary-searched in the sorted label table. Only labels
+        not found as given are lowercased and stripped and searched again,
+        so clean input never goes through NumPy's slow string functions.
+        """
+        labels = np.atleast_1d(np.asarray(labels, dtype=str))
+        positions, valid = self._search(labels)
+        if not valid.all():
+            retry = np.flatnonzero(~valid)
+            positions[retry], valid[retry] = self._search(
+                np.char.lower(np.char.strip(labels[retry])))
+        rows, cols = np.divmod(self._order[positions], self.cols)
+        return cols, rows, valid
+
+    def _search(self, labels):
+        positions = np.minimum(np.searchsorted(self._sorted, labels), len(self._sorted) - 1)
+        return positions, self._sorted[positions] == labels
+
+
+@lru_cache(maxsize=32)
+def label_table(cols, rows):
+    return LabelTable(cols, rows)
+
+
+def parse_label(label, grid_size):
+    """Parse a label into a zero-based (col, row), or None if invalid"""
+    return label_table(*grid_dimensions(grid_size)).decode(label)
+
+
+def format_label(col, row, grid_size):
+    return label_table(*grid_dimensions(grid_size)).encode(col, row)
+
+
+def last_label(grid_size):
+    cols, rows = grid_dimensions(grid_size)
+    return format_label(cols - 1, rows - 1, grid_size)
+
+
+class GridCodec:
+    """Grid laid over a width x height image, with precomputed lookup tables
+
+    Cells are width // cols by height // rows whole pixels (non-square
+    whenever the image aspect differs from the grid's), starting at
+    (left, top). Every conversion is a table lookup; the *_many methods
+    convert whole NumPy arrays at once.
+    """
+
+    def __init__(self, width, height, grid_size=40, left=0, top=0):
+        self.cols, self.rows = grid_dimensions(grid_size)
+        self.width = width
+        self.height = height
+        self.left = left
+        self.top = top
+        self.table = label_table(self.cols, self.rows)
+        self.cell_width = width // self.cols
+        self.cell_height = height // self.rows
+
+        # Cell origins and centers along each axis
+        self.cell_x = left + np.arange(self.cols) * self.cell_width
+        self.cell_y = top + np.arange(self.rows) * self.cell_height
+        self.center_x = self.cell_x + self.cell_width // 2
+        self.center_y = self.cell_y + self.cell_height // 2
+
+    @property
+    def labels(self):
+        """(rows, cols) array of every label"""
+        return self.table.labels
+
+    def encode(self, col, row):
+        return self.table.encode(col, row)
+
+    def decode(self, label):
+        return self.table.decode(label)
+
+    def cell_at(self, x, y):
+        """(col, row) of the cell containing pixel (x, y), or None outside the grid"""
+        if self.cell_width <= 0 or self.cell_height <= 0:
+            return None
+        col = (x - self.left) // self.cell_width
+        row = (y - self.top) // self.cell_height
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return int(col), int(row)
+        return None
+
+    def label_at(self, x, y):
+        cell = self.cell_at(x, y)
+        return None if cell is None else self.encode(*cell)
+
+    def center(self, label):
+        """(x, y) pixel center of a labelled cell, or None if the label is invalid"""
+        cell = self.decode(label)
+        if cell is None:
+            return None
+        col, row = cell
+        return int(self.center_x[col]), int(self.center_y[row])
+
+    def cell_rect(self, label):
+        """(x, y, width, height) of a labelled cell, or None if the label is invalid"""
+        cell = self.decode(label)
+        if cell is None:
+            return None
+        col, row = cell
+        return int(self.cell_x[col]), int(self.cell_y[row]), self.cell_width, self.cell_height
+
+    def labels_at_many(self, xs, ys):
+        """Vectorized pixel -> label; '' where a point falls outside the grid"""
+        xs = np.asarray(xs)
+        ys = np.asarray(ys)
+        cols = (xs - self.left) // max(self.cell_width, 1)
+        rows = (ys - self.top) // max(self.cell_height, 1)
+        inside = (cols >= 0) & (cols < self.cols) & (rows >= 0) & (rows < self.rows)
+        labels = self.labels[np.where(inside, rows, 0), np.where(inside, cols, 0)]
+        return np.where(inside, labels, "")
+
+    def centers_many(self, labels):
+        """Vectorized label -> (xs, ys, valid); invalid labels get -1 coordinates"""
+        cols, rows, valid = self.table.decode_many(labels)
+        xs = np.where(valid, self.center_x[np.where(valid, cols, 0)], -1)
+        ys = np.where(valid, self.center_y[np.where(valid, rows, 0)], -1)
+        return xs, ys, valid
+
+
+@lru_cache(maxsize=32)
+def get_codec(width, height, grid_size=40, left=0, top=0):
+    """Shared codec instance for a grid layout"""
+    return GridCodec(width, height, grid_size, left, top)
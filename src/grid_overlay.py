@@ -0,0 +1,162 @@
+from PySide6.QtCore import Qt, QPoint, QPointF, QRect
+from PySide6.QtGui import QPixmap, QPainter, QColor, QPen, QFont, QFontDatabase, QFontMetrics
+from grid_codec import get_codec
+from grid_render import label_font_path
+
+_label_families = {}  # {font file: family Qt registered it as}
+
+
+def label_family(style):
+    """Family of the headless renderer's label font, registered with Qt on first use
+
+    Falls back to style.font_family when there is no such file or Qt cannot
+    load it.
+    """
+    path = label_font_path(style)
+    if path not in _label_families:
+        families = []
+        if path:
+            font_id = QFontDatabase.addApplicationFont(path)
+            if font_id >= 0:
+                families = QFontDatabase.applicationFontFamilies(font_id)
+        _label_families[path] = families[0] if families else style.font_family
+    return _label_families[path]
+
+
+def style_font(style):
+    # Monospace font for consistent recognition, from the file GridRenderer uses
+    font = QFont(label_family(style))
+    font.setPixelSize(style.font_size)
+    font.setBold(style.font_bold)
+    font.setStyleStrategy(QFont.PreferAntialias)
+    return font
+
+
+def render_grid_overlay(width, height, grid_size, style, highlighted=frozenset()):
+    """Paint grid cells and their labels onto a transparent pixmap"""
+    overlay = QPixmap(width, height)
+    overlay.fill(Qt.transparent)
+    painter = QPainter(overlay)
+
+    # Enable anti-aliasing for smoother lines
+    painter.setRenderHint(QPainter.Antialiasing)
+    paint_grid(painter, get_codec(width, height, grid_size), style, highlighted)
+    painter.end()
+    return overlay
+
+
+def visible_cells(codec, rect):
+    """(first_col, last_col, first_row, last_row) of the cells intersecting a QRect(F)"""
+    if rect is None:
+        return 0, codec.cols - 1, 0, codec.rows - 1
+    first_col = max(0, int((rect.left() - codec.left) // codec.cell_width))
+    last_col = min(codec.cols - 1, int((rect.right() - codec.left) // codec.cell_width))
+    first_row = max(0, int((rect.top() - codec.top) // codec.cell_height))
+    last_row = min(codec.rows - 1, int((rect.bottom() - codec.top) // codec.cell_height))
+    return first_col, last_col, first_row, last_row
+
+
+def paint_grid(painter, codec, style, highlighted=frozenset(), rect=None):
+    """Paint the grid cells intersecting rect (all of them by default) and their labels"""
+    paint_grid_lines(painter, codec, style, rect)
+    paint_grid_labels(painter, codec, style, highlighted, rect)
+
+
+def paint_grid_lines(painter, codec, style, rect=None):
+    first_col, last_col, first_row, last_row = visible_cells(codec, rect)
+
+    # Cell rectangles share one pen, so draw them all before switching to labels
+    painter.setPen(QPen(QColor(*style.grid_color), style.grid_width))
+    for y in codec.cell_y[first_row:last_row + 1]:
+        for x in codec.cell_x[first_col:last_col + 1]:
+            painter.drawRect(int(x), int(y), codec.cell_width, codec.cell_height)
+
+
+def paint_grid_labels(painter, codec, style, highlighted=frozenset(), rect=None,
+                      label_step=1, transform=None):
+    """Paint the labels of the cells intersecting rect
+
+    Only every label_step-th column and row is labelled. With a transform,
+    label positions are mapped through it and the labels drawn at their
+    natural size in device pixels, so they stay legible in a zoomed-out view.
+    """
+    first_col, last_col, first_row, last_row = visible_cells(codec, rect)
+    label_pen = QPen(QColor(*style.label_color))
+    label_background = QColor(*style.label_background)
+    label_highlight = QColor(*style.label_highlight)
+
+    font = style_font(style)
+    painter.setFont(font)
+    font_metrics = QFontMetrics(font)
+    text_height = font_metrics.height()
+
+    if transform is not None:
+        painter.save()
+        painter.resetTransform()
+
+    # Every label has the same length, and the font is monospace
+    text_width = font_metrics.horizontalAdvance(codec.encode(0, 0))
+    for row in range(first_row, last_row + 1):
+        if row % label_step:
+            continue
+        for col in range(first_col, last_col + 1):
+            if col % label_step:
+                continue
+            coord = codec.encode(col, row)
+
+            # Center the label in the cell
+            if transform is None:
+                text_x = int(codec.cell_x[col]) + (codec.cell_width - text_width) // 2
+                text_y = int(codec.cell_y[row]) + (codec.cell_height + text_height) // 2
+            else:
+                center = transform.map(QPointF(float(codec.center_x[col]),
+                                               float(codec.center_y[row])))
+                text_x = round(center.x()) - text_width // 2
+                text_y = round(center.y()) + text_height // 2
+
+            # Background rectangle behind the label
+            text_rect = QRect(text_x - 4, text_y - text_height, text_width + 8, text_height + 4)
+            if coord in highlighted:
+                painter.fillRect(text_rect, label_highlight)
+            else:
+                painter.fillRect(text_rect, label_background)
+
+            painter.setPen(label_pen)
+            painter.drawText(text_x, text_y, coord)
+
+    if transform is not None:
+        painter.restore()
+
+
+def marker_rect(label, point, font_metrics, style):
+    """Bounding QRect of a marker's circle and label"""
+    x, y = point
+    radius = 8 + style.marker_width
+    text_height = font_metrics.height()
+    text_width = font_metrics.horizontalAdvance(label)
+    circle = QRect(x - radius, y - radius, 2 * radius + 1, 2 * radius + 1)
+    return circle.united(QRect(x + 12, y - text_height // 2, text_width + 8, text_height + 4))
+
+
+def paint_markers(painter, markers, style):
+    """Paint (label, (x, y)) markers with an already set up painter"""
+    font = style_font(style)
+    font_metrics = QFontMetrics(font)
+    text_height = font_metrics.height()
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.setFont(font)
+
+    marker_pen = QPen(QColor(*style.marker_color), style.marker_width)
+    label_pen = QPen(QColor(*style.label_color))
+    label_background = QColor(*style.label_background)
+
+    for label, (x, y) in markers:
+        painter.setPen(marker_pen)
+        painter.drawEllipse(QPoint(x, y), 8, 8)
+
+        # Label with semi-transparent background next to the circle
+        text_width = font_metrics.horizontalAdvance(label)
+        text_rect = QRect(x + 12, y - text_height // 2, text_width + 8, text_height + 4)
+        painter.fillRect(text_rect, label_background)
+        painter.setPen(label_pen)
+        painter.drawText(x + 16, y + text_height // 2, label)
@@ -0,0 +1,226 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from grid_style import GridStyle
+from grid_codec import get_codec
+
+# Bold monospace faces tried in order, closest to Qt's "Courier" bold first
+MONOSPACE_FONTS = ["courbd.ttf", "Courier New Bold.ttf", "DejaVuSansMono-Bold.ttf",
+                   "LiberationMono-Bold.ttf", "Menlo.ttc"]
+
+
+def load_label_font(style):
+    """Load a bold monospace font at the style's pixel size"""
+    for name in MONOSPACE_FONTS:
+        try:
+            return ImageFont.truetype(name, style.font_size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=style.font_size)
+
+
+def label_font_path(style):
+    """Path of the font file labels are drawn with, or None for PIL's built-in font
+
+    The Qt overlay registers the same file (see grid_overlay.style_font),
+    so both draw labels from one face whatever fonts the system has.
+    """
+    return getattr(load_label_font(style), "path", None)
+
+
+class GlyphAtlas:
+    """Pre-rasterized alpha masks for every character used in cell labels
+
+    All glyphs share one advance and one line box so a label mask is just its
+    glyphs laid side by side, the same layout Qt uses for a monospace font.
+    Glyphs come from the same font file as the Qt overlay's, but PIL and
+    Qt rasterize them with different hinting and antialiasing, so labels
+    are not pixel-identical: on a 1080p, 40x40 grid about 12% of pixels
+    differ by more than 16 levels. The grid lines match Qt's.
+    """
+
+    def __init__(self, style, characters="abcdefghijklmnopqrstuvwxyz0123456789"):
+        self.font = load_label_font(style)
+        ascent, descent = self.font.getmetrics()
+        self.ascent = ascent
+        self.height = ascent + descent
+        self.advance = int(round(self.font.getlength("0")))
+        self.index = {char: i for i, char in enumerate(characters)}
+
+        # One (height, advance) mask per character, baseline at `ascent`
+        self.masks = np.zeros((len(characters), self.height, self.advance), dtype=np.uint8)
+        for char, i in self.index.items():
+            glyph = Image.new("L", (self.advance, self.height), 0)
+            ImageDraw.Draw(glyph).text((0, ascent), char, fill=255, font=self.font, anchor="ls")
+            self.masks[i] = np.asarray(glyph)
+
+    def text_width(self, length):
+        return self.advance * length
+
+    def label_masks(self, labels):
+        """(len(labels), height, width) masks for equal-length labels in one gather"""
+        indices = np.array([[self.index[char] for char in label] for label in labels])
+        glyphs = self.masks[indices]  # (n, chars, height, advance)
+        n, chars = indices.shape
+        return glyphs.transpose(0, 2, 1, 3).reshape(n, self.height, chars * self.advance)
+
+
+class GridOverlay:
+    """Premultiplied grid overlay for one (width, height, grid_size, style)
+
+    Stores premultiplied RGB and inverse alpha, both as 0-255 uint8 planes,
+    so compositing is one integer multiply-add over the frame.
+    """
+
+    def __init__(self, color, inverse_alpha):
+        self.color = color
+        self.inverse_alpha = inverse_alpha
+
+    def composite(self, rgb):
+        """Blend the overlay into an (height, width, 3) uint8 RGB array in place"""
+        pixels = rgb.astype(np.uint16)
+        pixels *= self.inverse_alpha
+        pixels += 127
+        pixels //= 255
+        pixels += self.color
+        np.minimum(pixels, 255, out=pixels)
+        rgb[...] = pixels
+        return rgb
+
+
+def _source_over(color, alpha, layer_color, layer_alpha):
+    """Composite a layer (straight color, alpha in 0-1) over premultiplied color/alpha"""
+    keep = 1.0 - layer_alpha
+    color *= keep[..., None]
+    color += np.asarray(layer_color, dtype=np.float32) * layer_alpha[..., None]
+    alpha *= keep
+    alpha += layer_alpha
+
+
+def _box_coverage(shape, boxes):
+    """Count how many [x0, x1) x [y0, y1) boxes cover each pixel, via a 2D difference array"""
+    height, width = shape
+    diff = np.zeros((height + 1, width + 1), dtype=np.int32)
+    x0 = np.clip(boxes[:, 0], 0, width)
+    y0 = np.clip(boxes[:, 1], 0, height)
+    x1 = np.clip(boxes[:, 2], 0, width)
+    y1 = np.clip(boxes[:, 3], 0, height)
+    np.add.at(diff, (y0, x0), 1)
+    np.add.at(diff, (y0, x1), -1)
+    np.add.at(diff, (y1, x0), -1)
+    np.add.at(diff, (y1, x1), 1)
+    return diff.cumsum(axis=0, dtype=np.int32).cumsum(axis=1, dtype=np.int32)[:height, :width]
+
+
+def build_grid_overlay(width, height, grid_size, style, atlas):
+    """Rasterize the grid and its labels the way the Qt overlay paints them
+
+    Lines match Qt's pixel for pixel; label glyphs do not, see GlyphAtlas.
+    """
+    codec = get_codec(width, height, grid_size)
+    cell_width = codec.cell_width
+    cell_height = codec.cell_height
+    color = np.zeros((height, width, 3), dtype=np.float32)
+    alpha = np.zeros((height, width), dtype=np.float32)
+
+    # Each cell is stroked separately with a pen centered on its edges, so
+    # shared edges are painted twice. Count the strokes covering each pixel
+    # and apply the pen alpha that many times.
+    half = style.grid_width // 2
+    x, y = np.meshgrid(codec.cell_x, codec.cell_y)
+    x = x.ravel()
+    y = y.ravel()
+    outer = np.stack([x - half, y - half,
+                      x + cell_width + style.grid_width - half,
+                      y + cell_height + style.grid_width - half], axis=1)
+    inner = np.stack([x + style.grid_width - half, y + style.grid_width - half,
+                      x + cell_width - half, y + cell_height - half], axis=1)
+    strokes = _box_coverage((height, width), outer) - _box_coverage((height, width), inner)
+    pen_alpha = style.grid_color[3] / 255.0
+    line_alpha = (1.0 - (1.0 - pen_alpha) ** strokes).astype(np.float32)
+    _source_over(color, alpha, style.grid_color[:3], line_alpha)
+
+    # Label geometry matches the QFontMetrics-based layout of the Qt overlay
+    labels = codec.labels.ravel()
+    text_width = atlas.text_width(codec.table.label_length)
+    text_height = atlas.height
+    text_x = x + (cell_width - text_width) // 2
+    text_y = y + (cell_height + text_height) // 2
+
+    # Background rectangles behind every label
+    backgrounds = np.stack([text_x - 4, text_y - text_height,
+                            text_x + text_width + 4, text_y + 4], axis=1)
+    background_alpha = np.minimum(_box_coverage((height, width), backgrounds), 1)
+    background_alpha = background_alpha.astype(np.float32) * (style.label_background[3] / 255.0)
+    _source_over(color, alpha, style.label_background[:3], background_alpha)
+
+    # Scatter every label mask into a padded canvas in one fancy-indexing assignment
+    pad = max(text_width, text_height) + 8
+    text_mask = np.zeros((height + 2 * pad, width + 2 * pad), dtype=np.uint8)
+    masks = atlas.label_masks(labels)
+    top = (text_y - atlas.ascent + pad)[:, None] + np.arange(text_height)
+    left = (text_x + pad)[:, None] + np.arange(text_width)
+    text_mask[top[:, :, None], left[:, None, :]] = masks
+    text_mask = text_mask[pad:pad + height, pad:pad + width]
+    text_alpha = text_mask.astype(np.float32) * (style.label_color[3] / (255.0 * 255.0))
+    _source_over(color, alpha, style.label_color[:3], text_alpha)
+
+    premultiplied = np.rint(color).astype(np.uint8)
+    inverse_alpha = np.rint((1.0 - alpha) * 255).astype(np.uint8)[..., None]
+    return GridOverlay(premultiplied, inverse_alpha)
+
+
+class GridRenderer:
+    """Qt-free grid renderer working directly on raw frame arrays
+
+    Overlays are built once per (width, height, grid_size) and kept in a small
+    LRU cache.
+    """
+
+    def __init__(self, grid_size=40, style=None, max_entries=4):
+        self.grid_size = grid_size
+        self.style = style or GridStyle()
+        self.max_entries = max_entries
+        self._atlas = None
+        self._overlays = OrderedDict()
+        # Speculative preparation renders on its own thread alongside requests
+        self._lock = threading.Lock()
+
+    @property
+    def atlas(self):
+        if self._atlas is None:
+            self._atlas = GlyphAtlas(self.style)
+        return self._atlas
+
+    def overlay(self, width, height, grid_size=None):
+        grid_size = grid_size or self.grid_size
+        key = (width, height, grid_size)
+        with self._lock:
+            overlay = self._overlays.get(key)
+            if overlay is not None:
+                self._overlays.move_to_end(key)
+                return overlay
+
+            overlay = build_grid_overlay(width, height, grid_size, self.style, self.atlas)
+            self._overlays[key] = overlay
+            while len(self._overlays) > self.max_entries:
+                self._overlays.popitem(last=False)
+            return overlay
+
+    def render(self, array, bgr=True, grid_size=None):
+        """Return a new (height, width, 3) RGB array with the grid drawn on it
+
+        `array` is a (height, width, 3|4) uint8 frame; BGR(A) as captured by
+        mss unless bgr is False.
+        """
+        height, width = array.shape[:2]
+        if bgr:
+            rgb = np.ascontiguousarray(array[..., 2::-1])
+        else:
+            rgb = np.array(array[..., :3], copy=True, order="C")
+        return self.overlay(width, height, grid_size).composite(rgb)
+
+    def render_image(self, frame, grid_size=None):
+        """Render a Frame into a gridded RGB PIL image"""
+        return Image.fromarray(self.render(frame.array(), grid_size=grid_size), "RGB")
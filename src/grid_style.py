@@ -0,0 +1,24 @@
+class GridStyle:
+    """Colors and font used to draw the grid overlay"""
+
+    def __init__(self, grid_color=(0, 255, 255, 127), grid_width=2,
+                 label_background=(0, 0, 0, 127), label_highlight=(0, 255, 0, 127),
+                 label_color=(255, 255, 0, 127), marker_color=(255, 0, 255, 127),
+                 marker_width=3, font_family="Courier", font_size=16, font_bold=True):
+        self.grid_color = grid_color
+        self.grid_width = grid_width
+        self.label_background = label_background
+        self.label_highlight = label_highlight
+        self.label_color = label_color
+        self.marker_color = marker_color
+        self.marker_width = marker_width
+        self.font_family = font_family
+        self.font_size = font_size
+        self.font_bold = font_bold
+
+    def key(self):
+        """Hashable identity of the style, used as part of the overlay cache key"""
+        return (self.grid_color, self.grid_width, self.label_background,
+                self.label_highlight, self.label_color, self.marker_color,
+                self.marker_width, self.font_family, self.font_size, self.font_bold)
+
@@ -0,0 +1,165 @@
+import time
+from types import SimpleNamespace
+from metrics import span_or_null
+
+try:
+    from pynput.keyboard import Key
+    from pynput.mouse import Button
+except ImportError:
+    # No input backend, e.g. when replaying a session without a display;
+    # stand-in devices then get buttons and special keys by name
+    Key = None
+    Button = SimpleNamespace(left="left", right="right")
+
+# Names models use for keys that pynput calls something else
+KEY_ALIASES = {"return": "enter", "escape": "esc", "control": "ctrl", "del": "delete",
+               "pgup": "page_up", "pgdn": "page_down", "pageup": "page_up",
+               "pagedown": "page_down", "win": "cmd", "super": "cmd", "command": "cmd",
+               "option": "alt", "spacebar": "space"}
+
+
+class InputCancelled(Exception):
+    """Raised before the next mouse or keyboard action once the cancel event is set"""
+
+
+def check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise InputCancelled()
+
+
+def focus_and_click(mouse, x, y, settle=None, metrics=None, cancel=None):
+    """Move to (x, y), click once to focus the window, then click again for the action
+
+    With a SettleDetector the waits before each click last only until the
+    screen around the target is stable; without one the fixed 0.1 s and
+    0.5 s delays are used. With Metrics both waits are recorded as spans.
+    cancel is a threading.Event checked before each click, so a cancelled
+    request stops clicking instead of finishing in the background.
+    """
+    # Move mouse to position first
+    check_cancelled(cancel)
+    mouse.position = (x, y)
+    
+    # Wait for hover effects so the focus click lands on the right element
+    with span_or_null(metrics, "focus_wait"):
+        if settle:
+            settle.wait(x, y, reason="focus")
+        else:
+            time.sleep(0.1)
+    
+    # Click to focus window/element
+    check_cancelled(cancel)
+    mouse.click(Button.left)
+    
+    # Wait for the focus click to take effect before the action click
+    with span_or_null(metrics, "action_wait"):
+        if settle:
+            settle.wait(x, y, reason="action")
+        else:
+            time.sleep(0.5)
+    
+    # Perform action click
+    check_cancelled(cancel)
+    mouse.click(Button.left)
+
+
+def parse_keys(keys):
+    """pynput keys of a combination such as "enter" or "ctrl+shift+s"; raises ValueError"""
+    parsed = []
+    for part in keys.split("+"):
+        name = part.strip().lower().replace(" ", "_")
+        name = KEY_ALIASES.get(name, name)
+        if len(name) == 1 or Key is None:
+            parsed.append(name)
+        elif hasattr(Key, name):
+            parsed.append(getattr(Key, name))
+        else:
+            raise ValueError(f"Unknown key: {part.strip()!r}")
+    return parsed
+
+
+class ActionExecutor:
+    """Performs plan steps with pynput, waiting for the screen to settle after each
+
+    Points are absolute screen pixels. With focus=True a pointer step first
+    clicks once to focus the window under it, as focus_and_click does.
+    cancel is checked before every press, click and typed text, as in
+    focus_and_click; a drag in progress is released before stopping.
+    """
+
+    def __init__(self, mouse, keyboard, settle=None, metrics=None, drag_steps=10, cancel=None):
+        self.mouse = mouse
+        self.keyboard = keyboard
+        self.settle = settle
+        self.metrics = metrics
+        self.drag_steps = drag_steps
+        self.cancel = cancel
+
+    def wait(self, x, y, reason, fallback):
+        with span_or_null(self.metrics, f"{reason}_wait"):
+            if self.settle:
+                self.settle.wait(x, y, reason=reason)
+            else:
+                time.sleep(fallback)
+
+    def drag(self, start, end):
+        """Press at start, move to end in drag_steps increments, release there"""
+        self.mouse.position = start
+        self.wait(*start, "hover", 0.1)
+        check_cancelled(self.cancel)
+        self.mouse.press(Button.left)
+        try:
+            for i in range(1, self.drag_steps + 1):
+                check_cancelled(self.cancel)
+                self.mouse.position = (start[0] + (end[0] - start[0]) * i // self.drag_steps,
+                                       start[1] + (end[1] - start[1]) * i // self.drag_steps)
+                time.sleep(0.01)
+        finally:
+            self.mouse.release(Button.left)
+
+    def press(self, keys):
+        """Hold the modifiers of a combination, tap its last key, release in reverse"""
+        parsed = parse_keys(keys)
+        check_cancelled(self.cancel)
+        for key in parsed[:-1]:
+            self.keyboard.press(key)
+        try:
+            self.keyboard.press(parsed[-1])
+            self.keyboard.release(parsed[-1])
+        finally:
+            for key in reversed(parsed[:-1]):
+                self.keyboard.release(key)
+
+    def run_step(self, step, point=None, to_point=None, focus=False):
+        """Perform one PlanStep; pointer steps need point, drag also to_point"""
+        check_cancelled(self.cancel)
+        if step.is_pointer:
+            x, y = point
+            self.mouse.position = (x, y)
+            if focus:
+                self.wait(x, y, "focus", 0.1)
+                check_cancelled(self.cancel)
+                self.mouse.click(Button.left)
+            # Wait for hover effects so the click lands on the right element
+            self.wait(x, y, "hover", 0.1)
+            check_cancelled(self.cancel)
+            if step.action == "click":
+                self.mouse.click(Button.left)
+            elif step.action == "double_click":
+                self.mouse.click(Button.left, 2)
+            elif step.action == "right_click":
+                self.mouse.click(Button.right)
+            elif step.action == "drag":
+                self.drag((x, y), to_point)
+                x, y = to_point
+        elif step.action == "type":
+            self.keyboard.type(step.text)
+            x, y = self.mouse.position
+        elif step.action == "key":
+            self.press(step.keys)
+            x, y = self.mouse.position
+        else:
+            raise ValueError(f"Unknown action: {step.action}")
+
+        # Let menus open and fields update before the next step looks at the screen
+        self.wait(x, y, "step", 0.5)
@@ -0,0 +1,255 @@
+import json
+import logging
+import math
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class MarkerStore:
+    """Markers {label: (x, y)} persisted as a snapshot plus an append-only journal
+
+    Changes are appended to `<path>.journal` as JSON lines, batched and
+    written at most every flush_delay seconds, instead of rewriting the
+    whole snapshot on every click. Once the journal holds compact_after
+    entries it is folded into the snapshot. The snapshot keeps the original
+    markers.json format, {label: [x, y]}.
+
+    Points are also bucketed into bucket_size squares, so hit tests,
+    nearest-marker and rectangle queries only look at nearby buckets.
+    With path=None nothing is read or written: a scratch store in memory.
+    """
+
+    def __init__(self, path="markers.json", flush_delay=0.5, compact_after=1000, bucket_size=64):
+        self.path = path
+        self.journal_path = f"{path}.journal" if path else None
+        self.flush_delay = flush_delay
+        self.compact_after = compact_after
+        self.bucket_size = bucket_size
+        self._points = {}
+        self._buckets = {}  # (bx, by) -> set of labels
+        self._pending = []
+        self._journal_entries = 0
+        self._timer = None
+        self._lock = threading.RLock()
+        self.load()
+
+    # Mapping interface
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, label):
+        return label in self._points
+
+    def __iter__(self):
+        return iter(list(self._points))
+
+    def __getitem__(self, label):
+        return self._points[label]
+
+    def get(self, label, default=None):
+        return self._points.get(label, default)
+
+    def items(self):
+        return list(self._points.items())
+
+    # Changes
+
+    def set(self, label, x, y):
+        """Add or move a marker; returns its previous (x, y) or None"""
+        with self._lock:
+            previous = self._points.get(label)
+            self._place(label, int(x), int(y))
+            self._record({"op": "set", "label": label, "x": int(x), "y": int(y)})
+            return previous
+
+    def set_many(self, points):
+        """Add or move several markers, given as (label, x, y), in one batch"""
+        with self._lock:
+            for label, x, y in points:
+                self._place(label, int(x), int(y))
+                self._pending.append({"op": "set", "label": label, "x": int(x), "y": int(y)})
+            self._schedule_flush()
+
+    def remove(self, label):
+        """Remove a marker; returns its (x, y) or None if there was none"""
+        with self._lock:
+            point = self._unplace(label)
+            if point is not None:
+                self._record({"op": "del", "label": label})
+            return point
+
+    def clear(self):
+        with self._lock:
+            if not self._points and not self._journal_entries and not self._pending:
+                return
+            self._points.clear()
+            self._buckets.clear()
+            self._record({"op": "clear"})
+
+    def _bucket(self, x, y):
+        return x // self.bucket_size, y // self.bucket_size
+
+    def _place(self, label, x, y):
+        self._unplace(label)
+        self._points[label] = (x, y)
+        self._buckets.setdefault(self._bucket(x, y), set()).add(label)
+
+    def _unplace(self, label):
+        point = self._points.pop(label, None)
+        if point is not None:
+            key = self._bucket(*point)
+            bucket = self._buckets[key]
+            bucket.discard(label)
+            if not bucket:
+                del self._buckets[key]
+        return point
+
+    # Spatial queries
+
+    def in_rect(self, left, top, right, bottom):
+        """(label, (x, y)) of markers with left <= x < right and top <= y < bottom"""
+        found = []
+        with self._lock:
+            bx1, by1 = self._bucket(left, top)
+            bx2, by2 = self._bucket(right - 1, bottom - 1)
+            for by in range(by1, by2 + 1):
+                for bx in range(bx1, bx2 + 1):
+                    for label in self._buckets.get((bx, by), ()):
+                        x, y = self._points[label]
+                        if left <= x < right and top <= y < bottom:
+                            found.append((label, (x, y)))
+        return found
+
+    def nearest(self, x, y, max_distance=None):
+        """(label, distance) of the marker closest to (x, y), or None
+
+        Buckets are searched in growing rings around (x, y); the search stops
+        once no unsearched bucket can be closer than the best match.
+        """
+        with self._lock:
+            if not self._points:
+                return None
+            cx, cy = self._bucket(x, y)
+            best = None
+            best_distance = math.inf if max_distance is None else max_distance
+            last_ring = self._max_ring(cx, cy)
+            ring = 0
+            while ring <= last_ring:
+                # The closest point in ring r is at least (r - 1) buckets away
+                if (ring - 1) * self.bucket_size > best_distance:
+                    break
+                for bx, by in self._ring(cx, cy, ring):
+                    for label in self._buckets.get((bx, by), ()):
+                        px, py = self._points[label]
+                        distance = math.hypot(px - x, py - y)
+                        if distance <= best_distance:
+                            best, best_distance = label, distance
+                ring += 1
+            return None if best is None else (best, best_distance)
+
+    def hit_test(self, x, y, radius=10):
+        """Label of the marker drawn under (x, y), or None"""
+        match = self.nearest(x, y, max_distance=radius)
+        return None if match is None else match[0]
+
+    def _max_ring(self, cx, cy):
+        """Ring index beyond which there are no buckets at all"""
+        return max(max(abs(bx - cx), abs(by - cy)) for bx, by in self._buckets)
+
+    @staticmethod
+    def _ring(cx, cy, ring):
+        if ring == 0:
+            yield cx, cy
+            return
+        for bx in range(cx - ring, cx + ring + 1):
+            yield bx, cy - ring
+            yield bx, cy + ring
+        for by in range(cy - ring + 1, cy + ring):
+            yield cx - ring, by
+            yield cx + ring, by
+
+    # Persistence
+
+    def load(self):
+        """Read the snapshot, then replay the journal on top of it"""
+        with self._lock:
+            self._points.clear()
+            self._buckets.clear()
+            self._journal_entries = 0
+            if self.path is None:
+                return
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    for label, (x, y) in json.load(f).items():
+                        self._place(label, x, y)
+            self._journal_entries = 0
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, 'r') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # A torn last line from a crash mid-write
+                            logger.warning("skipping corrupt marker journal entry")
+                            continue
+                        self._apply(entry)
+                        self._journal_entries += 1
+
+    def _apply(self, entry):
+        if entry["op"] == "set":
+            self._place(entry["label"], entry["x"], entry["y"])
+        elif entry["op"] == "del":
+            self._unplace(entry["label"])
+        elif entry["op"] == "clear":
+            self._points.clear()
+            self._buckets.clear()
+
+    def _record(self, entry):
+        self._pending.append(entry)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self.path is None:
+            self._pending.clear()
+        elif self.flush_delay <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Append pending changes to the journal, compacting when it has grown large"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            if self._journal_entries + len(pending) >= self.compact_after:
+                self.compact()
+                return
+            with open(self.journal_path, 'a') as f:
+                f.write("".join(json.dumps(entry) + "\n" for entry in pending))
+            self._journal_entries += len(pending)
+
+    def compact(self):
+        """Rewrite the snapshot from memory and empty the journal"""
+        with self._lock:
+            self._pending.clear()
+            if self.path is None:
+                return
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump({label: list(point) for label, point in self._points.items()}, f)
+            os.replace(temp_path, self.path)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self._journal_entries = 0
+
+    def close(self):
+        self.flush()
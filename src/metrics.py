@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative bucket counts plus a rolling window of recent samples
+
+    The buckets cover every sample since start, as Prometheus expects; the
+    window of the last `window` samples gives recent percentiles.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=200):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(self.buckets) and seconds > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    def percentile(self, q):
+        """q-th percentile (0-100) of the recent window in seconds, or None when empty"""
+        if not self.recent:
+            return None
+        # Linear interpolation between closest ranks, as numpy.percentile does
+        samples = sorted(self.recent)
+        rank = (len(samples) - 1) * q / 100
+        low = int(rank)
+        high = min(low + 1, len(samples) - 1)
+        return samples[low] + (samples[high] - samples[low]) * (rank - low)
+
+
+class Span:
+    def __init__(self, name, start, thread):
+        self.name = name
+        self.start = start
+        self.duration = None
+        self.thread = thread
+        self.error = None
+
+    def to_json(self, origin):
+        span = {"name": self.name, "start_ms": round((self.start - origin) * 1000, 3),
+                "duration_ms": round((self.duration or 0.0) * 1000, 3), "thread": self.thread}
+        if self.error:
+            span["error"] = self.error
+        return span
+
+
+class Trace:
+    """Spans recorded for one action, possibly from several threads"""
+
+    def __init__(self, request):
+        self.request = request
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.status = "ok"
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def stage_totals(self):
+        """Seconds per top-level stage, in first-seen order (repeated stages add up)"""
+        totals = {}
+        for span in self.spans:
+            if "." not in span.name and span.duration is not None:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        return totals
+
+    def breakdown(self):
+        """One-line per-stage summary for the status pane"""
+        stages = " · ".join(f"{name} {seconds * 1000:.0f}"
+                            for name, seconds in self.stage_totals().items())
+        return f"{stages} | total {self.duration * 1000:.0f} ms"
+
+    def to_json(self):
+        return {"request": self.request, "started": self.started_at,
+                "total_ms": round((self.duration or 0.0) * 1000, 3), "status": self.status,
+                "spans": [span.to_json(self.start)
+                          for span in sorted(self.spans, key=lambda span: span.start)]}
+
+
+class Metrics:
+    """Span timer with per-stage rolling histograms and a JSONL action trace
+
+    `trace(request)` opens the trace of one action on the calling thread;
+    `span(name)` times a block, feeds the histogram for that name and adds
+    the span to the current trace. Spans opened inside another span are
+    named parent.child. Functions handed to other threads keep recording
+    into the same trace when wrapped with `bind`.
+    """
+
+    def __init__(self, trace_path=None, prometheus_path=None, window=200,
+                 buckets=DEFAULT_BUCKETS):
+        self.trace_path = trace_path
+        self.prometheus_path = prometheus_path
+        self.window = window
+        self.buckets = buckets
+        self.histograms = {}
+        self.actions = {}  # status -> count
+        self.last_trace = None
+        self.listeners = []  # Called with every finished Trace
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, trace_path=None):
+        """Build metrics from METRICS_* environment variables
+
+        METRICS_TRACE_PATH overrides trace_path; setting it to an empty
+        string disables the trace.
+        """
+        trace_path = os.getenv("METRICS_TRACE_PATH", trace_path)
+        return cls(trace_path=trace_path or None,
+                   prometheus_path=os.getenv("METRICS_PROMETHEUS_PATH") or None,
+                   window=int(os.getenv("METRICS_WINDOW", "200")))
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets, self.window)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def trace(self, request):
+        """Record one action; the finished trace becomes last_trace and is written out"""
+        trace = Trace(request)
+        previous = getattr(self._local, "trace", None), getattr(self._local, "parent", None)
+        self._local.trace, self._local.parent = trace, None
+        try:
+            yield trace
+        except BaseException as e:
+            trace.status = type(e).__name__
+            raise
+        finally:
+            trace.duration = time.perf_counter() - trace.start
+            self._local.trace, self._local.parent = previous
+            self.finish(trace)
+
+    @contextmanager
+    def span(self, name):
+        trace = getattr(self._local, "trace", None)
+        parent = getattr(self._local, "parent", None)
+        if parent:
+            name = f"{parent}.{name}"
+        span = Span(name, time.perf_counter(), threading.current_thread().name)
+        self._local.parent = name
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+            self._local.parent = parent
+            self.observe(name, span.duration)
+            if trace is not None:
+                trace.add(span)
+
+    def bind(self, fn):
+        """Wrap fn so it records into the caller's trace and span on whatever thread runs it"""
+        trace = getattr(self._local, "trace", None)
+        parent = getattr(self._local, "parent", None)
+
+        def bound(*args):
+            previous = getattr(self._local, "trace", None), getattr(self._local, "parent", None)
+            self._local.trace, self._local.parent = trace, parent
+            try:
+                return fn(*args)
+            finally:
+                self._local.trace, self._local.parent = previous
+        return bound
+
+    def finish(self, trace):
+        self.observe("action", trace.duration)
+        with self._lock:
+            self.actions[trace.status] = self.actions.get(trace.status, 0) + 1
+            self.last_trace = trace
+            try:
+                if self.trace_path:
+                    with open(self.trace_path, 'a') as f:
+                        f.write(json.dumps(trace.to_json()) + "\n")
+            except OSError:
+                logger.exception("failed to write action trace")
+        if self.prometheus_path:
+            self.write_prometheus(self.prometheus_path)
+        for listener in self.listeners:
+            listener(trace)
+
+    def summary(self):
+        """{name: (count, p50 seconds, p95 seconds)} over the recent window"""
+        with self._lock:
+            return {name: (h.count, h.percentile(50), h.percentile(95))
+                    for name, h in sorted(self.histograms.items())}
+
+    def prometheus_text(self):
+        """All histograms in the Prometheus text exposition format"""
+        lines = ["# HELP ai_stage_seconds Time spent per action stage",
+                 "# TYPE ai_stage_seconds histogram"]
+        recent = ["# HELP ai_stage_recent_seconds Percentiles over the recent window",
+                  "# TYPE ai_stage_recent_seconds gauge"]
+        with self._lock:
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f'ai_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'ai_stage_seconds_sum{{stage="{name}"}} {histogram.sum:.6f}')
+                lines.append(f'ai_stage_seconds_count{{stage="{name}"}} {histogram.count}')
+                for q in (50, 95):
+                    value = histogram.percentile(q)
+                    if value is not None:
+                        recent.append(f'ai_stage_recent_seconds{{stage="{name}",'
+                                      f'quantile="{q / 100:g}"}} {value:.6f}')
+            lines += ["# HELP ai_actions_total Finished actions by status",
+                      "# TYPE ai_actions_total counter"]
+            lines += [f'ai_actions_total{{status="{status}"}} {count}'
+                      for status, count in sorted(self.actions.items())]
+        return "\n".join(lines + recent) + "\n"
+
+    def write_prometheus(self, path):
+        """Write prometheus_text() to path atomically, for a textfile collector"""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_path, path)
+
+
+def span_or_null(metrics, name):
+    """metrics.span(name), or a no-op context when there is no Metrics"""
+    return metrics.span(name) if metrics is not None else nullcontext()
@@ -0,0 +1,339 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from coordinate_prompt import MODEL_NAME
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class ModelTimeout(TimeoutError):
+    """Raised when no valid answer arrived before the request's deadline"""
+
+
+class ModelBackend:
+    """A model that answers a prompt; subclasses implement generate()
+
+    generate(contents, schema=None) returns the response text. contents
+    holds prompt strings and images with plain bytes in .data and their
+    MIME type in .mime_type (upload_encoding.EncodedImage); each backend
+    converts them to its client's types. schema is a response schema the
+    answer should follow; backends without structured output ignore it
+    and rely on the prompt. generate is called
+    from pool threads, possibly concurrently, so it must be thread-safe.
+    """
+
+    name = "backend"
+
+    def generate(self, contents, schema=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ClientBackend(ModelBackend):
+    """Backend over a genai-style client: client.models.generate_content(model=, contents=)
+
+    The client is created once and shared by every request and hedge, so
+    its HTTP connections are reused.
+    """
+
+    def __init__(self, client, model=MODEL_NAME, name=None):
+        self.client = client
+        self.model = model
+        self.name = name or model
+
+    def generate(self, contents, schema=None):
+        from google.genai import types
+        contents = [part if isinstance(part, str)
+                    else types.Part.from_bytes(data=part.data, mime_type=part.mime_type)
+                    for part in contents]
+        config = None
+        if schema is not None:
+            # The API then only returns JSON matching the schema
+            config = {"response_mime_type": "application/json", "response_schema": schema}
+        return self.client.models.generate_content(model=self.model, contents=contents,
+                                                   config=config).text
+
+
+def configured_model():
+    """Model name from $MODEL_NAME, defaulting to coordinate_prompt.MODEL_NAME"""
+    return os.getenv("MODEL_NAME") or MODEL_NAME
+
+
+def gemini_backend(api_key, model=None):
+    """ClientBackend over a new genai.Client"""
+    from google import genai
+    return ClientBackend(genai.Client(api_key=api_key), model or configured_model())
+
+
+class FakeBackend(ModelBackend):
+    """Backend answering locally, for tests and benchmarks
+
+    `answer` is the response text, or a callable taking the call number
+    (0, 1, ...) and returning the text or raising. `latency` is seconds, or
+    a callable taking the call number.
+    """
+
+    def __init__(self, answer="ab02", latency=0.0, name="fake"):
+        self.answer = answer
+        self.latency = latency
+        self.name = name
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, contents, schema=None):
+        with self._lock:
+            call = self.calls
+            self.calls += 1
+        time.sleep(self.latency(call) if callable(self.latency) else self.latency)
+        return self.answer(call) if callable(self.answer) else self.answer
+
+
+class BackendStats:
+    """Latency and outcome counters of one backend"""
+
+    def __init__(self, window=200):
+        self.latency = Histogram(window=window)
+        self.requests = 0
+        self.errors = 0
+        self.invalid = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def to_json(self):
+        percentiles = {f"p{q}_ms": None if value is None else round(value * 1000, 1)
+                       for q, value in ((q, self.latency.percentile(q)) for q in (50, 95, 99))}
+        return dict(percentiles, requests=self.requests, errors=self.errors,
+                    invalid=self.invalid, hedges=self.hedges, hedge_wins=self.hedge_wins)
+
+
+class ModelCall:
+    """One backend call of a request, as passed to ModelRequester.listeners
+
+    attempt counts from 0, and hedge marks the second copy of an attempt.
+    text is the raw answer, or error what the call raised. Each attempt
+    uses at most one call: the one whose valid answer was returned or,
+    if the attempt failed, whose failure ended it. Losing hedges, calls
+    still running when the attempt ended, and failures the other copy
+    made up for have used False.
+    """
+
+    def __init__(self, backend, contents, attempt, hedge=False):
+        self.backend = backend  # Label of the backend, as in ModelRequester.summary()
+        self.contents = contents
+        self.attempt = attempt
+        self.hedge = hedge
+        self.text = None
+        self.error = None
+        self.seconds = None
+        self.used = False
+
+
+class ModelRequester:
+    """Deadline-bounded model requests with retry, jitter and hedging
+
+    Each request gets `deadline` seconds in total. An attempt that fails or
+    returns an answer `validate` rejects is retried after an exponential
+    backoff with full jitter, for up to `retries` retries.
+
+    While an attempt is in flight for longer than the hedge_percentile of
+    that backend's recent latencies (at least hedge_min_delay), a second
+    copy is sent to the next backend (or the same one if there is only
+    one). The first valid answer wins. Calls that lose, or that are still
+    running at the deadline, are abandoned on their pool thread, because a
+    blocking HTTP call cannot be interrupted from Python.
+
+    Stats are kept per backend position, so two backends for the same model
+    are told apart; summary() labels them "name#1", "name#2" and so on.
+    Every finished call is passed to each of `listeners` as a ModelCall.
+    """
+
+    def __init__(self, backends, deadline=25.0, retries=2, backoff=0.5, max_backoff=4.0,
+                 hedge_percentile=95, hedge_min_delay=0.5, max_workers=8, metrics=None):
+        self.backends = list(backends)
+        if not self.backends:
+            raise ValueError("At least one model backend is required")
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.metrics = metrics  # Optional Metrics; latencies go to "backend.<label>"
+        self.stats = [BackendStats() for _ in self.backends]
+        names = [backend.name for backend in self.backends]
+        self.labels = [name if names.count(name) == 1 else f"{name}#{names[:i + 1].count(name)}"
+                       for i, name in enumerate(names)]
+        self.requests = 0
+        self.requeries = 0  # Attempts after the first, for failed or invalid answers
+        self.listeners = []  # Called with every finished ModelCall
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, backends, metrics=None):
+        """Build a requester from MODEL_* environment variables
+
+        MODEL_HEDGE_PERCENTILE=0 turns hedging off.
+        """
+        return cls(backends,
+                   deadline=float(os.getenv("MODEL_DEADLINE", "25")),
+                   retries=int(os.getenv("MODEL_RETRIES", "2")),
+                   backoff=float(os.getenv("MODEL_BACKOFF", "0.5")),
+                   hedge_percentile=float(os.getenv("MODEL_HEDGE_PERCENTILE", "95")),
+                   hedge_min_delay=float(os.getenv("MODEL_HEDGE_MIN_DELAY", "0.5")),
+                   metrics=metrics)
+
+    def hedge_delay(self, index):
+        """Seconds to wait on backend index before sending a hedge, or None to never hedge"""
+        if not self.hedge_percentile:
+            return None
+        with self._lock:
+            recent = self.stats[index].latency.percentile(self.hedge_percentile)
+        # Without history there is nothing to compare against yet
+        if recent is None:
+            return None
+        return max(self.hedge_min_delay, recent)
+
+    def _call(self, index, call, validate, schema):
+        """One backend call; returns ("ok", value) or ("invalid" | "error", exception)"""
+        stats = self.stats[index]
+        start = time.perf_counter()
+        try:
+            text = self.backends[index].generate(call.contents, schema)
+        except Exception as e:
+            call.error, call.seconds = e, time.perf_counter() - start
+            with self._lock:
+                stats.errors += 1
+            logger.warning("%s failed: %s", self.labels[index], e)
+            return "error", e
+        seconds = time.perf_counter() - start
+        call.text, call.seconds = text, seconds
+        with self._lock:
+            stats.latency.observe(seconds)
+        if self.metrics is not None:
+            self.metrics.observe(f"backend.{self.labels[index]}", seconds)
+        try:
+            return "ok", validate(text) if validate else text
+        except ValueError as e:
+            with self._lock:
+                stats.invalid += 1
+            return "invalid", e
+
+    def _submit(self, index, call, validate, schema):
+        with self._lock:
+            self.stats[index].requests += 1
+        return self._executor.submit(self._call, index, call, validate, schema)
+
+    def _report(self, call):
+        for listener in self.listeners:
+            try:
+                listener(call)
+            except Exception:
+                logger.exception("model call listener failed")
+
+    def _attempt(self, attempt, contents, validate, schema, deadline, timeout):
+        """First valid answer of one attempt and its hedge; raises the last error if none"""
+        index = attempt % len(self.backends)
+        call = ModelCall(self.labels[index], contents, attempt)
+        futures = {self._submit(index, call, validate, schema): (index, call)}
+        finished = []  # Calls whose results were looked at, in order
+        try:
+            return self._race(index, futures, finished, attempt, contents, validate, schema,
+                              deadline, timeout)
+        finally:
+            for call in finished:
+                self._report(call)
+            # Calls still running are reported, unused, whenever they finish
+            for future, (_, call) in futures.items():
+                future.add_done_callback(lambda future, call=call: self._report(call))
+
+    def _race(self, index, futures, finished, attempt, contents, validate, schema, deadline,
+              timeout):
+        """Wait out one attempt's calls, hedging once; marks the call that decided it used"""
+        delay = self.hedge_delay(index)
+        hedge_at = None if delay is None else time.monotonic() + delay
+        error = None
+
+        while futures:
+            now = time.monotonic()
+            if now >= deadline:
+                raise ModelTimeout(f"No model answer within {timeout:.1f}s")
+            wait_for = deadline - now
+            if hedge_at is not None:
+                wait_for = max(0.0, min(wait_for, hedge_at - now))
+            done, _ = wait(futures, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            if not done and hedge_at is not None and time.monotonic() >= hedge_at:
+                # The first call is slower than usual; race a second one against it
+                hedge = (index + 1) % len(self.backends)
+                with self._lock:
+                    self.stats[hedge].hedges += 1
+                call = ModelCall(self.labels[hedge], contents, attempt, hedge=True)
+                futures[self._submit(hedge, call, validate, schema)] = (hedge, call)
+                hedge_at = None
+                continue
+
+            for future in done:
+                answered_by, call = futures.pop(future)
+                finished.append(call)
+                status, value = future.result()
+                if status == "ok":
+                    if call.hedge:
+                        with self._lock:
+                            self.stats[answered_by].hedge_wins += 1
+                    call.used = True
+                    return value
+                error = value
+        finished[-1].used = True
+        raise error
+
+    def request(self, contents, validate=None, timeout=None, schema=None):
+        """validate(text) of the first valid answer; raises ModelTimeout or the last error
+
+        validate raises ValueError for answers that should be retried.
+        timeout overrides the requester's deadline for this request and
+        schema is passed on to backends that support structured output.
+        """
+        timeout = timeout or self.deadline
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        with self._lock:
+            self.requests += 1
+        while True:
+            if attempt:
+                with self._lock:
+                    self.requeries += 1
+            try:
+                return self._attempt(attempt, contents, validate, schema, deadline, timeout)
+            except ModelTimeout:
+                raise
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise
+                # Exponential backoff with full jitter, never past the deadline
+                pause = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                if time.monotonic() + pause >= deadline:
+                    raise ModelTimeout(f"No model answer within {timeout:.1f}s") from e
+                time.sleep(pause)
+                attempt += 1
+
+    @property
+    def requery_rate(self):
+        """Re-queries per request"""
+        return self.requeries / self.requests if self.requests else 0.0
+
+    def summary(self):
+        """{backend label: latency percentiles and counters}"""
+        with self._lock:
+            return {label: stats.to_json() for label, stats in zip(self.labels, self.stats)}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        for backend in self.backends:
+            backend.close()
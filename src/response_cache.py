@@ -0,0 +1,159 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def normalize_request(request):
+    """Lowercase, collapse whitespace and drop surrounding punctuation"""
+    request = re.sub(r"\s+", " ", request.lower()).strip()
+    return request.strip(" .!?\"'")
+
+
+def frame_signature(array, tiles=(32, 18), step=4):
+    """Perceptual tile signature of a (height, width, 3|4) BGR(A) frame
+
+    The frame is subsampled every `step` pixels and averaged into a
+    tiles[0] x tiles[1] grid of luminance values, so small local changes
+    (a blinking cursor, a clock) only move one or two tiles.
+    """
+    sampled = array[::step, ::step, :3].astype(np.float32)
+    gray = sampled @ np.array([0.114, 0.587, 0.299], dtype=np.float32)  # BGR weights
+    tiles_x, tiles_y = tiles
+    height = gray.shape[0] // tiles_y * tiles_y
+    width = gray.shape[1] // tiles_x * tiles_x
+    gray = gray[:height, :width]
+    means = gray.reshape(tiles_y, height // tiles_y, tiles_x, width // tiles_x).mean(axis=(1, 3))
+    return np.rint(means).astype(np.uint8)
+
+
+def signatures_match(a, b, tolerance=0.004, tile_threshold=8):
+    """True when at most `tolerance` of the tiles differ by more than tile_threshold levels
+
+    The default allows two of the 32x18 tiles: a clock or a blinking
+    cursor. A tooltip already changes three, and a small dialog about ten.
+    """
+    if a.shape != b.shape:
+        return False
+    changed = np.abs(a.astype(np.int16) - b) > tile_threshold
+    return changed.mean() <= tolerance
+
+
+class CacheEntry:
+    def __init__(self, request, signature, size, coordinate):
+        self.request = request
+        self.signature = signature
+        self.size = tuple(size)
+        self.coordinate = coordinate
+
+    def to_json(self):
+        return {"request": self.request, "signature": self.signature.tolist(),
+                "size": list(self.size), "coordinate": self.coordinate}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["request"], np.array(data["signature"], dtype=np.uint8),
+                   data["size"], data["coordinate"])
+
+
+class ResponseCache:
+    """LRU cache of model answers keyed by (normalized request, screen state)
+
+    Two screens match when they have the same size and at most `tolerance`
+    (a fraction) of their signature tiles differ by more than
+    `tile_threshold` luminance levels.
+    """
+
+    def __init__(self, max_entries=256, tolerance=0.004, tile_threshold=8, path=None):
+        self.max_entries = max_entries
+        self.tolerance = tolerance
+        self.tile_threshold = tile_threshold
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from RESPONSE_CACHE_* environment variables"""
+        return cls(
+            max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "256")),
+            tolerance=float(os.getenv("RESPONSE_CACHE_TOLERANCE", "0.004")),
+            path=os.getenv("RESPONSE_CACHE_PATH") or None,
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hit_rate, "entries": len(self._entries)}
+
+    def matches(self, entry, signature, size):
+        return entry.size == tuple(size) and signatures_match(
+            entry.signature, signature, self.tolerance, self.tile_threshold)
+
+    def get(self, request, signature, size):
+        """Return the cached coordinate for this request and screen, or None"""
+        request = normalize_request(request)
+        with self._lock:
+            # Newest entries first so the most recent answer wins
+            for key in reversed(self._entries):
+                entry = self._entries[key]
+                if entry.request == request and self.matches(entry, signature, size):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.coordinate
+            self.misses += 1
+            return None
+
+    def put(self, request, signature, size, coordinate):
+        request = normalize_request(request)
+        with self._lock:
+            # Replace an answer for an equivalent screen instead of adding a duplicate
+            for key, entry in list(self._entries.items()):
+                if entry.request == request and self.matches(entry, signature, size):
+                    del self._entries[key]
+            self._entries[self._next_id] = CacheEntry(request, signature, size, coordinate)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self.path:
+                self._save_locked()
+
+    def invalidate(self, request):
+        """Drop every cached answer for a request (e.g. after a wrong click)"""
+        request = normalize_request(request)
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.request == request:
+                    del self._entries[key]
+            if self.path:
+                self._save_locked()
+
+    def load(self):
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        with self._lock:
+            self._entries.clear()
+            for item in data[-self.max_entries:]:
+                self._entries[self._next_id] = CacheEntry.from_json(item)
+                self._next_id += 1
+
+    def _save_locked(self):
+        # Write to a temporary file first so a crash never leaves a truncated cache
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump([entry.to_json() for entry in self._entries.values()], f)
+        os.replace(tmp_path, self.path)
@@ -1,47 +1,58 @@
 import sys
-import json
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                           QHBoxLayout, QPushButton, QLabel, QLineEdit, QScrollArea, QMessageBox)
-from PySide6.QtCore import Qt, QPoint, QRect, Signal
-from PySide6.QtGui import QPixmap, QPainter, QColor, QPen, QFont, QFontMetrics, QScreen
-from mss import mss
+                           QHBoxLayout, QPushButton, QLabel, QLineEdit, QMessageBox)
+from PySide6.QtCore import QPoint
+from PySide6.QtGui import QPixmap, QImage, QFontMetrics
 from PIL import Image
-import numpy as np
-from pynput.mouse import Controller, Button
+from pynput.mouse import Controller
 import os
-import time
-
-class ClickableLabel(QLabel):
-    clicked = Signal(QPoint)
-    
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        
-    def mousePressEvent(self, event):
-        if event.button() == Qt.LeftButton:
-            self.clicked.emit(event.position().toPoint())
+from frame import Frame
+from capture_service import CaptureSession
+from input_actions import focus_and_click
+from settle import SettleDetector
+from metrics import Metrics
+from grid_overlay import marker_rect, style_font
+from tiled_view import TiledScreenshotView
+from grid_style import GridStyle
+from grid_codec import get_codec, column_label
+from marker_store import MarkerStore
 
 class ScreenMapper(QMainWindow):
     def __init__(self):
         super().__init__()
         self.mouse = Controller()
-        self.markers = {}  # Dictionary to store markers {label: QPoint}
+        self.settle = SettleDetector.from_env()
+        self.metrics = Metrics.from_env()  # Traces only to METRICS_TRACE_PATH, if set
         self.screenshot_path = "screenshot.png"
+        self.persist_screenshot = True  # Write captures to screenshot_path in the background
+        self.frame = None  # Latest in-memory capture
+        # One mss session for every screenshot. CAPTURE_MONITOR is an mss monitor index,
+        # or "mouse" for the monitor under the pointer at each screenshot
+        self.capture = CaptureSession.from_env()
         self.markers_path = "markers.json"
+        self.saved_markers = MarkerStore(self.markers_path)  # {label: (x, y)}, journaled to disk
+        self.markers = self.saved_markers  # Or an in-memory store while the test grid is shown
         self.grid_size = 40  # 40x40 grid
         self.test_mode = False
+        self.grid_style = GridStyle()
+        self.base_image = None  # Screenshot without grid, shown in tiles by self.view
+        self.base_frame = None  # Frame whose buffer base_image points into
         
-        # Get the primary screen
+        # The primary screen's logical geometry only sizes the window
         self.screen = QApplication.primaryScreen()
-        self.screen_geometry = self.screen.geometry()
-        self.screen_size = self.screen_geometry.size()
+        self.update_screen_geometry(self.screen.geometry())
+        self.screen.geometryChanged.connect(self.update_screen_geometry)
+        
+        self.initUI()
+        
+    def update_screen_geometry(self, geometry):
+        self.screen_geometry = geometry
+        self.screen_size = geometry.size()
         
         # Store actual screen dimensions
         self.actual_width = self.screen_size.width()
         self.actual_height = self.screen_size.height()
         
-        self.initUI()
-        
     def initUI(self):
         self.setWindowTitle('Screen Mapper')
         # Set window size to match screen size
@@ -74,19 +85,11 @@ class ScreenMapper(QMainWindow):
         # Add controls to main layout
         layout.addLayout(controls_layout)
         
-        # Create scroll area for screenshot
-        scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
-        scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        scroll_area.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        
-        # Create image label
-        self.image_label = ClickableLabel(self)
-        self.image_label.clicked.connect(self.add_marker)
-        scroll_area.setWidget(self.image_label)
-        
-        # Add scroll area to main layout
-        layout.addWidget(scroll_area)
+        # Tiled, zoomable view of the screenshot; clicks arrive in image pixels
+        self.view = TiledScreenshotView(self.grid_style)
+        self.view.clicked.connect(self.add_marker)
+        self.view.right_clicked.connect(self.remove_marker)
+        layout.addWidget(self.view)
         
         # Status label
         self.status_label = QLabel("")
@@ -96,211 +99,151 @@ class ScreenMapper(QMainWindow):
         self.load_existing_data()
         
     def take_screenshot(self):
-        with mss() as sct:
-            # Get the main monitor
-            monitor = sct.monitors[1]  # Primary monitor
-            
-            # Ensure we capture the full screen
-            screenshot = sct.grab({
-                'top': 0,
-                'left': 0,
-                'width': self.actual_width,
-                'height': self.actual_height
-            })
+        # The whole monitor at its physical resolution, reusing the open capture session
+        if self.capture.follow_mouse:
+            self.capture.monitor_index = self.capture.monitor_at(*self.mouse.position)
+        self.frame = self.capture.grab()
+        
+        # Keep the raw capture in memory; the disk copy is optional and written in the background
+        if self.persist_screenshot:
+            self.frame.save_async(self.screenshot_path)
+        
+        # Clear existing markers; a screenshot goes back to the markers on disk
+        self.markers = self.saved_markers
+        self.markers.clear()
+        
+        # Display the screenshot
+        self.display_frame(self.frame)
             
-            # Convert to PIL Image
-            img = Image.frombytes('RGB', screenshot.size, screenshot.rgb)
-            img.save(self.screenshot_path)
+    def grab_region(self, left, top, width, height):
+        """Capture part of the screen as a Frame without touching the display"""
+        return self.capture.grab_region(left, top, width, height)
             
-            # Display the screenshot
-            self.display_screenshot()
-            
-            # Clear existing markers
-            self.markers.clear()
-            self.save_markers()
+    def display_frame(self, frame):
+        """Display an in-memory frame without touching the disk"""
+        # The QImage is a view of the frame's buffer, so keep the frame alive with it
+        self.base_frame = frame
+        self.draw_grid_and_markers(frame.qimage())
             
     def display_screenshot(self):
         if os.path.exists(self.screenshot_path):
-            pixmap = QPixmap(self.screenshot_path)
-            self.draw_grid_and_markers(pixmap)
-            
-    def draw_grid_and_markers(self, pixmap):
-        if not pixmap.isNull():
-            # Create a copy of the pixmap to draw on
-            drawing_pixmap = QPixmap(pixmap)
-            painter = QPainter(drawing_pixmap)
-            
-            # Enable anti-aliasing for smoother lines
-            painter.setRenderHint(QPainter.Antialiasing)
-            
-            # Set up grid properties
-            cell_width = pixmap.width() // self.grid_size
-            cell_height = pixmap.height() // self.grid_size
-            
-            # Set up painter properties for grid
-            # Using bright cyan with 50% transparency
-            grid_pen = QPen(QColor(0, 255, 255, 127), 2)  # Bright cyan, 50% transparent
-            painter.setPen(grid_pen)
-            
-            # Configure font for grid labels - using monospace for consistent recognition
-            font = QFont("Courier")  # Monospace font
-            font.setPixelSize(16)  # Larger size for better visibility
-            font.setBold(True)
-            font.setStyleStrategy(QFont.PreferAntialias)
-            painter.setFont(font)
-            font_metrics = QFontMetrics(font)
-            
-            # Draw grid cells with coordinates
-            for row in range(self.grid_size):
-                for col in range(self.grid_size):
-                    x = col * cell_width
-                    y = row * cell_height
-                    
-                    # Draw cell rectangle
-                    painter.drawRect(x, y, cell_width, cell_height)
-                    
-                    # Create cell coordinate label with consistent format
-                    coord = f"{self.get_column_label(col)}{row + 1:02d}"
-                    
-                    # Calculate text position to center it in the cell
-                    text_width = font_metrics.horizontalAdvance(coord)
-                    text_height = font_metrics.height()
-                    text_x = x + (cell_width - text_width) // 2
-                    text_y = y + (cell_height + text_height) // 2
-                    
-                    # Draw background rectangle for text
-                    text_rect = QRect(text_x - 4, text_y - text_height, text_width + 8, text_height + 4)
-                    
-                    if self.test_mode and coord in self.markers:
-                        # Use bright green with 50% transparency for valid cells in test mode
-                        painter.fillRect(text_rect, QColor(0, 255, 0, 127))  # Bright green, 50% transparent
-                    else:
-                        # Use black with 50% transparency for regular mode
-                        painter.fillRect(text_rect, QColor(0, 0, 0, 127))  # 50% transparent black
-                    
-                    # Draw coordinate text in high-contrast color with 50% transparency
-                    painter.setPen(QPen(QColor(255, 255, 0, 127)))  # Bright yellow, 50% transparent
-                    painter.drawText(text_x, text_y, coord)
-                    painter.setPen(grid_pen)  # Restore grid pen
+            self.base_frame = None
+            self.draw_grid_and_markers(QImage(self.screenshot_path))
             
-            # Draw markers
-            if not self.test_mode:
-                # Use magenta with 50% transparency for markers
-                marker_pen = QPen(QColor(255, 0, 255, 127), 3)  # Bright magenta, 50% transparent
-                painter.setPen(marker_pen)
-                
-                for label, point in self.markers.items():
-                    # Draw marker circle
-                    painter.drawEllipse(point, 8, 8)  # Larger circles for better visibility
-                    
-                    # Draw label with semi-transparent background and text
-                    text_width = font_metrics.horizontalAdvance(label)
-                    text_height = font_metrics.height()
-                    text_rect = QRect(point.x() + 12, point.y() - text_height//2,
-                                    text_width + 8, text_height + 4)
-                    
-                    painter.fillRect(text_rect, QColor(0, 0, 0, 127))  # 50% transparent black
-                    painter.setPen(QPen(QColor(255, 255, 0, 127)))  # 50% transparent yellow
-                    painter.drawText(point.x() + 16, point.y() + text_height//2, label)
+    def draw_grid_and_markers(self, image):
+        """Show image (a QImage or QPixmap) as the screenshot under the grid"""
+        if isinstance(image, QPixmap):
+            image = image.toImage()
+        if not image.isNull():
+            self.base_image = image
+            self.view.set_image(image)
+            self.refresh_display()
             
-            painter.end()
-            self.image_label.setPixmap(drawing_pixmap)
+    def refresh_display(self):
+        """Point the view's grid and markers at the current screenshot, grid size and markers"""
+        if self.base_image is None or self.base_image.isNull():
+            return
+        
+        # Test mode highlights the labels of every marker instead of drawing the markers
+        highlighted = frozenset(self.markers) if self.test_mode else frozenset()
+        self.view.set_grid(get_codec(self.base_image.width(), self.base_image.height(),
+                                     self.grid_size), highlighted)
+        self.view.set_markers(self.markers, visible=not self.test_mode)
+        
+    def marker_bounds(self, label, point):
+        return marker_rect(label, point, QFontMetrics(style_font(self.grid_style)), self.grid_style)
+        
+    def repaint_region(self, rect):
+        """Repaint only rect: the view redraws the tiles, grid and markers reaching into it"""
+        if self.base_image is None:
+            return
+        if self.test_mode:
+            self.refresh_display()
+        else:
+            self.view.update_region(rect)
             
     def get_column_label(self, index):
         """Convert numeric index to two-letter label (aa-zz)"""
-        # Format consistently for AI recognition
-        first_letter = chr(97 + (index // 26))  # a-z for first letter
-        second_letter = chr(97 + (index % 26))  # a-z for second letter
-        return f"{first_letter}{second_letter}".lower()  # Ensure lowercase
+        return column_label(index)
+        
+    def screen_codec(self):
+        """Grid codec over the screenshot in its own pixels, used for clicks"""
+        if self.base_image is not None and not self.base_image.isNull():
+            return get_codec(self.base_image.width(), self.base_image.height(), self.grid_size)
+        monitor = self.capture.monitor
+        return get_codec(monitor["width"], monitor["height"], self.grid_size)
+        
+    def to_screen(self, x, y):
+        """Screen (mouse) coordinates of screenshot pixel (x, y)"""
+        if self.base_frame is not None and self.base_frame is self.frame:
+            return self.frame.to_screen(x, y)
+        
+        # A screenshot loaded from disk is taken to show the whole configured monitor
+        monitor = self.capture.monitor
+        scale = self.base_image.width() / monitor["width"]
+        return monitor["left"] + round(x / scale), monitor["top"] + round(y / scale)
             
     def get_grid_coordinates(self, pos):
         """Convert pixel position to grid coordinates"""
-        if not hasattr(self, 'image_label') or not self.image_label.pixmap():
+        if self.base_image is None:
             return None
             
-        cell_width = self.image_label.pixmap().width() // self.grid_size
-        cell_height = self.image_label.pixmap().height() // self.grid_size
-        
-        col = pos.x() // cell_width
-        row = pos.y() // cell_height
-        
-        if 0 <= col < self.grid_size and 0 <= row < self.grid_size:
-            return f"{self.get_column_label(col)}{row + 1:02d}"  # Two digits with leading zero
-        return None
+        codec = get_codec(self.base_image.width(), self.base_image.height(), self.grid_size)
+        return codec.label_at(pos.x(), pos.y())
         
     def get_grid_center(self, coord):
         """Convert grid coordinates to pixel position"""
-        if not self.image_label.pixmap():
+        if self.base_image is None:
             return None
             
-        # Convert to lowercase and remove any whitespace
-        coord = coord.lower().strip()
-        
-        # Check format: should be 4 characters (2 letters + 2 numbers)
-        if len(coord) != 4:
-            return None
-            
-        letters = coord[:2]
-        numbers = coord[2:]
-            
-        try:
-            # Validate letters are a-z
-            if not (letters[0].isalpha() and letters[1].isalpha()):
-                return None
-                
-            # Calculate column index
-            first_letter_val = ord(letters[0]) - 97
-            second_letter_val = ord(letters[1]) - 97
-            col = first_letter_val * 26 + second_letter_val
-            
-            # Parse row number (1-40)
-            row = int(numbers) - 1
-            
-            # Validate ranges
-            if not (0 <= col < self.grid_size and 0 <= row < self.grid_size):
-                return None
-            if not (1 <= int(numbers) <= 40):
-                return None
-                
-            # Calculate actual screen position
-            cell_width = self.actual_width // self.grid_size
-            cell_height = self.actual_height // self.grid_size
-            
-            # Return center of the cell in actual screen coordinates
-            x = (col * cell_width) + (cell_width // 2)
-            y = (row * cell_height) + (cell_height // 2)
-            return QPoint(x, y)
-                
-        except (ValueError, IndexError):
+        # Center of the cell in screenshot pixels, then in screen coordinates
+        center = self.screen_codec().center(coord)
+        if center is None:
             return None
+        return QPoint(*self.to_screen(*center))
+        
+    def showing_test_grid(self):
+        """Whether the scratch test markers are shown; markers are only placed on screenshots"""
+        if self.markers is self.saved_markers:
+            return False
+        self.status_label.setText("Take a screenshot to place markers")
+        return True
         
     def add_marker(self, pos):
+        if self.showing_test_grid():
+            return
         grid_coord = self.get_grid_coordinates(pos)
         if grid_coord:
-            self.markers[grid_coord] = pos
-            self.save_markers()
-            self.display_screenshot()
+            point = (pos.x(), pos.y())
+            previous = self.markers.set(grid_coord, *point)
+            
+            # Repaint only where the marker was and where it is now
+            dirty = self.marker_bounds(grid_coord, point)
+            if previous is not None:
+                dirty = dirty.united(self.marker_bounds(grid_coord, previous))
+            self.repaint_region(dirty)
+            
+    def remove_marker(self, pos):
+        """Remove the marker under pos, if any"""
+        if self.showing_test_grid():
+            return
+        radius = 8 + self.grid_style.marker_width
+        label = self.markers.hit_test(pos.x(), pos.y(), radius)
+        if label is not None:
+            point = self.markers.remove(label)
+            self.repaint_region(self.marker_bounds(label, point))
             
     def execute_command(self):
         """Execute click at the specified coordinate"""
         coord = self.command_input.text().strip().lower()
-        point = self.get_grid_center(coord)
+        with self.metrics.trace(coord):
+            with self.metrics.span("lookup"):
+                point = self.get_grid_center(coord)
+            if point:
+                with self.metrics.span("click"):
+                    focus_and_click(self.mouse, point.x(), point.y(), settle=self.settle,
+                                    metrics=self.metrics)
         if point:
-            # Move mouse to position first
-            self.mouse.position = (point.x(), point.y())
-            
-            # Wait briefly to ensure proper window focus
-            time.sleep(0.1)
-            
-            # Click to focus window/element
-            self.mouse.click(Button.left)
-            
-            # Wait half a second before actual action click
-            time.sleep(0.5)
-            
-            # Perform action click
-            self.mouse.click(Button.left)
-            
             self.command_input.clear()
         else:
             # Show error message for invalid coordinate
@@ -309,60 +252,45 @@ class ScreenMapper(QMainWindow):
                               "Format should be: aann\n" +
                               "where:\n" +
                               "- aa is two letters (a-z)\n" +
-                              "- nn is two digits (01-40)\n" +
-                              "Examples: aa01, ab40, zz20")
+                              f"- nn is two digits (01-{self.grid_size:02d})\n" +
+                              f"Examples: aa01, ab{self.grid_size:02d}, zz20")
             
     def save_markers(self):
-        markers_dict = {label: (point.x(), point.y()) for label, point in self.markers.items()}
-        with open(self.markers_path, 'w') as f:
-            json.dump(markers_dict, f)
+        """Write pending marker changes now instead of after the debounce delay"""
+        self.saved_markers.flush()
             
     def load_existing_data(self):
-        if os.path.exists(self.markers_path):
-            with open(self.markers_path, 'r') as f:
-                markers_dict = json.load(f)
-                self.markers = {label: QPoint(x, y) for label, (x, y) in markers_dict.items()}
-        
+        # Markers were already loaded from markers.json and its journal by the store
         if os.path.exists(self.screenshot_path):
             self.display_screenshot()
 
     def test_grid(self):
         """Test all grid coordinates systematically"""
         self.test_mode = True
-        self.markers.clear()
+        
+        # Test markers live in memory only, so the saved markers are left alone
+        self.markers = MarkerStore(None)
         
         # Create a test image with white background
-        test_image = Image.new('RGB', (1920, 1080), 'white')
-        test_image.save(self.screenshot_path)
+        test_frame = Frame.from_pil(Image.new('RGB', (1920, 1080), 'white'))
         
         # Display the test grid
-        self.display_screenshot()
-        
-        # Test each coordinate
-        invalid_coords = []
-        valid_coords = []
-        total_coords = self.grid_size * self.grid_size
-        processed = 0
-        
-        # Test all possible combinations
-        for row in range(1, 41):
-            for col in range(self.grid_size):
-                coord = f"{self.get_column_label(col)}{row:02d}"  # Two digits with leading zero
-                point = self.get_grid_center(coord)
-                if point is None:
-                    invalid_coords.append(coord)
-                else:
-                    valid_coords.append(coord)
-                processed += 1
-                self.status_label.setText(f"Testing coordinates: {processed}/{total_coords}")
-                QApplication.processEvents()
+        self.display_frame(test_frame)
+        
+        # Decode every label in one vectorized pass, then check that each
+        # center maps back to the label it came from
+        codec = self.screen_codec()
+        labels = codec.labels.ravel()
+        xs, ys, valid = codec.centers_many(labels)
+        valid &= codec.labels_at_many(xs, ys) == labels
+        invalid_coords = [str(label) for label in labels[~valid]]
+        valid_coords = [str(label) for label in labels[valid]]
         
         # Add all valid coordinates to markers for display
-        for coord in valid_coords:
-            self.markers[coord] = self.get_grid_center(coord)
+        self.markers.set_many(zip(valid_coords, xs[valid], ys[valid]))
         
         # Display results
-        self.display_screenshot()
+        self.refresh_display()
         
         if invalid_coords:
             QMessageBox.warning(self, "Test Results", 
@@ -370,16 +298,21 @@ class ScreenMapper(QMainWindow):
                               ", ".join(invalid_coords))
         else:
             QMessageBox.information(self, "Test Results", 
-                                  f"All coordinates are valid!\n" +
+                                  "All coordinates are valid!\n" +
                                   f"Tested {len(valid_coords)} coordinates\n" +
-                                  "Format: aann (aa=letters, nn=01-40)\n" +
-                                  "Examples: aa01, ab40, zz20")
+                                  f"Format: aann (aa=letters, nn=01-{self.grid_size:02d})\n" +
+                                  f"Examples: aa01, ab{self.grid_size:02d}, zz20")
         
         self.test_mode = False
         self.status_label.setText("Grid test completed")
+        
+    def closeEvent(self, event):
+        self.save_markers()
+        self.capture.close()
+        super().closeEvent(event)
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     ex = ScreenMapper()
     ex.show()
-    sys.exit(app.exec()) 
\ No newline at end of file
+    sys.exit(app.exec())
\ No newline at end of file
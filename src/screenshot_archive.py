@@ -0,0 +1,184 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+import numpy as np
+from PIL import Image, ImageDraw
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"png": "png", "jpeg": "jpg", "webp": "webp"}
+
+
+class ScreenshotArchive:
+    """Background writer for action screenshots
+
+    Each action is stored as a small JSON sidecar (request, coordinate,
+    highlight box) pointing at its original screenshot. Originals are named
+    by content hash, so identical screens are written once. Writing happens
+    on a worker thread, and the oldest actions are pruned once max_count
+    sidecars or max_bytes on disk are exceeded.
+    """
+
+    def __init__(self, directory, format="png", compress_level=6, quality=90,
+                 max_count=None, max_bytes=None, metrics=None):
+        format = format.lower()
+        if format == "jpg":
+            format = "jpeg"
+        if format not in EXTENSIONS:
+            raise ValueError(f"Unsupported archive format: {format}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.format = format
+        self.compress_level = compress_level
+        self.quality = quality
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.metrics = metrics  # Optional Metrics; write times go to "archive_write"
+
+        # Sidecars oldest first, and how many sidecars reference each original
+        self._sidecars = []
+        self._references = {}
+        self._sizes = {}
+        self._scan()
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="screenshot-archive", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, directory, metrics=None):
+        """Build an archive from ARCHIVE_* environment variables"""
+        def optional_int(name):
+            value = os.getenv(name)
+            return int(value) if value else None
+
+        return cls(
+            directory,
+            format=os.getenv("ARCHIVE_FORMAT", "png"),
+            compress_level=int(os.getenv("ARCHIVE_COMPRESS_LEVEL", "6")),
+            quality=int(os.getenv("ARCHIVE_QUALITY", "90")),
+            max_count=optional_int("ARCHIVE_MAX_COUNT"),
+            max_bytes=optional_int("ARCHIVE_MAX_BYTES"),
+            metrics=metrics,
+        )
+
+    def _scan(self):
+        """Index sidecars and originals already on disk"""
+        for path in sorted(self.directory.glob("screenshot_*.json")):
+            try:
+                with open(path, 'r') as f:
+                    original = json.load(f)["original"]
+            except (OSError, ValueError, KeyError):
+                continue
+            self._sidecars.append((path, original))
+            self._references[original] = self._references.get(original, 0) + 1
+            self._sizes[path.name] = path.stat().st_size
+        for path in self.directory.glob("original_*"):
+            self._sizes[path.name] = path.stat().st_size
+
+    def submit(self, image, annotation):
+        """Queue an image and its annotation dict; returns immediately"""
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        self._queue.put((timestamp, image, annotation))
+
+    def flush(self):
+        """Block until every queued screenshot has been written"""
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                started = time.perf_counter()
+                self._write(*item)
+                self._enforce_retention()
+                if self.metrics is not None:
+                    self.metrics.observe("archive_write", time.perf_counter() - started)
+            except Exception:
+                logger.exception("failed to archive screenshot")
+            finally:
+                self._queue.task_done()
+
+    def _save_original(self, image, path):
+        if self.format == "png":
+            image.save(path, "PNG", compress_level=self.compress_level)
+        elif self.format == "jpeg":
+            image.save(path, "JPEG", quality=self.quality)
+        else:
+            image.save(path, "WEBP", quality=self.quality)
+
+    def _write(self, timestamp, image, annotation):
+        # Identical screens share one original
+        digest = hashlib.sha1(image.tobytes()).hexdigest()[:20]
+        original = f"original_{digest}.{EXTENSIONS[self.format]}"
+        original_path = self.directory / original
+        if not original_path.exists():
+            self._save_original(image, original_path)
+            self._sizes[original] = original_path.stat().st_size
+
+        sidecar_path = self.directory / f"screenshot_{timestamp}.json"
+        with open(sidecar_path, 'w') as f:
+            json.dump(dict(annotation, timestamp=timestamp, original=original,
+                           size=[image.width, image.height]), f)
+        self._sizes[sidecar_path.name] = sidecar_path.stat().st_size
+        self._sidecars.append((sidecar_path, original))
+        self._references[original] = self._references.get(original, 0) + 1
+
+    def total_bytes(self):
+        return sum(self._sizes.values())
+
+    def _enforce_retention(self):
+        while self._sidecars and (
+                (self.max_count and len(self._sidecars) > self.max_count) or
+                (self.max_bytes and self.total_bytes() > self.max_bytes)):
+            sidecar_path, original = self._sidecars.pop(0)
+            self._remove(sidecar_path)
+            self._references[original] -= 1
+            if self._references[original] <= 0:
+                del self._references[original]
+                self._remove(self.directory / original)
+
+    def _remove(self, path):
+        self._sizes.pop(path.name, None)
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def render_annotated(sidecar_path):
+    """Rebuild the annotated screenshot for an archived action from its sidecar"""
+    sidecar_path = Path(sidecar_path)
+    with open(sidecar_path, 'r') as f:
+        annotation = json.load(f)
+    image = Image.open(sidecar_path.parent / annotation["original"]).convert("RGB")
+
+    # Raw captures (answers that needed no upload) get their grid drawn here
+    if not annotation.get("gridded", True):
+        from grid_render import GridRenderer
+        gridded = GridRenderer(annotation["grid_size"]).render(np.asarray(image), bgr=False)
+        image = Image.fromarray(gridded, "RGB")
+    draw = ImageDraw.Draw(image)
+
+    # Draw highlight box (semi-transparent red)
+    x1, y1, x2, y2 = annotation["box"]
+    draw.rectangle([x1, y1, x2, y2], outline=(255, 0, 0), width=3)
+    draw.rectangle([x1+1, y1+1, x2-1, y2-1], fill=(255, 0, 0, 64))
+
+    # Add annotation text
+    text = f"Request: {annotation['request']}\nCoordinate: {annotation['coordinate']}"
+    draw.text((10, 10), text, fill=(255, 0, 0), stroke_width=2, stroke_fill=(255, 255, 255))
+    return image
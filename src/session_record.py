@@ -0,0 +1,295 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import queue
+import shutil
+import threading
+import time
+import zlib
+from pathlib import Path
+import numpy as np
+from frame import Frame
+
+logger = logging.getLogger(__name__)
+
+SESSION_VERSION = 1
+
+# One fixed-size record per frame in frames.idx; scale is Frame.scale
+FRAME_INDEX = np.dtype([("offset", "<u8"), ("length", "<u4"), ("keyframe", "u1"),
+                        ("width", "<u2"), ("height", "<u2"), ("left", "<i4"), ("top", "<i4"),
+                        ("scale", "<f4")])
+
+
+def input_name(value):
+    """Name of a pynput button or key ("left", "enter"), or the character itself"""
+    return getattr(value, "name", None) or str(value)
+
+
+def prompt_key(contents):
+    """Short hash of the text parts of a model request, which identifies it across runs"""
+    text = "\n".join(part for part in contents if isinstance(part, str))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class SessionRecorder:
+    """Writes a session directory: delta-compressed frames plus a JSONL event log
+
+    Every captured frame is XORed with the one before it and compressed
+    with zlib, so unchanged pixels cost next to nothing. Every
+    keyframe_interval-th frame, and any frame whose size changed, is
+    stored whole, so a reader never decodes more than that many frames to
+    reach one. Events (requests, model answers, input, stage timings)
+    carry the seconds since the session started and refer to frames by
+    index. Request events are numbered, and every model call is logged
+    with the number of the request it was made for. Compression and
+    writing happen on a background thread.
+    """
+
+    def __init__(self, directory, keyframe_interval=30, level=1):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.keyframe_interval = keyframe_interval
+        self.level = level
+        self.frames = 0
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._start = time.perf_counter()
+        self._previous = None
+        self._offset = 0
+        self._lock = threading.Lock()
+
+        with open(self.directory / "session.json", 'w') as f:
+            json.dump({"version": SESSION_VERSION, "started": time.time(),
+                       "keyframe_interval": keyframe_interval}, f)
+        self._frames_file = open(self.directory / "frames.bin", 'wb')
+        self._index_file = open(self.directory / "frames.idx", 'wb')
+        self._events_file = open(self.directory / "events.jsonl", 'w')
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="session-recorder", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, directory):
+        """Recorder for a new session under SESSION_RECORD_PATH or directory, or None
+
+        Recording is off unless SESSION_RECORD=1.
+        """
+        if os.getenv("SESSION_RECORD", "0").lower() not in ("1", "true", "yes"):
+            return None
+        base = Path(os.getenv("SESSION_RECORD_PATH") or directory)
+        return cls(base / time.strftime("session_%Y%m%d_%H%M%S"),
+                   keyframe_interval=int(os.getenv("SESSION_KEYFRAME_INTERVAL", "30")))
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def snapshot(self, name, path):
+        """Copy a file or directory as it is now into the session's state/, for replays
+
+        Replays start from this state, so answers that came from memory
+        while recording come from memory again.
+        """
+        path = Path(path)
+        target = self.directory / "state" / name
+        if path.is_dir():
+            shutil.copytree(path, target, dirs_exist_ok=True)
+        elif path.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(path, target)
+
+    def frame(self, frame):
+        """Queue a Frame for writing; returns its index in the session"""
+        # The capture thread reuses its buffers, so the pixels are copied now
+        raw = bytes(frame.raw)
+        with self._lock:
+            index = self.frames
+            self.frames += 1
+            self._queue.put(("frame", (index, raw, frame.width, frame.height,
+                                       frame.left, frame.top, frame.scale)))
+            self._queue.put(("event", {"type": "frame", "t": round(self.elapsed(), 6),
+                                       "index": index}))
+        return index
+
+    def event(self, type, **fields):
+        """Queue one event for the log; request events get the next request index"""
+        with self._lock:
+            if type == "request":
+                fields["index"] = self.requests
+                self.requests += 1
+            self._queue.put(("event", dict(type=type, t=round(self.elapsed(), 6), **fields)))
+
+    def model_call(self, call):
+        """Log a finished model_backend.ModelCall; a ModelRequester listener
+
+        The request's calls are reported before it finishes, so they are
+        logged under its index. Unused calls that finish later may land
+        under the next one, which is harmless: replays only serve used calls.
+        """
+        fields = {"answer": call.text} if call.error is None else {"error": str(call.error)}
+        with self._lock:
+            request_index = self.requests - 1
+        self.event("model", request_index=request_index, attempt=call.attempt, hedge=call.hedge,
+                   used=call.used, backend=call.backend, prompt=prompt_key(call.contents),
+                   seconds=round(call.seconds or 0.0, 6), **fields)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            kind, payload = item
+            try:
+                if kind == "frame":
+                    self._write_frame(*payload)
+                else:
+                    self._events_file.write(json.dumps(payload) + "\n")
+                    self._events_file.flush()
+            except Exception:
+                logger.exception("failed to record %s", kind)
+
+    def _write_frame(self, index, raw, width, height, left, top, scale):
+        current = np.frombuffer(raw, dtype=np.uint8)
+        keyframe = (self._previous is None or self._previous.shape != current.shape
+                    or index % self.keyframe_interval == 0)
+        data = zlib.compress(current if keyframe else np.bitwise_xor(current, self._previous),
+                             self.level)
+        record = np.array([(self._offset, len(data), keyframe, width, height, left, top, scale)],
+                          dtype=FRAME_INDEX)
+        self._frames_file.write(data)
+        self._index_file.write(record.tobytes())
+        self._frames_file.flush()
+        self._index_file.flush()
+        self._offset += len(data)
+        self._previous = current
+        self.bytes_in += len(raw)
+        self.bytes_out += len(data)
+
+    def close(self):
+        """Write everything queued and close the files"""
+        self._queue.put(None)
+        self._thread.join()
+        for f in (self._frames_file, self._index_file, self._events_file):
+            f.close()
+
+
+class SessionReader:
+    """Random access to a recorded session's frames, and its events
+
+    frames.bin is memory-mapped, so only the frames actually decoded are
+    read from disk. The last decoded frame is kept, which makes reading
+    frames in order cost one delta each.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.state = self.directory / "state"  # Snapshots taken when recording started
+        with open(self.directory / "session.json", 'r') as f:
+            self.meta = json.load(f)
+        self.index = np.fromfile(self.directory / "frames.idx", dtype=FRAME_INDEX)
+        self.events = []
+        with open(self.directory / "events.jsonl", 'r') as f:
+            for line in f:
+                if line.strip():
+                    self.events.append(json.loads(line))
+
+        self._file = open(self.directory / "frames.bin", 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._cached = None  # (index, flat uint8 array)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _payload(self, i):
+        entry = self.index[i]
+        start = int(entry["offset"])
+        return np.frombuffer(zlib.decompress(self._map[start:start + int(entry["length"])]),
+                             dtype=np.uint8)
+
+    def pixels(self, i):
+        """Flat BGRA bytes of frame i as a uint8 array"""
+        if not 0 <= i < len(self.index):
+            raise IndexError(f"Frame {i} not in session ({len(self.index)} frames)")
+        if self._cached is not None and self._cached[0] == i:
+            return self._cached[1]
+
+        # Start from the nearest keyframe, or from the cached frame if it is on the way
+        start = i
+        while not self.index[start]["keyframe"]:
+            start -= 1
+        if self._cached is not None and start <= self._cached[0] < i:
+            start, pixels = self._cached[0] + 1, self._cached[1]
+        else:
+            pixels = self._payload(start)
+            start += 1
+        for j in range(start, i + 1):
+            pixels = np.bitwise_xor(pixels, self._payload(j))
+        self._cached = (i, pixels)
+        return pixels
+
+    def frame(self, i):
+        """Frame i as a Frame with its own buffer"""
+        entry = self.index[i]
+        return Frame(bytearray(self.pixels(i)), int(entry["width"]), int(entry["height"]),
+                     int(entry["left"]), int(entry["top"]), scale=float(entry["scale"]))
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+class RecordingMouse:
+    """pynput mouse wrapper that logs clicks, presses and releases with their position"""
+
+    def __init__(self, mouse, recorder):
+        self.mouse = mouse
+        self.recorder = recorder
+
+    @property
+    def position(self):
+        return self.mouse.position
+
+    @position.setter
+    def position(self, point):
+        self.mouse.position = point
+
+    def _log(self, type, button, **fields):
+        x, y = self.mouse.position
+        self.recorder.event(type, x=int(x), y=int(y), button=input_name(button), **fields)
+
+    def click(self, button, count=1):
+        self._log("click", button, count=count)
+        self.mouse.click(button, count)
+
+    def press(self, button):
+        self._log("press", button)
+        self.mouse.press(button)
+
+    def release(self, button):
+        self._log("release", button)
+        self.mouse.release(button)
+
+
+class RecordingKeyboard:
+    """pynput keyboard wrapper that logs typed text and keys"""
+
+    def __init__(self, keyboard, recorder):
+        self.keyboard = keyboard
+        self.recorder = recorder
+
+    def type(self, text):
+        self.recorder.event("type", text=text)
+        self.keyboard.type(text)
+
+    def press(self, key):
+        self.recorder.event("key_press", key=input_name(key))
+        self.keyboard.press(key)
+
+    def release(self, key):
+        self.recorder.event("key_release", key=input_name(key))
+        self.keyboard.release(key)
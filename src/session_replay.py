@@ -0,0 +1,281 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from frame import Frame
+from model_backend import ModelBackend
+from session_record import SessionReader, input_name, prompt_key
+
+# Replays run offscreen with fresh caches, and retries and hedges that do not depend on timing
+REPLAY_ENV = {
+    "QT_QPA_PLATFORM": "offscreen",
+    "RESPONSE_CACHE_PATH": "",
+    "VISUAL_MEMORY_PATH": "",
+    "METRICS_TRACE_PATH": "",
+    "SPECULATIVE_PREP": "0",
+    "SESSION_RECORD": "0",
+    "MODEL_HEDGE_PERCENTILE": "0",
+    "MODEL_BACKOFF": "0",
+}
+
+
+class ReplayCapture:
+    """CaptureSession stand-in serving a session's frames
+
+    queue() lines up the frames one request captured; grab() hands them
+    out in order and keeps returning the last one if the replay captures
+    more often than the recording did. Every frame counts as being of
+    monitor 1, whichever monitor it was recorded from.
+    """
+
+    monitor_index = 1
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.current = 0
+        self._pending = deque()
+        self._lock = threading.Lock()
+
+    def queue(self, indices):
+        with self._lock:
+            self._pending = deque(indices)
+
+    @property
+    def monitor(self):
+        entry = self.reader.index[self.current]
+        scale = float(entry["scale"])
+        return {"left": int(entry["left"]), "top": int(entry["top"]),
+                "width": round(int(entry["width"]) / scale),
+                "height": round(int(entry["height"]) / scale)}
+
+    def grab(self, monitor_index=None):
+        with self._lock:
+            if self._pending:
+                self.current = self._pending.popleft()
+            return self.reader.frame(self.current)
+
+    def grab_region(self, left, top, width, height):
+        """Part of the current frame; coordinates are relative to the monitor"""
+        frame = self.reader.frame(self.current)
+        right, bottom = min(left + width, frame.width), min(top + height, frame.height)
+        left, top = max(0, left), max(0, top)
+        if right <= left or bottom <= top:
+            raise ValueError(f"Region {(left, top, width, height)} is outside the monitor")
+        array = frame.array()[top:bottom, left:right]
+        return Frame(bytearray(array.tobytes()), right - left, bottom - top,
+                     *frame.to_screen(left, top), scale=frame.scale)
+
+    def close(self):
+        pass
+
+
+class ReplayBackend(ModelBackend):
+    """Answers each prompt with the answers one request used, in attempt order
+
+    queue() lines up the model events of the request about to be replayed;
+    only calls that decided an attempt are served, so lost hedges and
+    abandoned calls never answer a later request. With latency=True each
+    answer takes as long as it did when recorded; otherwise it is
+    immediate, so only local work is timed.
+    """
+
+    name = "replay"
+
+    def __init__(self, latency=False):
+        self.latency = latency
+        self._answers = {}
+        self._lock = threading.Lock()
+
+    def queue(self, events):
+        answers = {}
+        for event in sorted((event for event in events if event["used"]),
+                            key=lambda event: event["attempt"]):
+            answers.setdefault(event["prompt"], deque()).append(event)
+        with self._lock:
+            self._answers = answers
+
+    def generate(self, contents, schema=None):
+        key = prompt_key(contents)
+        with self._lock:
+            recorded = self._answers.get(key)
+            event = recorded.popleft() if recorded else None
+        if event is None:
+            raise LookupError(f"No recorded answer left for prompt {key}")
+        if self.latency:
+            time.sleep(event["seconds"])
+        if "error" in event:
+            raise RuntimeError(event["error"])
+        return event["answer"]
+
+
+class ReplayMouse:
+    """pynput mouse stand-in collecting click, press and release events"""
+
+    def __init__(self):
+        self.position = (0, 0)
+        self.events = []
+
+    def _log(self, type, button, **fields):
+        x, y = self.position
+        self.events.append(dict(type=type, x=int(x), y=int(y), button=input_name(button), **fields))
+
+    def click(self, button, count=1):
+        self._log("click", button, count=count)
+
+    def press(self, button):
+        self._log("press", button)
+
+    def release(self, button):
+        self._log("release", button)
+
+
+class ReplayKeyboard:
+    """pynput keyboard stand-in collecting typed text and keys"""
+
+    def __init__(self):
+        self.events = []
+
+    def type(self, text):
+        self.events.append({"type": "type", "text": text})
+
+    def press(self, key):
+        self.events.append({"type": "key_press", "key": input_name(key)})
+
+    def release(self, key):
+        self.events.append({"type": "key_release", "key": input_name(key)})
+
+
+class InstantSettle:
+    """SettleDetector stand-in; recorded frames never change while waiting"""
+
+    def wait(self, x, y, max_wait=None, reason="settle"):
+        return 0.0
+
+
+KEYBOARD_EVENTS = ("type", "key_press", "key_release")
+INPUT_EVENTS = ("click", "press", "release") + KEYBOARD_EVENTS
+
+
+def by_device(events):
+    """(mouse events, keyboard events), each in order"""
+    return ([event for event in events if event["type"] not in KEYBOARD_EVENTS],
+            [event for event in events if event["type"] in KEYBOARD_EVENTS])
+
+
+def split_requests(events):
+    """[(request event, frame indices, input events, model events, result event)] in order
+
+    Model events are those logged with the request's index, wherever they
+    fall in the log.
+    """
+    requests = []
+    models = {}  # request index -> model events
+    for event in events:
+        if event["type"] == "request":
+            requests.append((event, [], [], models.setdefault(event["index"], []), None))
+        elif event["type"] == "model":
+            models.setdefault(event["request_index"], []).append(event)
+        elif requests:
+            request, frames, inputs, calls, result = requests[-1]
+            if event["type"] == "frame":
+                frames.append(event["index"])
+            elif event["type"] in INPUT_EVENTS:
+                inputs.append({key: value for key, value in event.items() if key != "t"})
+            elif event["type"] == "result" and result is None:
+                requests[-1] = (request, frames, inputs, calls, event)
+    return requests
+
+
+def replay(directory, latency=False):
+    """Run every recorded request again against the recorded frames and answers
+
+    Returns one dict per request with its recorded and replayed result,
+    whether the input sent matched the recording, and the stage timings.
+    """
+    from ai_controller import AIController
+    os.environ.update(REPLAY_ENV)
+    reader = SessionReader(directory)
+    if not len(reader):
+        reader.close()
+        return []
+    capture = ReplayCapture(reader)
+    mouse = ReplayMouse()
+    keyboard = ReplayKeyboard()
+    workdir = Path(tempfile.mkdtemp(prefix="replay_"))
+    
+    # Start from the memory and cache the recording started with
+    if (reader.state / "visual_memory").is_dir():
+        shutil.copytree(reader.state / "visual_memory", workdir / "visual_memory")
+    if (reader.state / "response_cache.json").exists():
+        shutil.copy2(reader.state / "response_cache.json", workdir / "response_cache.json")
+        os.environ["RESPONSE_CACHE_PATH"] = str(workdir / "response_cache.json")
+    backend = ReplayBackend(latency)
+    controller = AIController(show_window=False, screenshots_dir=workdir,
+                              backends=[backend],
+                              capture=capture, mouse=mouse, keyboard=keyboard,
+                              settle=InstantSettle())
+    results = []
+    try:
+        for request, frames, inputs, calls, recorded in split_requests(reader.events):
+            capture.queue(frames)
+            backend.queue(calls)
+            mouse.events.clear()
+            keyboard.events.clear()
+            execute = controller.execute_plan if request.get("plan") else controller.execute_action
+            start = time.perf_counter()
+            try:
+                result, error = execute(request["request"]), None
+            except Exception as e:
+                result, error = None, str(e)
+            seconds = time.perf_counter() - start
+            trace = controller.metrics.last_trace
+            results.append({
+                "request": request["request"],
+                "recorded": recorded and recorded.get("result"),
+                "replayed": result,
+                "error": error,
+                "input_matches": (mouse.events, keyboard.events) == by_device(inputs),
+                "ms": round(seconds * 1000, 1),
+                "breakdown": trace.breakdown() if trace is not None else "",
+            })
+    finally:
+        controller.shutdown()
+        reader.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded AI controller session offline")
+    parser.add_argument("session", help="session directory written with SESSION_RECORD=1")
+    parser.add_argument("--latency", action="store_true",
+                        help="wait as long for each model answer as the recording did")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = replay(args.session, latency=args.latency)
+    diverged = [result for result in results
+                if result["error"] or result["replayed"] != result["recorded"]
+                or not result["input_matches"]]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            status = "ok" if result not in diverged else "DIVERGED"
+            print(f"{status:8s} {result['ms']:8.1f} ms  {result['request']!r}: "
+                  f"recorded {result['recorded']}, replayed {result['replayed'] or result['error']}")
+            print(f"         {result['breakdown']}")
+        print(f"{len(results) - len(diverged)}/{len(results)} requests replayed identically")
+    sys.exit(1 if diverged else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import logging
+import os
+import threading
+import time
+import numpy as np
+from mss import mss
+
+logger = logging.getLogger(__name__)
+
+
+class SettleDetector:
+    """Waits until the screen around a point stops changing
+
+    A (2 * radius)-pixel square around the target is polled every
+    poll_interval seconds. The wait ends once stable_polls consecutive
+    frames differ from the previous one by at most `threshold` (mean
+    absolute difference per channel), or once max_wait has passed. It never
+    ends before min_wait.
+    """
+
+    def __init__(self, min_wait=0.03, max_wait=1.0, stable_polls=2, threshold=2.0,
+                 radius=48, poll_interval=0.03):
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.stable_polls = stable_polls
+        self.threshold = threshold
+        self.radius = radius
+        self.poll_interval = poll_interval
+        # mss handles are not shareable across threads, so keep one per thread
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls):
+        """Build a detector from SETTLE_* environment variables"""
+        return cls(
+            min_wait=float(os.getenv("SETTLE_MIN", "0.03")),
+            max_wait=float(os.getenv("SETTLE_MAX", "1.0")),
+            stable_polls=int(os.getenv("SETTLE_STABLE_POLLS", "2")),
+            threshold=float(os.getenv("SETTLE_THRESHOLD", "2.0")),
+        )
+
+    def _sct(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = self._local.sct = mss()
+        return sct
+
+    def grab_around(self, x, y):
+        """BGRA array of the square around (x, y), clipped to the virtual screen"""
+        sct = self._sct()
+        screen = sct.monitors[0]
+        left = max(screen["left"], x - self.radius)
+        top = max(screen["top"], y - self.radius)
+        right = min(screen["left"] + screen["width"], x + self.radius)
+        bottom = min(screen["top"] + screen["height"], y + self.radius)
+        shot = sct.grab({"left": left, "top": top,
+                         "width": max(1, right - left), "height": max(1, bottom - top)})
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    def wait(self, x, y, max_wait=None, reason="settle"):
+        """Block until the area around (x, y) is stable; returns the seconds waited"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        start = time.monotonic()
+        time.sleep(self.min_wait)
+
+        previous = self.grab_around(x, y)
+        stable = 0
+        while time.monotonic() - start < max_wait:
+            time.sleep(self.poll_interval)
+            current = self.grab_around(x, y)
+            difference = np.abs(current.astype(np.int16) - previous).mean()
+            if difference <= self.threshold:
+                stable += 1
+                if stable >= self.stable_polls:
+                    break
+            else:
+                stable = 0
+            previous = current
+
+        waited = time.monotonic() - start
+        logger.info("%s: waited %.0f ms at (%d, %d)%s", reason, waited * 1000, x, y,
+                    "" if stable >= self.stable_polls else " (deadline)")
+        return waited
@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+import time
+from capture_service import tile_changes
+from response_cache import signatures_match
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedFrame:
+    """Capture, gridded image and upload encoding of one screen state"""
+
+    def __init__(self, frame, signature, grid_size, image, encoded):
+        self.frame = frame
+        self.signature = signature
+        self.grid_size = grid_size
+        self.image = image
+        self.encoded = encoded
+        self.prepared_at = time.monotonic()
+
+
+class Speculator:
+    """Prepares the next upload in the background while a request is typed
+
+    schedule() is called on every edit of the request field. Once typing
+    pauses for `debounce` seconds, prepare() captures, grids and encodes the
+    screen. When the request is submitted, take() hands over that work if
+    the screen still matches the fresh capture's signature, and otherwise
+    returns None so the request prepares its own.
+
+    Screens match as in ResponseCache, but with a tighter default
+    tolerance: the model should see what is on screen now. When both frames
+    come from a running CaptureService its tile hashes decide instead, with
+    the same tolerance as a fraction of tiles.
+    """
+
+    def __init__(self, prepare, debounce=0.15, tolerance=0.01, tile_threshold=4):
+        self.prepare = prepare
+        self.debounce = debounce
+        self.tolerance = tolerance
+        self.tile_threshold = tile_threshold
+        self.hits = 0
+        self.misses = 0
+        self._prepared = None
+        self._timer = None
+        self._running = False
+        self._again = False
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls, prepare):
+        """Build a speculator from SPECULATIVE_* environment variables, or None if disabled"""
+        if os.getenv("SPECULATIVE_PREP", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(prepare,
+                   debounce=float(os.getenv("SPECULATIVE_DEBOUNCE", "0.15")),
+                   tolerance=float(os.getenv("SPECULATIVE_TOLERANCE", "0.01")))
+
+    def schedule(self):
+        """(Re)start the debounce timer; called whenever the request text changes"""
+        with self._condition:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self._run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        """Stop a pending preparation and drop the prepared frame"""
+        with self._condition:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._again = False
+            self._prepared = None
+            self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        """Block until no preparation is pending or running; False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._timer is None and not self._running, timeout)
+
+    def _run(self):
+        with self._condition:
+            if self._timer is not threading.current_thread():
+                # Superseded by a newer schedule() or cancelled while firing
+                return
+            self._timer = None
+            if self._running:
+                # The screen may have changed since that run started; go again after it
+                self._again = True
+                return
+            self._running = True
+        try:
+            while True:
+                try:
+                    prepared = self.prepare()
+                except Exception:
+                    logger.exception("speculative preparation failed")
+                    prepared = None
+                with self._condition:
+                    self._prepared = prepared
+                    if not self._again:
+                        break
+                    self._again = False
+        finally:
+            with self._condition:
+                self._running = False
+                self._condition.notify_all()
+
+    def same_screen(self, prepared, signature, frame=None):
+        changed = tile_changes(prepared.frame, frame) if frame is not None else None
+        if changed is not None:
+            return changed.mean() <= self.tolerance
+        return signatures_match(prepared.signature, signature, self.tolerance,
+                                self.tile_threshold)
+
+    def take(self, signature, size, grid_size, timeout=1.0, frame=None):
+        """The prepared frame if it still shows this screen, else None
+
+        A preparation that is already running is waited for (up to timeout),
+        since it started earlier than the caller could. frame is the fresh
+        capture, if the caller has it, for comparing tile hashes.
+        """
+        with self._condition:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._condition.wait_for(lambda: not self._running, timeout)
+            prepared = self._prepared
+            usable = (prepared is not None and prepared.grid_size == grid_size
+                      and prepared.frame.size == tuple(size)
+                      and self.same_screen(prepared, signature, frame))
+            if usable:
+                self.hits += 1
+            else:
+                self.misses += 1
+                # Stale work is dropped rather than offered to the next request
+                self._prepared = None
+            return prepared if usable else None
@@ -0,0 +1,45 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """Timeline of named startup steps, relative to when the profile was created
+
+    Steps may run on several threads (the window comes up on the main
+    thread while clients and caches warm up in the background); each step
+    records its thread so the report shows what overlapped.
+    """
+
+    def __init__(self, origin=None):
+        self.origin = origin if origin is not None else time.perf_counter()
+        self.steps = []
+        self._lock = threading.Lock()
+
+    def record(self, name, start, end):
+        with self._lock:
+            self.steps.append((name, start - self.origin, end - start,
+                               threading.current_thread().name))
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def mark(self, name):
+        """Zero-length step: a point in time such as 'window shown'"""
+        now = time.perf_counter()
+        self.record(name, now, now)
+
+    def report(self):
+        lines = [f"{'step':32s} {'start ms':>9s} {'took ms':>9s}  thread"]
+        for name, start, duration, thread in sorted(self.steps, key=lambda step: step[1]):
+            lines.append(f"{name:32s} {start * 1000:9.1f} {duration * 1000:9.1f}  {thread}")
+        return "\n".join(lines)
+
+    def print_report(self, file=None):
+        print(self.report(), file=file or sys.stderr)
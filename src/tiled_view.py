@@ -0,0 +1,310 @@
+import math
+from collections import OrderedDict
+from PySide6.QtCore import Qt, QPoint, QRect, QRectF, Signal
+from PySide6.QtGui import QPainter, QPixmap, QFontMetrics, QTransform
+from PySide6.QtWidgets import QGraphicsItem, QGraphicsScene, QGraphicsView
+from grid_overlay import paint_grid_lines, paint_grid_labels, paint_markers, marker_rect, style_font
+
+
+class TileCache:
+    """Pixmaps of screenshot tiles, created on first paint and evicted LRU
+
+    Only tiles that actually get painted are converted and uploaded, and at
+    most max_tiles are kept, so memory no longer grows with the screenshot.
+    Zoomed out, tiles are stored downscaled by 2**level, so a fully
+    zoomed-out 8K screenshot costs little more than the window it fills.
+    """
+
+    def __init__(self, max_tiles=64):
+        self.max_tiles = max_tiles
+        self._pixmaps = OrderedDict()
+
+    def clear(self):
+        self._pixmaps.clear()
+
+    def __len__(self):
+        return len(self._pixmaps)
+
+    def pixmap(self, image, rect, level=0):
+        key = (rect.x(), rect.y(), level)
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+            return pixmap
+
+        tile = image.copy(rect)
+        if level:
+            tile = tile.scaled(max(1, rect.width() >> level), max(1, rect.height() >> level),
+                               Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        pixmap = QPixmap.fromImage(tile)
+        self._pixmaps[key] = pixmap
+        while len(self._pixmaps) > self.max_tiles:
+            self._pixmaps.popitem(last=False)
+        return pixmap
+
+
+class ImageTile(QGraphicsItem):
+    """One tile_size square of the screenshot"""
+
+    def __init__(self, image, rect, cache):
+        super().__init__()
+        self.image = image
+        self.rect = rect
+        self.cache = cache
+        self.setPos(rect.x(), rect.y())
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.rect.width(), self.rect.height())
+
+    def paint(self, painter, option, widget=None):
+        # Halve the tile once per halving of the zoom, down to 1/8
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = min(3, max(0, int(math.log2(1 / scale)))) if scale < 1 else 0
+        pixmap = self.cache.pixmap(self.image, self.rect, level)
+        if level:
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.drawPixmap(self.boundingRect(), pixmap, QRectF(pixmap.rect()))
+
+
+class GridItem(QGraphicsItem):
+    """Grid lines and labels, painted only over the exposed part of the scene
+
+    At 100% zoom and above labels are drawn at the grid's own scale. When
+    zoomed out they keep their natural size on screen and are thinned out
+    to every n-th row and column so they never overlap.
+
+    Up to 100% zoom the grid is painted once per tile_size square and zoom
+    into a transparent pixmap, kept LRU like the screenshot tiles, so
+    scrolling and repaints after marker changes only blit. Zoomed in, few
+    cells are visible and they are stroked directly.
+    """
+
+    def __init__(self, style, tile_size=512, max_tiles=64):
+        super().__init__()
+        self.style = style
+        self.codec = None
+        self.highlighted = frozenset()
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()  # (x, y, zoom) -> QPixmap for the current grid
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setZValue(1)
+
+    def boundingRect(self):
+        if self.codec is None:
+            return QRectF()
+        return QRectF(0, 0, self.codec.width, self.codec.height)
+
+    def set_grid(self, codec, highlighted=frozenset()):
+        # Codecs are shared per layout, so an unchanged grid keeps its tiles
+        if codec is self.codec and highlighted == self.highlighted:
+            return
+        self.prepareGeometryChange()
+        self.codec = codec
+        self.highlighted = highlighted
+        self._tiles.clear()
+        self.update()
+
+    def label_step(self, scale):
+        """Label every n-th cell so labels of natural size fit at this zoom"""
+        if scale >= 1:
+            return 1
+        font_metrics = QFontMetrics(style_font(self.style))
+        label_width = font_metrics.horizontalAdvance(self.codec.encode(0, 0)) + 8
+        label_height = font_metrics.height() + 4
+        return max(1, math.ceil(label_width / (self.codec.cell_width * scale)),
+                   math.ceil(label_height / (self.codec.cell_height * scale)))
+
+    def paint_cells(self, painter, rect, scale):
+        """Stroke the grid and labels reaching into rect with a painter at this zoom"""
+        painter.setRenderHint(QPainter.Antialiasing)
+        # Zoomed-out labels would otherwise spill past the screenshot's edges
+        painter.setClipRect(self.boundingRect().intersected(QRectF(rect)))
+        paint_grid_lines(painter, self.codec, self.style, rect)
+
+        # Labels are centered in their cells and may reach label_step cells into neighbours
+        step = self.label_step(scale)
+        labels_rect = rect.adjusted(-step * self.codec.cell_width, -step * self.codec.cell_height,
+                                    step * self.codec.cell_width, step * self.codec.cell_height)
+        if scale >= 1:
+            paint_grid_labels(painter, self.codec, self.style, self.highlighted, labels_rect)
+        else:
+            paint_grid_labels(painter, self.codec, self.style, self.highlighted, labels_rect,
+                              label_step=step, transform=painter.worldTransform())
+
+    def tile(self, x, y, scale):
+        """Pixmap of the grid over the tile at (x, y), rendered at zoom scale on first use"""
+        zoom = round(scale, 4)
+        key = (x, y, zoom)
+        pixmap = self._tiles.get(key)
+        if pixmap is not None:
+            self._tiles.move_to_end(key)
+            return pixmap
+
+        rect = QRect(x, y, min(self.tile_size, self.codec.width - x),
+                     min(self.tile_size, self.codec.height - y))
+        pixmap = QPixmap(max(1, math.ceil(rect.width() * zoom)),
+                         max(1, math.ceil(rect.height() * zoom)))
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        painter.scale(zoom, zoom)
+        painter.translate(-x, -y)
+        self.paint_cells(painter, QRectF(rect), zoom)
+        painter.end()
+
+        self._tiles[key] = pixmap
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return pixmap
+
+    def paint(self, painter, option, widget=None):
+        if self.codec is None or self.codec.cell_width <= 0 or self.codec.cell_height <= 0:
+            return
+        exposed = option.exposedRect
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        if scale > 1:
+            self.paint_cells(painter, exposed, scale)
+            return
+
+        size = self.tile_size
+        first_x = max(0, int(exposed.left()) // size * size)
+        first_y = max(0, int(exposed.top()) // size * size)
+        for y in range(first_y, min(self.codec.height, math.ceil(exposed.bottom())), size):
+            for x in range(first_x, min(self.codec.width, math.ceil(exposed.right())), size):
+                width = min(size, self.codec.width - x)
+                height = min(size, self.codec.height - y)
+                zoom = round(scale, 4)
+                painter.drawPixmap(QRectF(x, y, width, height), self.tile(x, y, scale),
+                                   QRectF(0, 0, width * zoom, height * zoom))
+
+
+class MarkerItem(QGraphicsItem):
+    """Markers from a MarkerStore; only those reaching into the exposed area are painted"""
+
+    def __init__(self, style):
+        super().__init__()
+        self.style = style
+        self.markers = None
+        self.size = None
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setZValue(2)
+
+    def boundingRect(self):
+        if self.size is None:
+            return QRectF()
+        return QRectF(0, 0, self.size.width(), self.size.height())
+
+    def set_markers(self, markers, size):
+        self.prepareGeometryChange()
+        self.markers = markers
+        self.size = size
+        self.update()
+
+    def paint(self, painter, option, widget=None):
+        if not self.markers:
+            return
+        # Markers are drawn to the right of their point, so look a marker's extent around rect
+        exposed = option.exposedRect.toAlignedRect()
+        sample = next(iter(self.markers))
+        extent = marker_rect(sample, (0, 0), QFontMetrics(style_font(self.style)), self.style)
+        candidates = self.markers.in_rect(exposed.left() - extent.right(),
+                                          exposed.top() - extent.bottom(),
+                                          exposed.right() - extent.left() + 1,
+                                          exposed.bottom() - extent.top() + 1)
+        paint_markers(painter, candidates, self.style)
+
+
+class TiledScreenshotView(QGraphicsView):
+    """Zoomable screenshot view that only converts and paints visible tiles
+
+    Clicks are reported in image pixel coordinates regardless of zoom and
+    scroll position. Ctrl+wheel zooms around the cursor, Ctrl+0 returns to
+    100% and Ctrl+F fits the whole screenshot in the window.
+    """
+
+    clicked = Signal(QPoint)
+    right_clicked = Signal(QPoint)
+
+    def __init__(self, style, tile_size=512, max_tiles=160, parent=None):
+        super().__init__(parent)
+        self.tile_size = tile_size
+        self.tiles = TileCache(max_tiles)
+        self.image = None
+        self.tile_items = []
+        self.setScene(QGraphicsScene(self))
+        self.grid_item = GridItem(style)
+        self.marker_item = MarkerItem(style)
+        self.scene().addItem(self.grid_item)
+        self.scene().addItem(self.marker_item)
+
+        self.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+        # The scene is a few large items; skip the BSP index
+        self.scene().setItemIndexMethod(QGraphicsScene.NoIndex)
+
+    def set_image(self, image):
+        """Show a new screenshot (QImage); tiles are converted lazily as they are painted"""
+        for item in self.tile_items:
+            self.scene().removeItem(item)
+        self.tiles.clear()
+        self.image = image
+        self.tile_items = []
+        for y in range(0, image.height(), self.tile_size):
+            for x in range(0, image.width(), self.tile_size):
+                rect = QRect(x, y, min(self.tile_size, image.width() - x),
+                             min(self.tile_size, image.height() - y))
+                item = ImageTile(image, rect, self.tiles)
+                self.scene().addItem(item)
+                self.tile_items.append(item)
+        self.scene().setSceneRect(QRectF(0, 0, image.width(), image.height()))
+
+    def set_grid(self, codec, highlighted=frozenset()):
+        self.grid_item.set_grid(codec, highlighted)
+
+    def set_markers(self, markers, visible=True):
+        self.marker_item.set_markers(markers, self.image.size() if self.image else None)
+        self.marker_item.setVisible(visible)
+
+    def update_region(self, rect):
+        """Repaint only rect (image coordinates), e.g. after a marker moved"""
+        self.scene().update(QRectF(rect))
+
+    def zoom(self):
+        return self.transform().m11()
+
+    def set_zoom(self, scale):
+        scale = min(8.0, max(0.05, scale))
+        self.setTransform(QTransform.fromScale(scale, scale))
+
+    def fit(self):
+        if self.image is not None:
+            self.fitInView(self.scene().sceneRect(), Qt.KeepAspectRatio)
+
+    def wheelEvent(self, event):
+        if event.modifiers() & Qt.ControlModifier:
+            factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+            self.set_zoom(self.zoom() * factor)
+        else:
+            super().wheelEvent(event)
+
+    def keyPressEvent(self, event):
+        if event.modifiers() & Qt.ControlModifier and event.key() == Qt.Key_0:
+            self.set_zoom(1.0)
+        elif event.modifiers() & Qt.ControlModifier and event.key() == Qt.Key_F:
+            self.fit()
+        else:
+            super().keyPressEvent(event)
+
+    def mousePressEvent(self, event):
+        if self.image is None:
+            return
+        point = self.mapToScene(event.position().toPoint())
+        pos = QPoint(math.floor(point.x()), math.floor(point.y()))
+        if not self.image.rect().contains(pos):
+            return
+        if event.button() == Qt.LeftButton:
+            self.clicked.emit(pos)
+        elif event.button() == Qt.RightButton:
+            self.right_clicked.emit(pos)
@@ -0,0 +1,143 @@
+import math
+import os
+import time
+from io import BytesIO
+from PIL import Image
+
+MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+
+class EncodingConfig:
+    """How gridded screenshots are encoded before they are sent to the model
+
+    max_long_edge, max_pixels and max_bytes are optional budgets. Downscaling
+    never goes below the scale at which grid labels (label_height px tall at
+    full resolution) would shrink under min_label_height px, so the model can
+    still read them; a budget that would require that is left unmet.
+    """
+
+    def __init__(self, format="png", quality=85, min_quality=40, png_compress_level=1,
+                 max_long_edge=None, max_pixels=None, max_bytes=None,
+                 label_height=16, min_label_height=10):
+        format = format.lower()
+        if format == "jpg":
+            format = "jpeg"
+        if format not in MIME_TYPES:
+            raise ValueError(f"Unsupported upload format: {format}")
+        self.format = format
+        self.quality = quality
+        self.min_quality = min_quality
+        self.png_compress_level = png_compress_level
+        self.max_long_edge = max_long_edge
+        self.max_pixels = max_pixels
+        self.max_bytes = max_bytes
+        self.label_height = label_height
+        self.min_label_height = min_label_height
+
+    @classmethod
+    def from_env(cls):
+        """Build a config from UPLOAD_* environment variables"""
+        def optional_int(name):
+            value = os.getenv(name)
+            return int(value) if value else None
+
+        return cls(
+            format=os.getenv("UPLOAD_FORMAT", "png"),
+            quality=int(os.getenv("UPLOAD_QUALITY", "85")),
+            max_long_edge=optional_int("UPLOAD_MAX_EDGE"),
+            max_pixels=optional_int("UPLOAD_MAX_PIXELS"),
+            max_bytes=optional_int("UPLOAD_MAX_BYTES"),
+            min_label_height=int(os.getenv("UPLOAD_MIN_LABEL_PX", "10")),
+        )
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES[self.format]
+
+    @property
+    def min_scale(self):
+        return min(1.0, self.min_label_height / self.label_height)
+
+    def target_scale(self, width, height):
+        """Largest scale that satisfies the edge and pixel budgets"""
+        scale = 1.0
+        if self.max_long_edge:
+            scale = min(scale, self.max_long_edge / max(width, height))
+        if self.max_pixels:
+            scale = min(scale, math.sqrt(self.max_pixels / (width * height)))
+        return max(scale, self.min_scale)
+
+
+class EncodedImage:
+    """Encoded upload payload plus the stats of how it was produced
+
+    It goes into a model request's contents as it is; see ModelBackend.
+    """
+
+    def __init__(self, data, mime_type, width, height, source_size, quality, encode_ms):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.source_size = source_size
+        self.quality = quality
+        self.encode_ms = encode_ms
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def __str__(self):
+        quality = f" q{self.quality}" if self.quality is not None else ""
+        return (f"{self.mime_type.split('/')[1]}{quality} {self.width}x{self.height}, "
+                f"{self.size / 1024:.0f} KB in {self.encode_ms:.0f} ms")
+
+
+def _save(image, config, quality):
+    buffer = BytesIO()
+    if config.format == "png":
+        image.save(buffer, "PNG", compress_level=config.png_compress_level)
+    elif config.format == "jpeg":
+        # 4:4:4 keeps the thin colored label strokes readable
+        image.save(buffer, "JPEG", quality=quality, subsampling=0)
+    else:
+        image.save(buffer, "WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def _resize(image, scale):
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.BICUBIC, reducing_gap=2.0)
+
+
+def encode_image(image, config):
+    """Encode a PIL image for upload according to config"""
+    start = time.perf_counter()
+    source_size = image.size
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    lossy = config.format != "png"
+    quality = config.quality if lossy else None
+
+    scale = config.target_scale(image.width, image.height)
+    scaled = _resize(image, scale) if scale < 1.0 else image
+    data = _save(scaled, config, quality)
+
+    # Byte budget: lower quality first, then shrink while labels stay legible
+    while config.max_bytes and len(data) > config.max_bytes:
+        if lossy and quality > config.min_quality:
+            quality = max(config.min_quality, quality - 10)
+        elif scale * 0.85 >= config.min_scale:
+            scale *= 0.85
+            scaled = _resize(image, scale)
+        else:
+            break
+        data = _save(scaled, config, quality)
+
+    encode_ms = (time.perf_counter() - start) * 1000
+    return EncodedImage(data, config.mime_type, scaled.width, scaled.height,
+                        source_size, quality, encode_ms)
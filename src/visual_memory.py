@@ -0,0 +1,333 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+import numpy as np
+from response_cache import normalize_request
+
+logger = logging.getLogger(__name__)
+
+
+def grayscale(array, step=1):
+    """float32 luminance of a (height, width, 3|4) BGR(A) array, averaged over step x step blocks
+
+    Averaging rather than picking every step-th pixel keeps thin details
+    such as text strokes from aliasing away.
+    """
+    height = array.shape[0] // step * step
+    width = array.shape[1] // step * step
+    # Sum the step x step phases of the subsampled grid, then convert the small result
+    blocks = np.zeros((height // step, width // step, 3), dtype=np.float32)
+    for dy in range(step):
+        for dx in range(step):
+            blocks += array[dy:height:step, dx:width:step, :3]
+    weights = np.array([0.114, 0.587, 0.299], dtype=np.float32) / (step * step)
+    return blocks @ weights
+
+
+def _fft_size(n):
+    """Smallest 2**a * 3**b * 5**c >= n; FFTs of these lengths are fast"""
+    best = 1 << max(0, (n - 1).bit_length())
+    power3 = 1
+    while power3 < best:
+        power5 = power3
+        while power5 < best:
+            size = power5
+            while size < n:
+                size *= 2
+            best = min(best, size)
+            power5 *= 5
+        power3 *= 3
+    return best
+
+
+def _window_sums(image, height, width):
+    """Sum over every height x width window of image, from an integral image"""
+    integral = np.zeros((image.shape[0] + 1, image.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(image, axis=0, dtype=np.float64), axis=1, out=integral[1:, 1:])
+    return (integral[height:, width:] - integral[:-height, width:]
+            - integral[height:, :-width] + integral[:-height, :-width])
+
+
+def match_template(image, template):
+    """Normalized cross-correlation of template at every position inside image
+
+    Returns a (H - h + 1, W - w + 1) array in [-1, 1], where entry (y, x)
+    scores the template placed with its top-left corner at (x, y). The
+    correlation runs through one FFT product and the per-window means and
+    variances come from integral images, so the cost does not depend on
+    the template size.
+    """
+    height, width = template.shape
+    if image.shape[0] < height or image.shape[1] < width:
+        return np.zeros((0, 0), dtype=np.float32)
+    template = template - template.mean()
+    template_norm = np.sqrt(np.sum(template * template))
+
+    shape = (_fft_size(image.shape[0] + height - 1), _fft_size(image.shape[1] + width - 1))
+    spectrum = np.fft.rfft2(image, shape) * np.fft.rfft2(template[::-1, ::-1], shape)
+    correlation = np.fft.irfft2(spectrum, shape)[height - 1:image.shape[0],
+                                                 width - 1:image.shape[1]]
+
+    # The template has zero mean, so the window's own mean drops out of the numerator
+    count = height * width
+    sums = _window_sums(image, height, width)
+    squares = _window_sums(image * image, height, width)
+    variance = np.maximum(squares - sums * sums / count, 0.0)
+    denominator = np.sqrt(variance) * template_norm
+    scores = np.zeros(correlation.shape, dtype=np.float32)
+    # Flat windows (and flat templates) cannot be told apart from each other
+    valid = denominator > 1e-3 * count
+    scores[valid] = correlation[valid] / denominator[valid]
+    return scores
+
+
+def peaks(scores, shape, threshold, count):
+    """Up to count (x, y, score) maxima of scores at least threshold, best first
+
+    Each peak masks out a window of the template's shape around itself, so
+    the next one is a separate placement rather than a shifted copy.
+    """
+    if scores.size == 0:
+        return []
+    scores = scores.copy()
+    height, width = shape
+    found = []
+    while len(found) < count:
+        y, x = np.unravel_index(np.argmax(scores), scores.shape)
+        score = float(scores[y, x])
+        if score < threshold or score <= -1.0:
+            break
+        found.append((int(x), int(y), score))
+        scores[max(0, y - height // 2):y + height // 2 + 1,
+               max(0, x - width // 2):x + width // 2 + 1] = -1.0
+    return found
+
+
+class Patch:
+    """Image patch around a point that was clicked for a request"""
+
+    def __init__(self, id, pixels, x, y, size):
+        self.id = id
+        self.pixels = pixels  # uint8 luminance
+        self.x = x  # Frame pixel the click went to
+        self.y = y
+        self.size = tuple(size)  # Frame size it was taken from
+
+    def to_json(self):
+        return {"id": self.id, "x": self.x, "y": self.y, "size": list(self.size)}
+
+
+class Match:
+    def __init__(self, x, y, score, runner_up):
+        self.x = x
+        self.y = y
+        self.score = score
+        self.runner_up = runner_up
+
+    def __str__(self):
+        text = f"({self.x}, {self.y}) score {self.score:.3f}"
+        if self.runner_up > -1.0:
+            text += f", next best {self.runner_up:.3f}"
+        return text
+
+
+class VisualMemory:
+    """Patches around past clicks, keyed by normalized request, matched by NCC
+
+    After a click the luminance of the patch_radius square around the
+    clicked point is kept. On a later request the newest patches for the
+    same request are matched against the current frame with normalized
+    cross-correlation: first within search_radius of where they were last
+    found, then over the whole frame. The whole-frame pass runs on a copy
+    block-averaged down to about full_width pixels wide, and its best few
+    spots are refined at full resolution. A match counts when it scores at
+    least `threshold` and beats the best match elsewhere by `margin`, so a
+    request that fits several identical buttons is left to the model.
+
+    Patches live in `directory` as .npy files with an index.json.
+    """
+
+    def __init__(self, directory, patch_radius=32, threshold=0.9, margin=0.05,
+                 search_radius=256, max_per_request=4, full_width=960, coarse_slack=0.15,
+                 max_candidates=3):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.directory / "index.json"
+        self.patch_radius = patch_radius
+        self.threshold = threshold
+        self.margin = margin
+        self.search_radius = search_radius
+        self.max_per_request = max_per_request
+        self.full_width = full_width
+        self.coarse_slack = coarse_slack
+        self.max_candidates = max_candidates
+        self.hits = 0
+        self.misses = 0
+        self._patches = {}  # normalized request -> [Patch], newest last
+        self._lock = threading.Lock()
+        self.load()
+
+    @classmethod
+    def from_env(cls, directory):
+        """Build a memory from VISUAL_MEMORY_* environment variables, or None if disabled"""
+        if os.getenv("VISUAL_MEMORY", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(os.getenv("VISUAL_MEMORY_PATH") or directory,
+                   threshold=float(os.getenv("VISUAL_MEMORY_THRESHOLD", "0.9")),
+                   margin=float(os.getenv("VISUAL_MEMORY_MARGIN", "0.05")),
+                   patch_radius=int(os.getenv("VISUAL_MEMORY_PATCH_RADIUS", "32")))
+
+    def __len__(self):
+        return sum(len(patches) for patches in self._patches.values())
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hit_rate, "patches": len(self)}
+
+    def load(self):
+        if not self.index_path.exists():
+            return
+        with open(self.index_path, 'r') as f:
+            index = json.load(f)
+        for request, entries in index.items():
+            for entry in entries:
+                try:
+                    pixels = np.load(self.directory / f"{entry['id']}.npy")
+                except (OSError, ValueError):
+                    logger.warning("visual memory patch %s is missing", entry["id"])
+                    continue
+                self._patches.setdefault(request, []).append(
+                    Patch(entry["id"], pixels, entry["x"], entry["y"], entry["size"]))
+
+    def _save_index_locked(self):
+        temp_path = self.index_path.with_suffix(".tmp")
+        with open(temp_path, 'w') as f:
+            json.dump({request: [patch.to_json() for patch in patches]
+                       for request, patches in self._patches.items()}, f)
+        os.replace(temp_path, self.index_path)
+
+    def remember(self, request, array, x, y):
+        """Keep the patch around frame pixel (x, y) of a BGR(A) frame array"""
+        height, width = array.shape[:2]
+        radius = self.patch_radius
+        left, top = x - radius, y - radius
+        if left < 0 or top < 0 or x + radius > width or y + radius > height:
+            # Too close to the edge for a full patch
+            return None
+        pixels = np.rint(grayscale(array[top:y + radius, left:x + radius]))
+        patch = Patch(uuid.uuid4().hex, pixels.astype(np.uint8), x, y, (width, height))
+        if np.ptp(patch.pixels) < 16:
+            # A flat patch matches anywhere
+            return None
+
+        request = normalize_request(request)
+        with self._lock:
+            patches = self._patches.setdefault(request, [])
+            patches.append(patch)
+            np.save(self.directory / f"{patch.id}.npy", patch.pixels)
+            while len(patches) > self.max_per_request:
+                old = patches.pop(0)
+                try:
+                    os.remove(self.directory / f"{old.id}.npy")
+                except OSError:
+                    pass
+            self._save_index_locked()
+        return patch
+
+    def forget(self, request):
+        """Drop every patch for a request (e.g. after a wrong click)"""
+        request = normalize_request(request)
+        with self._lock:
+            for patch in self._patches.pop(request, []):
+                try:
+                    os.remove(self.directory / f"{patch.id}.npy")
+                except OSError:
+                    pass
+            self._save_index_locked()
+
+    def find(self, request, array):
+        """Match for the request in a BGR(A) frame array, or None
+
+        Counts a hit or a miss; the hit's patch moves to where it was found.
+        """
+        height, width = array.shape[:2]
+        with self._lock:
+            patches = [patch for patch in self._patches.get(normalize_request(request), [])
+                       if patch.size == (width, height)]
+        if not patches:
+            self.misses += 1
+            return None
+
+        # Near matches only need the window around the patch; the full frame is converted once
+        factor = max(1, -(-width // self.full_width))
+        coarse = None
+        for patch in reversed(patches):
+            match = self._match_near(array, patch, patch.x, patch.y, self.search_radius)
+            if match is None:
+                if coarse is None:
+                    coarse = grayscale(array, factor)
+                match = self._match_full(array, coarse, factor, patch)
+            if match is not None:
+                self.hits += 1
+                with self._lock:
+                    patch.x, patch.y = match.x, match.y
+                return match
+        self.misses += 1
+        return None
+
+    def _match_near(self, array, patch, x, y, radius):
+        """Match at full resolution within radius pixels of (x, y)"""
+        reach = radius + self.patch_radius
+        left, top = max(0, x - reach), max(0, y - reach)
+        window = array[top:y + reach, left:x + reach]
+        return self._match_in(grayscale(window), patch.pixels, left, top, self.threshold)
+
+    def _match_full(self, array, coarse, factor, patch):
+        """Match anywhere in the frame: on the coarse image, then refined around its best spots"""
+        if factor == 1:
+            return self._match_in(coarse, patch.pixels, 0, 0, self.threshold)
+
+        # Both sides are block-averaged the same way, so only sub-block offsets lower the score
+        height, width = (size // factor * factor for size in patch.pixels.shape)
+        template = patch.pixels[:height, :width].astype(np.float32).reshape(
+            height // factor, factor, width // factor, factor).mean(axis=(1, 3))
+
+        # Look-alikes are hard to tell apart at this scale, so refine every strong peak
+        matches = []
+        for x, y, _ in peaks(match_template(coarse, template), template.shape,
+                             self.threshold - self.coarse_slack, self.max_candidates):
+            match = self._match_near(array, patch, x * factor + width // 2,
+                                     y * factor + height // 2, 2 * factor)
+            if match is not None:
+                matches.append(match)
+        if not matches:
+            return None
+        best = max(matches, key=lambda match: match.score)
+        for match in matches:
+            if match is not best:
+                best.runner_up = max(best.runner_up, match.score)
+        return best if best.score - best.runner_up >= self.margin else None
+
+    def _match_in(self, gray, template, left, top, threshold):
+        """Best unambiguous match of template in gray, whose origin is frame pixel (left, top)"""
+        th, tw = template.shape
+        found = peaks(match_template(gray, template.astype(np.float32)), template.shape, -1.0, 2)
+        if not found or found[0][2] < threshold:
+            return None
+
+        # Ambiguous when something clearly separate scores nearly as well
+        x, y, score = found[0]
+        runner_up = found[1][2] if len(found) > 1 else -1.0
+        if score - runner_up < self.margin:
+            return None
+
+        # Back to frame pixels, at the template's center
+        return Match(left + x + tw // 2, top + y + th // 2, score, runner_up)
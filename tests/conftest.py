@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules in src/ import each other by bare name, as when run from there
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Qt tests need no display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip("PySide6")
+pytest.importorskip("dotenv")
+
+from PySide6.QtCore import QCoreApplication
+
+from action_pipeline import ActionPipeline
+from ai_controller import ActionResult, AIController
+from metrics import Metrics
+
+
+class FakeController:
+    """Just what ActionJob uses of AIController"""
+
+    action_result = AIController.action_result
+
+    def __init__(self):
+        self.metrics = Metrics()
+        self.last_plan = None
+        self.last_plan_calls = 0
+        self.last_cache_hit = False
+        self.last_memory_match = None
+        self.last_speculative_hit = False
+        self.last_encoding = None
+        self.last_candidates = None
+
+    def execute_action(self, request, run_stage=None, cancel=None):
+        if request == "fail":
+            raise ValueError("no such button")
+        with self.metrics.trace(request):
+            self.last_cache_hit = request == "cached"
+            self.last_candidates = [request]
+        return f"{request}-cell"
+
+
+def run(pipeline, *requests):
+    """Submit requests, wait for them and deliver their signals"""
+    for request in requests:
+        pipeline.submit(request)
+    pipeline.pool.waitForDone()
+    QCoreApplication.processEvents()
+
+
+@pytest.fixture
+def pipeline():
+    QCoreApplication.instance() or QCoreApplication([])
+    pipeline = ActionPipeline(FakeController())
+    yield pipeline
+    pipeline.shutdown()
+
+
+def test_finished_carries_a_snapshot_of_each_request(pipeline):
+    results = []
+    pipeline.signals.finished.connect(lambda request, result: results.append(result))
+    run(pipeline, "cached", "fresh")
+
+    assert [type(result) for result in results] == [ActionResult, ActionResult]
+    cached, fresh = results
+    assert (cached.value, cached.cache_hit, cached.candidates) == ("cached-cell", True, ("cached",))
+    assert (fresh.value, fresh.cache_hit, fresh.candidates) == ("fresh-cell", False, ("fresh",))
+    assert cached.trace.request == "cached" and fresh.trace.request == "fresh"
+    with pytest.raises(AttributeError):
+        cached.cache_hit = False
+
+
+def test_failure_before_tracing_sends_no_trace(pipeline):
+    failures = []
+    pipeline.signals.failed.connect(lambda *args: failures.append(args))
+    run(pipeline, "ok", "fail")
+
+    assert failures == [("fail", "no such button", None)]
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from action_plan import PlanStep, format_plan, parse_plan
+from input_actions import ActionExecutor, InputCancelled
+from session_replay import InstantSettle, ReplayKeyboard, ReplayMouse
+
+
+def test_parses_a_fenced_plan_with_text_around_it():
+    text = """Sure, here is the plan:
+```json
+[{"action": "Click", "target": "File menu", "cell": "AB02"},
+ {"action": "double-click", "target": "report", "cell": "zz99"},
+ {"action": "drag", "target": "a", "cell": "ab03", "to_target": "b", "to_cell": null},
+ {"action": "type", "text": ""},
+ {"action": "key", "keys": "ctrl+s"}]
+```"""
+    steps = parse_plan(text, 40)
+    assert [step.action for step in steps] == ["click", "double_click", "drag", "type", "key"]
+    # Invalid cells are dropped, so those targets are located on the live screen
+    assert [step.cell for step in steps] == ["ab02", None, "ab03", None, None]
+    assert parse_plan(format_plan(steps), 40)[2].to_target == "b"
+
+
+@pytest.mark.parametrize("text, message", [
+    ("I would click the File menu", "No action list"),
+    ('[{"action": "click", "target": "File"', "No action list"),
+    ('[{"action": "click", "target": "File"},]', "Malformed action list"),
+    ("[]", "Empty action list"),
+    ('["click File"]', "Malformed step"),
+    ('[{"action": "scroll", "target": "page"}]', "Unknown action"),
+    ('[{"target": "page"}]', "Unknown action"),
+    ('[{"action": "click"}]', "without a target"),
+    ('[{"action": "drag", "target": "a"}]', "without a destination"),
+    ('[{"action": "type"}]', "without text"),
+    ('[{"action": "key", "keys": ""}]', "without keys"),
+])
+def test_rejects_malformed_partial_and_unknown_steps(text, message):
+    with pytest.raises(ValueError, match=message):
+        parse_plan(text, 40)
+
+
+def executor(mouse=None, cancel=None):
+    mouse = mouse or ReplayMouse()
+    keyboard = ReplayKeyboard()
+    return ActionExecutor(mouse, keyboard, settle=InstantSettle(), drag_steps=4, cancel=cancel)
+
+
+def test_runs_pointer_and_keyboard_steps():
+    run = executor()
+    run.run_step(PlanStep("double_click", target="a"), point=(10, 20), focus=True)
+    run.run_step(PlanStep("drag", target="a", to_target="b"), point=(0, 0), to_point=(40, 80))
+    run.run_step(PlanStep("type", text="hi"))
+    run.run_step(PlanStep("key", keys="ctrl+s"))
+    assert run.mouse.events == [
+        {"type": "click", "x": 10, "y": 20, "button": "left", "count": 1},
+        {"type": "click", "x": 10, "y": 20, "button": "left", "count": 2},
+        {"type": "press", "x": 0, "y": 0, "button": "left"},
+        {"type": "release", "x": 40, "y": 80, "button": "left"},
+    ]
+    assert run.keyboard.events == [
+        {"type": "type", "text": "hi"},
+        {"type": "key_press", "key": "ctrl"},
+        {"type": "key_press", "key": "s"},
+        {"type": "key_release", "key": "s"},
+        {"type": "key_release", "key": "ctrl"},
+    ]
+
+
+def test_unknown_step_kind_is_rejected():
+    run = executor()
+    with pytest.raises(ValueError, match="Unknown action"):
+        run.run_step(PlanStep("scroll"))
+    assert run.mouse.events == [] and run.keyboard.events == []
+
+
+def test_cancelled_drag_releases_the_button():
+    cancel = threading.Event()
+
+    class CancellingMouse(ReplayMouse):
+        """Cancels the request as soon as the drag has pressed the button"""
+
+        def press(self, button):
+            super().press(button)
+            cancel.set()
+
+    run = executor(CancellingMouse(), cancel)
+    with pytest.raises(InputCancelled):
+        run.run_step(PlanStep("drag", target="a", to_target="b"), point=(0, 0), to_point=(40, 80))
+    assert [event["type"] for event in run.mouse.events] == ["press", "release"]
+
+    # Nothing more happens once cancelled
+    with pytest.raises(InputCancelled):
+        run.run_step(PlanStep("click", target="a"), point=(5, 5))
+    assert len(run.mouse.events) == 2
@@ -0,0 +1,164 @@
+import queue
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import capture_service
+from capture_service import CaptureService, CaptureSession, TileHasher, tile_changes
+
+WIDTH, HEIGHT = 96, 64  # 2 x 1 tiles of 64, the last one short
+MONITOR = {"left": 100, "top": 50, "width": WIDTH, "height": HEIGHT}
+
+
+class FakeScreen:
+    """mss stand-in: each grab returns the next shot the test queued"""
+
+    def __init__(self):
+        self.monitors = [MONITOR, MONITOR]
+        self.shots = queue.Queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def grab(self, monitor):
+        return self.shots.get(timeout=5)
+
+
+def shot(value, changes=()):
+    """Flat BGRA shot with the given ((x, y), value) pixels changed"""
+    array = np.full((HEIGHT, WIDTH, 4), value, dtype=np.uint8)
+    for (x, y), pixel in changes:
+        array[y, x] = pixel
+    return SimpleNamespace(raw=array.tobytes(), width=WIDTH, height=HEIGHT)
+
+
+@pytest.fixture
+def screen(monkeypatch):
+    screen = FakeScreen()
+    monkeypatch.setattr(capture_service, "mss", lambda: screen)
+    return screen
+
+
+@pytest.fixture
+def service(screen):
+    service = CaptureService(capacity=3, fps=1000).start()
+    yield service
+    service._stop.set()
+    screen.shots.put(shot(0))  # Unblock the last grab
+    service.stop()
+
+
+def capture(service, screen, value, changes=()):
+    screen.shots.put(shot(value, changes))
+    frame_id = service.wait_for_frame(service.latest_id, timeout=5)
+    assert frame_id is not None
+    return frame_id
+
+
+def test_ring_wraps_around(service, screen):
+    ids = [capture(service, screen, value) for value in (10, 20, 30, 40, 50)]
+    assert ids == [0, 1, 2, 3, 4]
+    # Capacity 3: frames 0 and 1 were overwritten by 3 and 4
+    assert service.frame(0) is None and service.frame(1) is None
+    for frame_id, value in [(2, 30), (3, 40), (4, 50)]:
+        frame = service.frame(frame_id)
+        assert frame.frame_id == frame_id and frame.source is service
+        assert (frame.left, frame.top, frame.size) == (100, 50, (WIDTH, HEIGHT))
+        assert (frame.array() == value).all()
+    assert service.latest().frame_id == 4
+
+
+def test_frame_that_left_the_ring_has_no_tile_map(service, screen):
+    capture(service, screen, 10)
+    old = service.frame(0)
+    capture(service, screen, 10)
+    assert tile_changes(old, service.frame(1)).sum() == 0
+
+    for _ in range(3):
+        capture(service, screen, 10)
+    # Frame 0 is gone, so callers must compare signatures instead
+    assert service.changed_between(0, 4) is None
+    assert tile_changes(old, service.latest()) is None
+    assert tile_changes(service.frame(4), service.latest()).sum() == 0
+
+
+def test_changed_tiles_are_reported(service, screen):
+    first = capture(service, screen, 10)
+    second = capture(service, screen, 10, [((70, 5), 11)])
+    assert service.changed_between(first, second).tolist() == [[False, True]]
+    assert service.changed_since(first).tolist() == [[False, True]]
+
+
+def test_frames_from_elsewhere_have_no_tile_map(service, screen):
+    capture(service, screen, 10)
+    other = CaptureService()
+    frame = service.latest()
+    assert tile_changes(frame, capture_service.Frame(frame.raw, WIDTH, HEIGHT)) is None
+    assert tile_changes(frame, capture_service.Frame(frame.raw, WIDTH, HEIGHT, frame_id=0,
+                                                     source=other)) is None
+
+
+def hashes(array):
+    return TileHasher(WIDTH, HEIGHT)(array)
+
+
+def test_hash_sees_single_bit_changes_and_moved_pixels():
+    base = np.zeros((HEIGHT, WIDTH, 4), dtype=np.uint8)
+    base[3, 3] = (1, 2, 3, 255)
+    reference = hashes(base)
+    assert reference.shape == (1, 2)
+    assert (hashes(base.copy()) == reference).all()
+
+    flipped = base.copy()
+    flipped[40, 90, 2] ^= 1  # One bit in the short last tile
+    assert (hashes(flipped) != reference).tolist() == [[False, True]]
+
+    # Same pixels, different places: a plain sum would miss these
+    moved = base.copy()
+    moved[3, 3], moved[3, 4] = moved[3, 4], base[3, 3]
+    assert (hashes(moved) != reference).tolist() == [[True, False]]
+    swapped = base.copy()
+    swapped[3, 3], swapped[4, 3] = swapped[4, 3], base[3, 3]
+    assert (hashes(swapped) != reference).tolist() == [[True, False]]
+
+
+class FakeMonitors:
+    """mss stand-in with three monitors around a primary one"""
+
+    monitors = [
+        {"left": -1920, "top": -300, "width": 5920, "height": 2560},
+        {"left": 0, "top": 0, "width": 2560, "height": 1440},
+        {"left": -1920, "top": 200, "width": 1920, "height": 1080},
+        {"left": 2560, "top": -300, "width": 1440, "height": 2560},
+    ]
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize("point, index", [
+    ((0, 0), 1), ((2559, 1439), 1), ((-1, 200), 2), ((-1920, 1279), 2),
+    ((2560, -300), 3), ((3999, 2259), 3),
+    # In the bounding box but on no monitor: the session's own
+    ((-100, 0), 1), ((100, 2000), 1),
+])
+def test_monitor_at_uses_monitor_origins(monkeypatch, point, index):
+    monkeypatch.setattr(capture_service, "mss", FakeMonitors)
+    assert CaptureSession().monitor_at(*point) == index
+
+
+@pytest.mark.parametrize("value, index, follow_mouse", [
+    (None, 1, False), ("2", 2, False), ("0", 0, False), (" Mouse ", 1, True),
+    ("bogus", 1, False), ("-1", 1, False), ("", 1, False),
+])
+def test_capture_monitor_setting(monkeypatch, value, index, follow_mouse):
+    if value is None:
+        monkeypatch.delenv("CAPTURE_MONITOR", raising=False)
+    else:
+        monkeypatch.setenv("CAPTURE_MONITOR", value)
+    session = CaptureSession.from_env()
+    assert (session.monitor_index, session.follow_mouse) == (index, follow_mouse)
@@ -0,0 +1,45 @@
+import pytest
+
+from frame import Frame
+
+
+def retina_frame(left=0, top=0):
+    # A 1440x900-point monitor captured at 2880x1800 pixels
+    return Frame(bytearray(4), 2880, 1800, left, top, scale=2.0)
+
+
+@pytest.mark.parametrize("left, top", [(0, 0), (1440, 0), (-1920, 240), (300, -900)])
+def test_hidpi_pixels_map_to_screen_points(left, top):
+    frame = retina_frame(left, top)
+    assert frame.to_screen(0, 0) == (left, top)
+    assert frame.to_screen(2880, 1800) == (left + 1440, top + 900)
+    assert frame.to_screen(1001, 333) == (left + 500, top + 166)
+    assert frame.from_screen(left + 720, top + 450) == (1440, 900)
+    # A point covers 2x2 pixels, so pixels round-trip to within one
+    for x, y in [(0, 0), (1234, 568), (1235, 567), (2879, 1799)]:
+        back = frame.from_screen(*frame.to_screen(x, y))
+        assert abs(back[0] - x) <= 1 and abs(back[1] - y) <= 1
+
+
+def test_plain_frame_only_adds_its_origin():
+    frame = Frame(bytearray(4), 1920, 1080, -1920, 200)
+    assert frame.to_screen(10, 20) == (-1910, 220)
+    assert frame.from_screen(-1910, 220) == (10, 20)
+
+
+class Shot:
+    """mss ScreenShot stand-in"""
+
+    def __init__(self, region, scale):
+        self.width = int(region["width"] * scale)
+        self.height = int(region["height"] * scale)
+        self.left, self.top = region["left"], region["top"]
+        self.raw = bytearray(self.width * self.height * 4)
+
+
+def test_from_mss_records_the_scale_of_the_grab():
+    region = {"left": 2560, "top": -300, "width": 100, "height": 50}
+    frame = Frame.from_mss(Shot(region, 2.0), region)
+    assert (frame.scale, frame.size) == (2.0, (200, 100))
+    assert frame.to_screen(200, 100) == (2660, -250)
+    assert Frame.from_mss(Shot(region, 1.0), region).scale == 1.0
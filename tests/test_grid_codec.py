@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from grid_codec import GridCodec, get_codec, label_table, parse_label
+
+
+@pytest.mark.parametrize("cols, rows", [(40, 40), (30, 12), (7, 120), (676, 3)])
+def test_encode_decode_round_trip(cols, rows):
+    table = label_table(cols, rows)
+    for col, row in [(0, 0), (cols - 1, rows - 1), (cols // 2, rows - 1), (cols - 1, 0)]:
+        label = table.encode(col, row)
+        assert len(label) == table.label_length
+        assert table.decode(label) == (col, row)
+
+
+def test_more_than_99_rows_use_three_digit_labels():
+    table = label_table(7, 120)
+    assert table.encode(0, 0) == "aa001"
+    assert table.encode(6, 119) == "ag120"
+    assert table.decode("aa01") is None
+    assert parse_label("AG120", (7, 120)) == (6, 119)
+
+
+def test_decode_many_matches_decode():
+    table = label_table(30, 120)
+    labels = table.labels.ravel()
+    cols, rows, valid = table.decode_many(labels)
+    assert valid.all()
+    assert [table.encode(col, row) for col, row in zip(cols, rows)] == list(labels)
+
+
+def test_decode_many_normalizes_and_rejects():
+    table = label_table(30, 12)
+    cols, rows, valid = table.decode_many(["ab03", " AB03 ", "Ad12\n", "ab13", "zz01", "", "ab3"])
+    assert list(valid) == [True, True, True, False, False, False, False]
+    assert list(zip(cols[:3], rows[:3])) == [(1, 2), (1, 2), (3, 11)]
+
+
+def test_labels_at_many_at_cell_edges():
+    # 100x50 cells on a non-square grid with an offset
+    codec = GridCodec(1000, 500, (10, 10), left=20, top=30)
+    xs = np.array([20, 119, 120, 1019, 1020, 19, 20])
+    ys = np.array([30, 79, 80, 529, 30, 30, 530])
+    assert list(codec.labels_at_many(xs, ys)) == ["aa01", "aa01", "ab02", "aj10", "", "", ""]
+    for x, y, label in zip(xs, ys, codec.labels_at_many(xs, ys)):
+        assert (codec.label_at(x, y) or "") == label
+
+
+def test_centers_many_matches_center():
+    codec = get_codec(1920, 1080, 40)
+    labels = ["aa01", "an40", "AB02", "ao41", "nope"]
+    xs, ys, valid = codec.centers_many(labels)
+    assert list(valid) == [True, True, True, False, False]
+    assert list(zip(xs, ys)) == [codec.center("aa01"), codec.center("an40"), codec.center("ab02"),
+                                 (-1, -1), (-1, -1)]
+    # A cell's center maps back to its label
+    assert list(codec.labels_at_many(xs[:3], ys[:3])) == ["aa01", "an40", "ab02"]
@@ -0,0 +1,77 @@
+import json
+import os
+
+from marker_store import MarkerStore
+
+
+def store(tmp_path, **kwargs):
+    kwargs.setdefault("flush_delay", 0)
+    return MarkerStore(str(tmp_path / "markers.json"), **kwargs)
+
+
+def test_journal_is_replayed_after_a_restart(tmp_path):
+    markers = store(tmp_path)
+    markers.set("aa01", 10, 20)
+    markers.set_many([("ab02", 30, 40), ("ac03", 50, 60)])
+    markers.flush()
+    markers.set("aa01", 11, 21)
+    markers.remove("ab02")
+    markers.close()
+    assert not os.path.exists(tmp_path / "markers.json")  # Only the journal so far
+
+    reloaded = store(tmp_path)
+    assert dict(reloaded.items()) == {"aa01": (11, 21), "ac03": (50, 60)}
+
+    # A torn last line from a crash is skipped
+    with open(tmp_path / "markers.json.journal", "a") as f:
+        f.write('{"op": "set", "label": "ad0')
+    assert dict(store(tmp_path).items()) == {"aa01": (11, 21), "ac03": (50, 60)}
+
+
+def test_compaction_writes_the_old_markers_format(tmp_path):
+    # The sixth journal entry triggers compaction
+    markers = store(tmp_path, compact_after=6)
+    for i in range(4):
+        markers.set(f"aa0{i + 1}", i, i * 2)
+    markers.clear()
+    markers.set("ab01", 7, 8)
+    markers.close()
+
+    assert not os.path.exists(tmp_path / "markers.json.journal")
+    with open(tmp_path / "markers.json") as f:
+        assert json.load(f) == {"ab01": [7, 8]}
+    assert store(tmp_path).items() == [("ab01", (7, 8))]
+
+
+def test_scratch_store_never_touches_disk(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    markers = MarkerStore(None, flush_delay=0, compact_after=1)
+    markers.set("aa01", 1, 2)
+    markers.set_many([("ab02", 3, 4)])
+    markers.remove("aa01")
+    markers.flush()
+    markers.compact()
+    markers.clear()
+    markers.close()
+    assert os.listdir(tmp_path) == []
+    assert len(MarkerStore(None)) == 0
+
+
+def test_spatial_queries_across_bucket_boundaries(tmp_path):
+    markers = store(tmp_path, bucket_size=64)
+    markers.set_many([("left", 63, 10), ("right", 64, 10), ("far", 1000, 1000),
+                      ("below", 63, 128)])
+
+    # (66, 10) is in the right bucket but "left" is 3 px away in the previous one
+    assert markers.nearest(66, 10) == ("right", 2.0)
+    assert markers.nearest(61, 10) == ("left", 2.0)
+    assert markers.hit_test(63, 135) == "below"
+    assert markers.hit_test(63, 139, radius=10) is None
+    assert markers.nearest(900, 900)[0] == "far"
+    assert markers.nearest(900, 900, max_distance=100) is None
+
+    assert sorted(label for label, _ in markers.in_rect(63, 0, 65, 129)) == [
+        "below", "left", "right"]
+    assert markers.in_rect(0, 0, 63, 128) == []
+    assert sorted(markers.in_rect(64, 0, 1001, 1001)) == [("far", (1000, 1000)),
+                                                          ("right", (64, 10))]
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from model_backend import FakeBackend, ModelRequester, ModelTimeout
+
+
+def requester(*backends, **kwargs):
+    kwargs.setdefault("backoff", 0.0)
+    return ModelRequester(backends, **kwargs)
+
+
+def test_deadline_raises_model_timeout():
+    model = requester(FakeBackend(latency=1.0), deadline=0.1, hedge_percentile=0)
+    try:
+        with pytest.raises(ModelTimeout):
+            model.request("prompt")
+    finally:
+        model.close()
+
+
+def test_invalid_answer_is_retried():
+    backend = FakeBackend(answer=lambda call: "bad" if call == 0 else "ab02")
+
+    def validate(text):
+        if text == "bad":
+            raise ValueError(text)
+        return text
+
+    model = requester(backend, hedge_percentile=0)
+    try:
+        assert model.request("prompt", validate=validate) == "ab02"
+        assert model.requeries == 1
+        assert model.stats[0].invalid == 1
+    finally:
+        model.close()
+
+
+def test_hedge_won_by_second_backend():
+    slow = FakeBackend(answer="slow", latency=lambda call: 0.01 if call == 0 else 1.0)
+    fast = FakeBackend(answer="fast", latency=0.01)
+    model = requester(slow, fast, hedge_min_delay=0.05)
+    try:
+        # Give the first backend a latency history so hedging has a delay
+        assert model.request("prompt") == "slow"
+        assert model.request("prompt") == "fast"
+        assert model.stats[0].hedges == 0
+        assert model.stats[1].hedges == 1
+        assert model.stats[1].hedge_wins == 1
+    finally:
+        model.close()
+
+
+def test_backends_with_the_same_name_keep_separate_stats():
+    model = requester(FakeBackend(name="m"), FakeBackend(name="m"), hedge_percentile=0)
+    try:
+        model.request("prompt")
+        assert list(model.summary()) == ["m#1", "m#2"]
+        assert model.summary()["m#1"]["requests"] == 1
+        assert model.summary()["m#2"]["requests"] == 0
+    finally:
+        model.close()
+
+
+def test_only_the_deciding_call_of_an_attempt_is_used():
+    slow = FakeBackend(answer="slow", latency=lambda call: 0.01 if call == 0 else 0.3)
+    fast = FakeBackend(answer="fast", latency=0.01)
+    model = requester(slow, fast, hedge_min_delay=0.05)
+    calls = []
+    model.listeners.append(calls.append)
+    try:
+        model.request("prompt")
+        calls.clear()
+        assert model.request("prompt") == "fast"
+        time.sleep(0.4)  # Let the losing call finish and be reported
+        assert [(call.backend, call.hedge, call.text, call.used) for call in calls] == [
+            ("fake#2", True, "fast", True), ("fake#1", False, "slow", False)]
+    finally:
+        model.close()
@@ -0,0 +1,53 @@
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip("PySide6")
+pytest.importorskip("dotenv")
+
+from ai_controller import AIController
+from coordinate_prompt import AnswerStats, Candidate
+from grid_codec import get_codec
+
+
+def controller(array):
+    """Just what pick_candidate uses of AIController, over a frame array"""
+    height, width = array.shape[:2]
+    frame = types.SimpleNamespace(width=width, height=height, array=lambda: array)
+    return types.SimpleNamespace(last_frame=frame, last_candidates=None, grid_size=40,
+                                 answers=AnswerStats())
+
+
+def pick(fake, *candidates, region=None):
+    return AIController.pick_candidate(fake, [Candidate(cell, confidence)
+                                              for cell, confidence in candidates], region=region)
+
+
+@pytest.fixture
+def screen():
+    """A flat 4K screen with detail only in the cell labelled "ab03" """
+    array = np.full((2160, 3840, 3), 200, dtype=np.uint8)
+    x, y, width, height = get_codec(3840, 2160, 40).cell_rect("ab03")
+    array[y:y + height // 2, x:x + width] = 0
+    return array
+
+
+def test_flat_best_cell_is_kept_when_clearly_preferred(screen):
+    fake = controller(screen)
+    assert pick(fake, ("ab02", 0.9), ("ab03", 0.4)) == "ab02"
+    assert fake.answers.fallbacks == 0
+
+
+def test_flat_best_cell_loses_a_close_call(screen):
+    fake = controller(screen)
+    assert pick(fake, ("ab02", 0.5), ("ab03", 0.45)) == "ab03"
+    assert fake.answers.overrides == {"off_grid": 0, "blank": 1}
+
+
+def test_off_grid_best_cell_is_passed_over(screen):
+    # A zoomed region hanging off the right edge of the frame
+    fake = controller(screen)
+    last = str(get_codec(3840, 2160, 40).labels[0, -1])
+    assert pick(fake, (last, 0.9), ("ab02", 0.1), region=(2000, 0, 3840, 2160)) == "ab02"
+    assert fake.answers.overrides == {"off_grid": 1, "blank": 0}
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from response_cache import ResponseCache, frame_signature, normalize_request, signatures_match
+
+
+@pytest.fixture
+def screen():
+    """A 1920x1080 BGRA screen with some scattered widgets"""
+    rng = np.random.default_rng(0)
+    array = np.full((1080, 1920, 4), 240, dtype=np.uint8)
+    for _ in range(30):
+        x, y = rng.integers(0, 1800), rng.integers(0, 1000)
+        array[y:y + 40, x:x + 100, :3] = rng.integers(0, 255, 3)
+    return array
+
+
+def covered(array, x, y, width, height, value=60):
+    changed = array.copy()
+    changed[y:y + height, x:x + width, :3] = value
+    return changed
+
+
+def test_clock_sized_change_still_matches(screen):
+    signature = frame_signature(screen)
+    assert signatures_match(signature, frame_signature(covered(screen, 1850, 1050, 60, 20)))
+
+
+@pytest.mark.parametrize("width, height", [(160, 28), (200, 100), (240, 120)])
+def test_tooltip_or_dialog_sized_change_misses(screen, width, height):
+    cache = ResponseCache()
+    cache.put("Click OK", frame_signature(screen), (1920, 1080), "ab02")
+    changed = frame_signature(covered(screen, 900, 500, width, height))
+    assert cache.get("click ok", changed, (1920, 1080)) is None
+    assert cache.get("click ok", frame_signature(screen), (1920, 1080)) == "ab02"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_other_size_or_request_misses(screen):
+    cache = ResponseCache()
+    signature = frame_signature(screen)
+    cache.put("click ok", signature, (1920, 1080), "ab02")
+    assert cache.get("click ok", signature, (3840, 2160)) is None
+    assert cache.get("click cancel", signature, (1920, 1080)) is None
+    assert normalize_request("  Click   OK! ") == "click ok"
+
+
+def test_newer_answer_replaces_an_equivalent_screen(screen):
+    cache = ResponseCache()
+    signature = frame_signature(screen)
+    cache.put("click ok", signature, (1920, 1080), "ab02")
+    cache.put("click ok", signature, (1920, 1080), "ac03")
+    assert len(cache) == 1
+    assert cache.get("click ok", signature, (1920, 1080)) == "ac03"
+
+
+def test_persists_as_json_and_drops_invalidated_answers(tmp_path, screen):
+    path = str(tmp_path / "cache.json")
+    cache = ResponseCache(max_entries=2, path=path)
+    signatures = [frame_signature(covered(screen, 0, 0, 600, 600, value)) for value in (0, 90, 180)]
+    for i, signature in enumerate(signatures):
+        cache.put(f"request {i}", signature, (1920, 1080), f"aa0{i + 1}")
+
+    reloaded = ResponseCache(max_entries=2, path=path)
+    assert len(reloaded) == 2  # The oldest answer was evicted
+    assert reloaded.get("request 0", signatures[0], (1920, 1080)) is None
+    assert reloaded.get("request 2", signatures[2], (1920, 1080)) == "aa03"
+
+    reloaded.invalidate("request 2")
+    assert ResponseCache(path=path).get("request 2", signatures[2], (1920, 1080)) is None
+    assert ResponseCache(path=path).get("request 1", signatures[1], (1920, 1080)) == "aa02"
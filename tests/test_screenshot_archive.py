@@ -0,0 +1,23 @@
+import numpy as np
+from PIL import Image
+
+from grid_render import GridRenderer
+from screenshot_archive import ScreenshotArchive, render_annotated
+
+
+def test_raw_captures_are_gridded_when_viewed(tmp_path):
+    rng = np.random.default_rng(3)
+    raw = Image.fromarray(rng.integers(0, 256, (120, 200, 3), dtype=np.uint8), "RGB")
+    gridded = Image.fromarray(GridRenderer(20).render(np.asarray(raw), bgr=False), "RGB")
+    annotation = {"request": "OK button", "coordinate": "ab03", "grid_size": 20,
+                  "box": [10, 12, 20, 18]}
+
+    archive = ScreenshotArchive(tmp_path)
+    archive.submit(gridded, dict(annotation, gridded=True))
+    archive.submit(raw, dict(annotation, gridded=False))
+    archive.close()
+
+    first, second = sorted(tmp_path.glob("screenshot_*.json"))
+    assert len(list(tmp_path.glob("original_*"))) == 2
+    assert np.array_equal(np.asarray(render_annotated(first)),
+                          np.asarray(render_annotated(second)))
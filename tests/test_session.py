@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from frame import Frame
+from session_record import SessionReader, SessionRecorder
+from session_replay import split_requests
+
+
+def screen(width, height, seed):
+    """A BGRA Frame with a few rectangles whose placement depends on seed"""
+    rng = np.random.default_rng(seed)
+    array = np.full((height, width, 4), 230, dtype=np.uint8)
+    for _ in range(4):
+        x, y = rng.integers(0, width - 40), rng.integers(0, height - 20)
+        array[y:y + 20, x:x + 40, :3] = rng.integers(0, 255, 3)
+    return Frame(bytearray(array.tobytes()), width, height, left=100, top=50, scale=2.0)
+
+
+def test_frames_round_trip_through_keyframes_and_deltas(tmp_path):
+    frames = [screen(64, 48, seed) for seed in range(7)] + [screen(80, 40, 7), screen(80, 40, 8)]
+    recorder = SessionRecorder(tmp_path, keyframe_interval=3)
+    for frame in frames:
+        recorder.frame(frame)
+    recorder.close()
+
+    reader = SessionReader(tmp_path)
+    try:
+        assert len(reader) == len(frames)
+        # Every third frame, and the first one of a new size, is stored whole
+        assert list(reader.index["keyframe"]) == [1, 0, 0, 1, 0, 0, 1, 1, 0]
+        # Out of order too, so frames are decoded from a keyframe as well as from the cache
+        for i in (5, 1, 2, 8, 0, 4, 7, 3, 6):
+            frame = reader.frame(i)
+            assert bytes(frame.raw) == bytes(frames[i].raw)
+            assert (frame.width, frame.height, frame.left, frame.top, frame.scale) == (
+                frames[i].width, frames[i].height, 100, 50, 2.0)
+    finally:
+        reader.close()
+
+
+def test_split_requests_groups_events_by_request():
+    events = [
+        {"type": "frame", "index": 0},  # Before any request
+        {"type": "request", "request": "open", "plan": False, "index": 0},
+        {"type": "frame", "index": 1},
+        {"type": "model", "request_index": 0, "attempt": 0, "used": True, "prompt": "a"},
+        {"type": "click", "t": 1.0, "x": 5, "y": 6, "button": "left", "count": 1},
+        {"type": "result", "request": "open", "result": "ab02"},
+        {"type": "request", "request": "save", "plan": True, "index": 1},
+        # A call of the first request that was abandoned and finished late
+        {"type": "model", "request_index": 0, "attempt": 0, "used": False, "prompt": "a"},
+        {"type": "frame", "index": 2},
+        {"type": "type", "t": 2.0, "text": "x"},
+    ]
+    (first, frames, inputs, calls, result), (second, frames2, inputs2, calls2, result2) = \
+        split_requests(events)
+    assert (first["request"], frames, result["result"]) == ("open", [1], "ab02")
+    assert inputs == [{"type": "click", "x": 5, "y": 6, "button": "left", "count": 1}]
+    assert [call["used"] for call in calls] == [True, False]
+    assert (second["request"], frames2, inputs2, calls2, result2) == (
+        "save", [2], [{"type": "type", "text": "x"}], [], None)
+
+
+class FixedCapture:
+    """CaptureSession stand-in serving whatever frame the test sets"""
+
+    monitor_index = 1
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    @property
+    def monitor(self):
+        return {"left": 0, "top": 0, "width": self.frame.width, "height": self.frame.height}
+
+    def grab(self, monitor_index=None):
+        return self.frame
+
+    def close(self):
+        pass
+
+
+def test_recorded_session_replays_without_divergence(tmp_path, monkeypatch):
+    pytest.importorskip("PySide6")
+    pytest.importorskip("dotenv")
+    from ai_controller import AIController
+    from model_backend import FakeBackend
+    from session_replay import REPLAY_ENV, InstantSettle, ReplayKeyboard, ReplayMouse, replay
+
+    # Recording and replay both run without persistent caches; replay() sets REPLAY_ENV
+    for name, value in REPLAY_ENV.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setenv("SESSION_RECORD", "1")
+    monkeypatch.setenv("SESSION_RECORD_PATH", str(tmp_path / "sessions"))
+    monkeypatch.setenv("ZOOM_MODE", "0")
+
+    answers = ['{"candidates":[{"cell":"ab02","confidence":0.9}]}', '"AC05"', "ad07"]
+    capture = FixedCapture(screen(640, 360, 0))
+    controller = AIController(show_window=False, screenshots_dir=tmp_path / "shots",
+                              backends=[FakeBackend(lambda call: answers[call])],
+                              capture=capture, mouse=ReplayMouse(), keyboard=ReplayKeyboard(),
+                              settle=InstantSettle())
+    recorded = []
+    try:
+        recorded.append(controller.execute_action("press ok"))
+        capture.frame = screen(640, 360, 1)
+        recorded.append(controller.execute_action("press ok"))
+        capture.frame = screen(640, 360, 2)
+        recorded.append(controller.execute_action("open settings"))
+    finally:
+        controller.shutdown()
+    assert recorded == ["ab02", "ac05", "ad07"]
+
+    results = replay(controller.recorder.directory)
+    assert [(result["replayed"], result["error"], result["input_matches"])
+            for result in results] == [(cell, None, True) for cell in recorded]
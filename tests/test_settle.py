@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+import settle
+from settle import SettleDetector
+
+
+class FakeClock:
+    """Stand-in for the time module: sleeping only advances the clock"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(settle, "time", clock)
+    return clock
+
+
+def detector(levels, **options):
+    """Detector whose grabs return flat patches of the given brightness levels in turn"""
+    settle_detector = SettleDetector(**options)
+    frames = iter(levels)
+    grabs = []
+
+    def grab_around(x, y):
+        grabs.append((x, y))
+        level = next(frames, levels[-1])
+        return np.full((4, 4, 4), level, dtype=np.uint8)
+
+    settle_detector.grab_around = grab_around
+    return settle_detector, grabs
+
+
+def test_ends_after_the_stable_count(clock):
+    # 0 -> 50 -> 100 move, then three unchanged polls; two are needed
+    run, grabs = detector([0, 50, 100, 100, 100, 100], min_wait=0.05, max_wait=10,
+                          stable_polls=2, poll_interval=0.1)
+    waited = run.wait(10, 20)
+    assert len(grabs) == 5
+    assert set(grabs) == {(10, 20)}
+    assert waited == pytest.approx(0.05 + 4 * 0.1)
+
+
+def test_a_change_resets_the_stable_count(clock):
+    run, grabs = detector([0, 0, 60, 60, 60], min_wait=0, max_wait=10,
+                          stable_polls=2, poll_interval=0.1)
+    run.wait(0, 0)
+    # One stable poll, a change, then two stable polls again
+    assert len(grabs) == 5
+
+
+def test_small_differences_count_as_stable(clock):
+    run, grabs = detector([0, 2, 4], min_wait=0, max_wait=10, stable_polls=2,
+                          threshold=2.0, poll_interval=0.1)
+    run.wait(0, 0)
+    assert len(grabs) == 3
+
+
+def test_never_ends_before_the_minimum_wait(clock):
+    run, _ = detector([7], min_wait=0.3, max_wait=10, stable_polls=1, poll_interval=0.01)
+    waited = run.wait(0, 0)
+    assert clock.sleeps[0] == 0.3
+    assert waited == pytest.approx(0.31)
+
+
+def test_gives_up_at_the_maximum_wait(clock):
+    # A screen that never stops changing
+    run, grabs = detector(list(range(0, 250, 10)), min_wait=0.05, max_wait=0.5,
+                          stable_polls=2, poll_interval=0.1)
+    waited = run.wait(0, 0)
+    assert waited == pytest.approx(0.55)
+    assert len(grabs) == 6
+
+
+def test_max_wait_can_be_overridden_per_call(clock):
+    run, grabs = detector(list(range(0, 250, 10)), min_wait=0, max_wait=10,
+                          stable_polls=2, poll_interval=0.1)
+    waited = run.wait(0, 0, max_wait=0.3)
+    assert waited == pytest.approx(0.3)
+    assert len(grabs) == 4
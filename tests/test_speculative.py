@@ -0,0 +1,110 @@
+import threading
+import time
+
+import numpy as np
+
+from frame import Frame
+from speculative import PreparedFrame, Speculator
+
+SIZE = (64, 32)
+
+
+class TileSource:
+    """CaptureService stand-in: changed_between returns the map the test sets"""
+
+    def __init__(self):
+        self.changed = np.zeros((2, 4), dtype=bool)
+
+    def changed_between(self, old_id, new_id):
+        return self.changed
+
+
+def frame(source=None, frame_id=None):
+    return Frame(bytearray(SIZE[0] * SIZE[1] * 4), *SIZE, frame_id=frame_id, source=source)
+
+
+def signature(value=100):
+    return np.full((18, 32), value, dtype=np.uint8)
+
+
+def prepared(source=None, value=100, grid_size=40):
+    return PreparedFrame(frame(source, frame_id=1), signature(value), grid_size, None, None)
+
+
+def speculator(prepare, **kwargs):
+    kwargs.setdefault("debounce", 0.01)
+    return Speculator(prepare, **kwargs)
+
+
+def test_reuses_preparation_of_the_same_screen():
+    work = prepared()
+    spec = speculator(lambda: work)
+    spec.schedule()
+    assert spec.wait(1.0)
+    assert spec.take(signature(102), SIZE, 40) is work
+    assert (spec.hits, spec.misses) == (1, 0)
+
+
+def test_changed_screen_size_or_grid_is_not_reused():
+    for args in [(signature(200), SIZE, 40), (signature(), (128, 64), 40), (signature(), SIZE, 20)]:
+        spec = speculator(prepared)
+        spec.schedule()
+        spec.wait(1.0)
+        assert spec.take(*args) is None
+        # Stale work is dropped, not offered to the next request
+        assert spec.take(signature(), SIZE, 40) is None
+        assert (spec.hits, spec.misses) == (0, 2)
+
+
+def test_tile_hashes_decide_when_both_frames_come_from_one_service():
+    source = TileSource()
+    spec = speculator(lambda: prepared(source), tolerance=0.1)
+    fresh = frame(source, frame_id=2)
+
+    # Signatures differ, but no tile hash changed
+    spec.schedule()
+    spec.wait(1.0)
+    assert spec.take(signature(200), SIZE, 40, frame=fresh) is not None
+
+    # Signatures match, but one of eight tiles changed
+    source.changed[0, 0] = True
+    spec.schedule()
+    spec.wait(1.0)
+    assert spec.take(signature(), SIZE, 40, frame=fresh) is None
+
+    # A frame from elsewhere falls back to signatures
+    spec.schedule()
+    spec.wait(1.0)
+    assert spec.take(signature(), SIZE, 40, frame=frame()) is not None
+
+    # So does a frame that has left the service's ring
+    source.changed = None
+    spec.schedule()
+    spec.wait(1.0)
+    assert spec.take(signature(), SIZE, 40, frame=fresh) is not None
+    spec.schedule()
+    spec.wait(1.0)
+    assert spec.take(signature(200), SIZE, 40, frame=fresh) is None
+
+
+def test_take_waits_for_a_running_preparation():
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.3)
+        return prepared()
+
+    spec = speculator(slow)
+    spec.schedule()
+    assert started.wait(1.0)
+    assert spec.take(signature(), SIZE, 40, timeout=2.0) is not None
+
+
+def test_take_cancels_a_pending_preparation():
+    calls = []
+    spec = speculator(lambda: calls.append(1) or prepared(), debounce=0.2)
+    spec.schedule()
+    assert spec.take(signature(), SIZE, 40) is None
+    time.sleep(0.3)
+    assert calls == []
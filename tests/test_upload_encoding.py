@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from upload_encoding import EncodingConfig, encode_image
+
+
+@pytest.fixture(scope="module")
+def screenshot():
+    """A 1920x1080 image with enough detail that it does not compress away"""
+    rng = np.random.default_rng(0)
+    blocks = rng.integers(0, 255, (135, 240, 3), dtype=np.uint8)
+    noise = rng.integers(0, 40, (1080, 1920, 3), dtype=np.uint8)
+    return Image.fromarray(np.kron(blocks, np.ones((8, 8, 1), dtype=np.uint8)) + noise)
+
+
+def full_size(screenshot, format, quality=85):
+    return encode_image(screenshot, EncodingConfig(format, quality=quality)).size
+
+
+def test_quality_is_lowered_before_the_image_shrinks(screenshot):
+    budget = (full_size(screenshot, "jpeg", 60) + full_size(screenshot, "jpeg", 85)) // 2
+    encoded = encode_image(screenshot, EncodingConfig("jpeg", max_bytes=budget))
+    assert encoded.size <= budget
+    assert (encoded.width, encoded.height) == (1920, 1080)
+    assert 40 <= encoded.quality < 85
+
+
+def test_image_shrinks_once_quality_is_at_its_floor(screenshot):
+    budget = full_size(screenshot, "jpeg", 40) * 3 // 4
+    encoded = encode_image(screenshot, EncodingConfig("jpeg", max_bytes=budget))
+    assert encoded.size <= budget
+    assert encoded.quality == 40
+    assert 1200 <= encoded.width < 1920
+    assert encoded.source_size == (1920, 1080)
+
+
+def test_png_budget_is_met_by_scaling(screenshot):
+    budget = full_size(screenshot, "png") * 3 // 4
+    encoded = encode_image(screenshot, EncodingConfig("png", max_bytes=budget))
+    assert encoded.size <= budget
+    assert encoded.quality is None
+    assert encoded.mime_type == "image/png"
+    assert 1200 <= encoded.width < 1920
+
+
+def test_labels_stay_legible_when_the_budget_cannot_be_met(screenshot):
+    # 16 px labels may shrink to 10 px: the image never goes below 62.5% of its width
+    config = EncodingConfig("jpeg", max_bytes=1000, label_height=16, min_label_height=10)
+    encoded = encode_image(screenshot, config)
+    assert encoded.size > 1000
+    assert encoded.width >= 1920 * 10 / 16
+    assert encoded.width * 0.85 < 1920 * 10 / 16  # One more step would have gone too far
+
+
+def test_edge_and_pixel_budgets_respect_the_label_floor(screenshot):
+    assert encode_image(screenshot, EncodingConfig("png", max_long_edge=1280)).width == 1280
+    encoded = encode_image(screenshot, EncodingConfig("png", max_long_edge=640))
+    assert encoded.width == 1200  # Not 640: labels would be 5 px tall
+    encoded = encode_image(screenshot, EncodingConfig("png", max_pixels=1920 * 1080 // 4,
+                                                      min_label_height=8))
+    assert (encoded.width, encoded.height) == (960, 540)
@@ -0,0 +1,89 @@
+import json
+
+import numpy as np
+import pytest
+
+from visual_memory import VisualMemory
+
+PATCH = 64  # Side of the remembered patch at the default patch_radius
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture
+def button(rng):
+    """A textured 64x64 BGR block, standing in for a distinctive button"""
+    return rng.integers(0, 255, (PATCH, PATCH, 3), dtype=np.uint8)
+
+
+def screen(rng, *placements, width=1920, height=1080):
+    """A faintly textured BGRA screen with (block, x, y) pasted at each top-left (x, y)"""
+    array = rng.integers(100, 140, (height, width, 4), dtype=np.uint8)
+    for block, x, y in placements:
+        array[y:y + PATCH, x:x + PATCH, :3] = block
+    return array
+
+
+def remembered(tmp_path, rng, button, **kwargs):
+    memory = VisualMemory(tmp_path / "memory", **kwargs)
+    assert memory.remember("Click Save", screen(rng, (button, 400, 300)), 432, 332) is not None
+    return memory
+
+
+@pytest.mark.parametrize("x, y", [(400, 300), (520, 380), (1500, 900)])
+def test_finds_the_patch_where_it_moved(tmp_path, rng, button, x, y):
+    memory = remembered(tmp_path, rng, button)
+    match = memory.find("click save", screen(rng, (button, x, y)))
+    assert (match.x, match.y) == (x + 32, y + 32)
+    assert match.score > 0.99
+    assert memory.stats()["hits"] == 1
+
+
+@pytest.mark.parametrize("first, second", [
+    ((400, 300), (520, 380)),  # Both near where it was found last
+    ((1200, 700), (1500, 900)),  # Both only found by the whole-frame pass
+])
+def test_rejects_look_alikes(tmp_path, rng, button, first, second):
+    memory = remembered(tmp_path, rng, button)
+    assert memory.find("click save", screen(rng, (button, *first), (button, *second))) is None
+    assert memory.stats()["misses"] == 1
+
+
+def test_score_threshold(tmp_path, rng, button):
+    # The same button under heavy noise correlates at about 0.85
+    noise = rng.normal(0, 45, button.shape)
+    noisy = np.clip(button + noise, 0, 255).astype(np.uint8)
+    frame = screen(rng, (noisy, 400, 300))
+
+    assert remembered(tmp_path / "strict", rng, button).find("click save", frame) is None
+    match = remembered(tmp_path / "loose", rng, button, threshold=0.75).find("click save", frame)
+    assert 0.75 <= match.score < 0.9
+
+
+def test_other_requests_and_sizes_miss(tmp_path, rng, button):
+    memory = remembered(tmp_path, rng, button)
+    assert memory.find("click cancel", screen(rng, (button, 400, 300))) is None
+    assert memory.find("click save", screen(rng, (button, 400, 300), width=1280)) is None
+
+
+def test_index_persists_and_keeps_four_patches_per_request(tmp_path, rng, button):
+    memory = VisualMemory(tmp_path / "memory")
+    for i in range(6):
+        memory.remember("click save", screen(rng, (button, 400 + i * 100, 300)), 432 + i * 100, 332)
+    assert len(memory) == 4
+    assert len(list((tmp_path / "memory").glob("*.npy"))) == 4
+    with open(tmp_path / "memory" / "index.json") as f:
+        index = json.load(f)
+    assert [entry["x"] for entry in index["click save"]] == [632, 732, 832, 932]
+
+    reloaded = VisualMemory(tmp_path / "memory")
+    assert len(reloaded) == 4
+    match = reloaded.find("click save", screen(rng, (button, 900, 300)))
+    assert (match.x, match.y) == (932, 332)
+
+    reloaded.forget("click save")
+    assert len(VisualMemory(tmp_path / "memory")) == 0
+    assert list((tmp_path / "memory").glob("*.npy")) == []